@@ -4,6 +4,13 @@ API Gateway и модули для микросервисной архитект
 
 from src.api.gateway import APIGateway
 from src.api.routes import init_routes
+from src.api.resilience import (
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    RetryPolicy,
+    RetryBudget,
+    Bulkhead
+)
 from src.api.middleware import (
     rate_limit,
     authenticate,
@@ -24,6 +31,11 @@ from src.api.adapters.shipping_adapter import (
 __all__ = [
     'APIGateway',
     'init_routes',
+    'CircuitBreaker',
+    'CircuitBreakerRegistry',
+    'RetryPolicy',
+    'RetryBudget',
+    'Bulkhead',
     'rate_limit',
     'authenticate',
     'log_request',
@@ -1,11 +1,22 @@
 from src.api.adapters.payment_adapter import (
     LegacyPaymentSystem,
     NewPaymentSystem,
-    PaymentAdapter
+    PaymentAdapter,
+    payment_providers
 )
+from src.api.adapters.payment_executor import PaymentExecutor
+from src.api.adapters.registry import ProviderRegistry
+from src.api.adapters.shipping_adapter import ShippingAdapter, shipping_providers
+from src.api.adapters.shipping_quotes import ShippingQuoteEngine
 
 __all__ = [
     'LegacyPaymentSystem',
     'NewPaymentSystem',
-    'PaymentAdapter'
+    'PaymentAdapter',
+    'PaymentExecutor',
+    'ProviderRegistry',
+    'payment_providers',
+    'ShippingAdapter',
+    'shipping_providers',
+    'ShippingQuoteEngine'
 ]
\ No newline at end of file
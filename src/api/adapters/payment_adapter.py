@@ -1,9 +1,14 @@
 """
-Adapter Pattern для интеграции различных платежных систем
+Adapter Pattern для интеграции различных платежных систем.
+Вызовы провайдеров - корутины; синхронные методы выполняют их через
+PaymentExecutor, поэтому ожидание провайдера не занимает поток запроса.
 """
 
+import asyncio
 import time
 from abc import ABC, abstractmethod
+from src.api.adapters.payment_executor import get_payment_executor
+from src.api.adapters.registry import ProviderRegistry
 
 class PaymentSystem(ABC):
     """Абстрактный класс платежной системы"""
@@ -15,13 +20,28 @@ class PaymentSystem(ABC):
     @abstractmethod
     def refund(self, transaction_id, amount):
         pass
+    
+    async def process_async(self, amount, details):
+        """Асинхронный платеж; по умолчанию - синхронный метод в отдельном потоке"""
+        return await asyncio.to_thread(self.process, amount, details)
+    
+    async def refund_async(self, transaction_id, amount):
+        """Асинхронный возврат; по умолчанию - синхронный метод в отдельном потоке"""
+        return await asyncio.to_thread(self.refund, transaction_id, amount)
 
 class LegacyPaymentSystem:
     """Старая платежная система (несовместимый интерфейс)"""
     
+    def __init__(self, latency=0.5):
+        # Время ответа системы (имитация сетевого вызова)
+        self.latency = latency
+    
     def make_payment(self, customer_id, invoice_number, amount):
+        return get_payment_executor().run(self.make_payment_async(customer_id, invoice_number, amount))
+    
+    async def make_payment_async(self, customer_id, invoice_number, amount):
         print(f"[Legacy] Processing payment for customer {customer_id}, invoice {invoice_number}")
-        time.sleep(0.5)  # Имитация обработки
+        await asyncio.sleep(self.latency)  # Имитация обработки
         
         return {
             'success': True,
@@ -40,9 +60,19 @@ class LegacyPaymentSystem:
 class NewPaymentSystem(PaymentSystem):
     """Новая платежная система (современный интерфейс)"""
     
+    def __init__(self, latency=0.3):
+        # Время ответа системы (имитация сетевого вызова)
+        self.latency = latency
+    
     def process(self, amount, details):
+        return get_payment_executor().run(self.process_async(amount, details))
+    
+    def refund(self, transaction_id, amount):
+        return get_payment_executor().run(self.refund_async(transaction_id, amount))
+    
+    async def process_async(self, amount, details):
         print(f"[New] Processing payment of {amount} with details: {details}")
-        time.sleep(0.3)  # Имитация обработки
+        await asyncio.sleep(self.latency)  # Имитация обработки
         
         return {
             'success': True,
@@ -53,7 +83,7 @@ class NewPaymentSystem(PaymentSystem):
             'timestamp': time.time()
         }
     
-    def refund(self, transaction_id, amount):
+    async def refund_async(self, transaction_id, amount):
         print(f"[New] Processing refund for {transaction_id}")
         return {
             'success': True,
@@ -61,6 +91,41 @@ class NewPaymentSystem(PaymentSystem):
             'amount': amount,
             'status': 'refunded'
         }
+    
+    # Пакетный API провайдера: до max_batch_size операций за один вызов
+    max_batch_size = 50
+    
+    async def process_batch_async(self, payments):
+        """Пакет платежей [(amount, details), ...] одним запросом"""
+        print(f"[New] Processing batch of {len(payments)} payments")
+        await asyncio.sleep(self.latency)
+        
+        timestamp = time.time()
+        return [
+            {
+                'success': True,
+                'payment_id': f'PAY-{int(timestamp)}-{index}',
+                'amount': amount,
+                'currency': details.get('currency', 'USD'),
+                'status': 'success',
+                'timestamp': timestamp
+            }
+            for index, (amount, details) in enumerate(payments)
+        ]
+    
+    async def refund_batch_async(self, refunds):
+        """Пакет возвратов [(transaction_id, amount), ...] одним запросом"""
+        print(f"[New] Processing batch of {len(refunds)} refunds")
+        await asyncio.sleep(self.latency)
+        return [
+            {
+                'success': True,
+                'refund_id': f'REF-{transaction_id}',
+                'amount': amount,
+                'status': 'refunded'
+            }
+            for transaction_id, amount in refunds
+        ]
 
 class PayPalSystem:
     """Система PayPal с собственным интерфейсом"""
@@ -74,127 +139,265 @@ class PayPalSystem:
             'description': description
         }
 
+payment_providers = ProviderRegistry('payment system')
+
+@payment_providers.register(PaymentSystem)
+class PaymentBinding:
+    """
+    Привязка платежной системы к интерфейсу PaymentAdapter.
+    По умолчанию - для систем с интерфейсом PaymentSystem; системы с
+    собственным интерфейсом регистрируют подкласс в payment_providers.
+    """
+    
+    features = ('payments', 'refunds')
+    limitations = ()
+    supported_currencies = ('USD', 'EUR')
+    
+    def __init__(self, system):
+        self.system = system
+    
+    async def process(self, amount, details):
+        return await self.system.process_async(amount, details)
+    
+    async def refund(self, transaction_id, amount):
+        return await self.system.refund_async(transaction_id, amount)
+    
+    def info(self):
+        info = {
+            'system': type(self.system).__name__,
+            'supported_currencies': list(self.supported_currencies),
+            'requires_authentication': True,
+            'features': list(self.features)
+        }
+        if self.limitations:
+            info['limitations'] = list(self.limitations)
+        return info
+
+@payment_providers.register(LegacyPaymentSystem)
+class LegacyPaymentBinding(PaymentBinding):
+    """Старая система: make_payment вместо process, отмена вместо возврата"""
+    
+    features = ('basic_payments', 'cancellation')
+    limitations = ('no_refunds', 'no_recurring_payments')
+    
+    async def process(self, amount, details):
+        # Адаптация для старой системы
+        customer_id = details.get('customer_id', '00000')
+        invoice_number = details.get('invoice_number', f'INV{int(time.time())}')
+        
+        result = await self.system.make_payment_async(
+            customer_id=customer_id,
+            invoice_number=invoice_number,
+            amount=amount
+        )
+        
+        # Преобразование результата в унифицированный формат
+        return {
+            'success': result['success'],
+            'payment_id': result['transaction_id'],
+            'amount': amount,
+            'status': result['status'],
+            'message': result['message']
+        }
+    
+    async def refund(self, transaction_id, amount):
+        # У старой системы нет метода refund, используем cancel
+        # (синхронный вызов - в отдельном потоке, чтобы не остановить цикл событий)
+        result = await asyncio.to_thread(self.system.cancel_payment, transaction_id)
+        return {
+            'success': result['success'],
+            'refund_id': f'REF-{transaction_id}',
+            'amount': amount,
+            'message': result['message']
+        }
+
+@payment_providers.register(NewPaymentSystem)
+class NewPaymentBinding(PaymentBinding):
+    """Новая система используется напрямую"""
+    
+    features = ('payments', 'refunds', 'recurring', 'subscriptions', 'batch')
+
+@payment_providers.register(PayPalSystem)
+class PayPalBinding(PaymentBinding):
+    """PayPal: send_payment и собственный формат ответа"""
+    
+    features = ('payments', 'refunds', 'international')
+    supported_currencies = ('USD', 'EUR', 'GBP', 'CAD', 'AUD')
+    
+    async def process(self, amount, details):
+        # Адаптация для PayPal
+        receiver_email = details.get('receiver_email', 'merchant@example.com')
+        description = details.get('description', 'E-commerce purchase')
+        
+        # send_payment синхронный - выполняется в отдельном потоке
+        result = await asyncio.to_thread(
+            self.system.send_payment,
+            receiver_email=receiver_email,
+            amount=amount,
+            description=description
+        )
+        
+        return {
+            'success': result['payment_status'] == 'COMPLETED',
+            'payment_id': result['payment_id'],
+            'amount': result['amount']['total'],
+            'currency': result['amount']['currency'],
+            'status': 'completed',
+            'message': 'PayPal payment processed'
+        }
+    
+    async def refund(self, transaction_id, amount):
+        # PayPal требует специальной обработки
+        print(f"[PayPal] Processing refund for {transaction_id}")
+        return {
+            'success': True,
+            'refund_id': f'PAYPAL-REF-{transaction_id}',
+            'amount': amount,
+            'status': 'refunded'
+        }
+
 class PaymentAdapter(PaymentSystem):
     """
     Adapter для совместимости различных платежных систем
-    с унифицированным интерфейсом
+    с унифицированным интерфейсом.
+    Одновременных вызовов одного провайдера (provider, по умолчанию - имя
+    класса системы) не больше лимита исполнителя.
+    Пакетные операции используют пакетный API системы, если он есть
+    (process_batch_async / refund_batch_async и max_batch_size), иначе
+    выполняют операции по одной параллельно.
+    Привязка к системе берется из payment_providers при создании адаптера,
+    вызовы идут через сохраненные методы привязки без проверок типа.
     """
     
-    def __init__(self, payment_system):
+    def __init__(self, payment_system, executor=None, provider=None):
         self.payment_system = payment_system
+        self.executor = executor or get_payment_executor()
+        self.provider = provider or type(payment_system).__name__
+        
+        self._binding = payment_providers.bind(payment_system)
+        self._process = self._binding.process
+        self._refund = self._binding.refund
+        
+        # Пакетный API провайдера определяется один раз
+        self._process_batch_native = getattr(payment_system, 'process_batch_async', None)
+        self._refund_batch_native = getattr(payment_system, 'refund_batch_async', None)
+        self.max_batch_size = getattr(payment_system, 'max_batch_size', 1)
     
     def process(self, amount, details):
-        """Унифицированный метод обработки платежа"""
-        
-        if isinstance(self.payment_system, LegacyPaymentSystem):
-            # Адаптация для старой системы
-            customer_id = details.get('customer_id', '00000')
-            invoice_number = details.get('invoice_number', f'INV{int(time.time())}')
-            
-            result = self.payment_system.make_payment(
-                customer_id=customer_id,
-                invoice_number=invoice_number,
-                amount=amount
-            )
-            
-            # Преобразование результата в унифицированный формат
-            return {
-                'success': result['success'],
-                'payment_id': result['transaction_id'],
-                'amount': amount,
-                'status': result['status'],
-                'message': result['message']
-            }
-            
-        elif isinstance(self.payment_system, NewPaymentSystem):
-            # Использование новой системы напрямую
-            return self.payment_system.process(amount, details)
-            
-        elif isinstance(self.payment_system, PayPalSystem):
-            # Адаптация для PayPal
-            receiver_email = details.get('receiver_email', 'merchant@example.com')
-            description = details.get('description', 'E-commerce purchase')
-            
-            result = self.payment_system.send_payment(
-                receiver_email=receiver_email,
-                amount=amount,
-                description=description
-            )
-            
-            return {
-                'success': result['payment_status'] == 'COMPLETED',
-                'payment_id': result['payment_id'],
-                'amount': result['amount']['total'],
-                'currency': result['amount']['currency'],
-                'status': 'completed',
-                'message': 'PayPal payment processed'
-            }
-        
-        else:
-            raise ValueError(f"Unsupported payment system: {type(self.payment_system)}")
+        """Унифицированный метод обработки платежа (синхронный мост для Flask)"""
+        return self.executor.run(self.process_async(amount, details))
     
     def refund(self, transaction_id, amount):
-        """Унифицированный метод возврата платежа"""
+        """Унифицированный метод возврата платежа (синхронный мост для Flask)"""
+        return self.executor.run(self.refund_async(transaction_id, amount))
+    
+    async def process_async(self, amount, details):
+        """Обработка платежа в пределах лимита провайдера"""
+        async with self.executor.limit(self.provider):
+            return await self._process(amount, details)
+    
+    async def refund_async(self, transaction_id, amount):
+        """Возврат платежа в пределах лимита провайдера"""
+        async with self.executor.limit(self.provider):
+            return await self._refund(transaction_id, amount)
+    
+    def process_batch(self, payments, concurrency=None, progress=None, timeout=None):
+        """
+        Пакет платежей [(amount, details), ...] (синхронный мост).
+        Возвращает результаты в порядке payments; ошибка платежа не прерывает
+        пакет, а попадает в его результат ({'success': False, 'error': ...}).
+        """
+        return self.executor.run(self.process_batch_async(payments, concurrency, progress), timeout)
+    
+    def refund_batch(self, refunds, concurrency=None, progress=None, timeout=None):
+        """Пакет возвратов [(transaction_id, amount), ...] (синхронный мост)"""
+        return self.executor.run(self.refund_batch_async(refunds, concurrency, progress), timeout)
+    
+    async def process_batch_async(self, payments, concurrency=None, progress=None):
+        return await self._collect(self.iter_process_batch(payments, concurrency), len(payments), progress)
+    
+    async def refund_batch_async(self, refunds, concurrency=None, progress=None):
+        return await self._collect(self.iter_refund_batch(refunds, concurrency), len(refunds), progress)
+    
+    def iter_process_batch(self, payments, concurrency=None):
+        """Поток результатов (index, result) в порядке завершения платежей"""
+        return self._iter_batch(list(payments), self._process, self._process_batch_native, concurrency)
+    
+    def iter_refund_batch(self, refunds, concurrency=None):
+        """Поток результатов (index, result) в порядке завершения возвратов"""
+        return self._iter_batch(list(refunds), self._refund, self._refund_batch_native, concurrency)
+    
+    async def _collect(self, stream, total, progress):
+        """
+        Результаты пакета по порядку; progress(index, result, done, total)
+        вызывается после каждой операции (в потоке цикла событий)
+        """
+        results = [None] * total
+        done = 0
+        async for index, result in stream:
+            results[index] = result
+            done += 1
+            if progress is not None:
+                progress(index, result, done, total)
+        return results
+    
+    async def _iter_batch(self, items, single, native, concurrency):
+        # Дополнительный лимит пакета поверх лимита провайдера
+        batch_limit = asyncio.Semaphore(concurrency) if concurrency else None
         
-        if isinstance(self.payment_system, LegacyPaymentSystem):
-            # У старой системы нет метода refund, используем cancel
-            result = self.payment_system.cancel_payment(transaction_id)
-            return {
-                'success': result['success'],
-                'refund_id': f'REF-{transaction_id}',
-                'amount': amount,
-                'message': result['message']
-            }
-            
-        elif isinstance(self.payment_system, NewPaymentSystem):
-            return self.payment_system.refund(transaction_id, amount)
-            
-        elif isinstance(self.payment_system, PayPalSystem):
-            # PayPal требует специальной обработки
-            print(f"[PayPal] Processing refund for {transaction_id}")
-            return {
-                'success': True,
-                'refund_id': f'PAYPAL-REF-{transaction_id}',
-                'amount': amount,
-                'status': 'refunded'
-            }
+        async def run_chunk(offset, chunk):
+            async with self.executor.limit(self.provider):
+                try:
+                    if native is not None:
+                        results = list(await native(chunk))
+                    else:
+                        results = [await single(*chunk[0])]
+                except Exception as e:
+                    results = [{'success': False, 'error': str(e)} for _ in chunk]
+            # Ровно один результат на операцию: без ответа - ошибка; при лишних
+            # ответах соответствие позиций не определено - ошибка всей пачки
+            if len(results) > len(chunk):
+                error = f"Batch response has {len(results)} results for {len(chunk)} operations"
+                results = [{'success': False, 'error': error} for _ in chunk]
+            results += [{'success': False, 'error': 'No result in batch response'}
+                        for _ in range(len(chunk) - len(results))]
+            return offset, results
         
-        else:
-            raise ValueError(f"Unsupported payment system: {type(self.payment_system)}")
+        async def run_limited(offset, chunk):
+            if batch_limit is None:
+                return await run_chunk(offset, chunk)
+            async with batch_limit:
+                return await run_chunk(offset, chunk)
+        
+        size = self.max_batch_size if native is not None else 1
+        tasks = [
+            asyncio.ensure_future(run_limited(offset, items[offset:offset + size]))
+            for offset in range(0, len(items), size)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                offset, results = await next_done
+                for position, result in enumerate(results):
+                    yield offset + position, result
+        finally:
+            for task in tasks:
+                task.cancel()
     
     def get_system_info(self):
         """Получение информации о платежной системе"""
-        system_type = type(self.payment_system).__name__
-        
-        info = {
-            'system': system_type,
-            'supported_currencies': ['USD', 'EUR'],
-            'requires_authentication': True
-        }
-        
-        if isinstance(self.payment_system, LegacyPaymentSystem):
-            info['features'] = ['basic_payments', 'cancellation']
-            info['limitations'] = ['no_refunds', 'no_recurring_payments']
-        
-        elif isinstance(self.payment_system, NewPaymentSystem):
-            info['features'] = ['payments', 'refunds', 'recurring', 'subscriptions']
-        
-        elif isinstance(self.payment_system, PayPalSystem):
-            info['features'] = ['payments', 'refunds', 'international']
-            info['supported_currencies'] = ['USD', 'EUR', 'GBP', 'CAD', 'AUD']
-        
-        return info
+        return self._binding.info()
 
 # Пример использования Adapter Pattern
 class PaymentProcessor:
     """Класс для демонстрации работы адаптера"""
     
-    def __init__(self):
+    def __init__(self, executor=None):
         self.adapters = {}
+        self.executor = executor or get_payment_executor()
     
     def register_adapter(self, name, payment_system):
         """Регистрация платежной системы с адаптером"""
-        self.adapters[name] = PaymentAdapter(payment_system)
+        self.adapters[name] = PaymentAdapter(payment_system, executor=self.executor)
     
     def process_payment(self, adapter_name, amount, details):
         """Обработка платежа через выбранный адаптер"""
@@ -212,4 +415,57 @@ class PaymentProcessor:
                 'info': adapter.get_system_info()
             }
             for name, adapter in self.adapters.items()
-        ]
\ No newline at end of file
+        ]
+    
+    def process_batch(self, payments, concurrency=None, progress=None, timeout=None):
+        """
+        Пакет платежей [(adapter_name, amount, details), ...].
+        Платежи группируются по провайдерам, группы выполняются одновременно;
+        concurrency ограничивает параллельность внутри каждой группы.
+        Результаты - в порядке payments, progress(index, result, done, total).
+        """
+        groups = self._group(payments)
+        return self.executor.run(
+            self._run_groups(groups, len(payments), 'process_batch_async', concurrency, progress), timeout
+        )
+    
+    def refund_batch(self, refunds, concurrency=None, progress=None, timeout=None):
+        """Пакет возвратов [(adapter_name, transaction_id, amount), ...]"""
+        groups = self._group(refunds)
+        return self.executor.run(
+            self._run_groups(groups, len(refunds), 'refund_batch_async', concurrency, progress), timeout
+        )
+    
+    def _group(self, items):
+        """{имя провайдера: ([индексы], [аргументы операции])}"""
+        groups = {}
+        for index, (adapter_name, *args) in enumerate(items):
+            indices, group_items = groups.setdefault(adapter_name, ([], []))
+            indices.append(index)
+            group_items.append(tuple(args))
+        return groups
+    
+    async def _run_groups(self, groups, total, method, concurrency, progress):
+        results = [None] * total
+        done = 0
+        
+        def on_result(indices):
+            def report(local_index, result, *_):
+                nonlocal done
+                done += 1
+                results[indices[local_index]] = result
+                if progress is not None:
+                    progress(indices[local_index], result, done, total)
+            return report
+        
+        calls = []
+        for adapter_name, (indices, group_items) in groups.items():
+            adapter = self.adapters.get(adapter_name)
+            if adapter is None:
+                for local_index in range(len(indices)):
+                    on_result(indices)(local_index, {'success': False, 'error': f"Adapter {adapter_name} not found"})
+                continue
+            calls.append(getattr(adapter, method)(group_items, concurrency, on_result(indices)))
+        
+        await asyncio.gather(*calls)
+        return results
@@ -0,0 +1,152 @@
+"""
+Исполнитель платежных вызовов: цикл событий asyncio в фоновом потоке,
+синхронный мост для Flask и ограничение числа одновременных вызовов
+каждого провайдера
+"""
+
+import asyncio
+import atexit
+import threading
+import weakref
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from flask import current_app, has_app_context
+
+
+class PaymentExecutor:
+    """
+    Платежи выполняются как корутины в одном цикле событий: ожидание ответа
+    провайдера не занимает поток, поэтому число одновременных платежей
+    ограничено лимитами провайдеров, а не числом потоков сервера.
+    limits - лимит одновременных вызовов по имени провайдера,
+    default_limit - для остальных провайдеров.
+    """
+
+    def __init__(self, limits=None, default_limit=16, timeout=30.0, name='payment-executor'):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.timeout = timeout
+        self.name = name
+
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Семафоры привязаны к циклу событий: у каждого цикла свой набор
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        self.in_flight = defaultdict(int)
+        self.peak_in_flight = defaultdict(int)
+        self.completed = defaultdict(int)
+
+    def start(self):
+        """Запуск цикла событий в фоновом потоке"""
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(ready,), name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self
+
+    def _run_loop(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def _semaphore(self, provider):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._semaphores.get(loop)
+            if semaphores is None:
+                semaphores = self._semaphores[loop] = {}
+            semaphore = semaphores.get(provider)
+            if semaphore is None:
+                semaphore = semaphores[provider] = asyncio.Semaphore(self.limits.get(provider, self.default_limit))
+            return semaphore
+
+    @asynccontextmanager
+    async def limit(self, provider):
+        """Слот провайдера: при исчерпании лимита корутина ждет, не блокируя поток"""
+        async with self._semaphore(provider):
+            with self._lock:
+                self.in_flight[provider] += 1
+                self.peak_in_flight[provider] = max(self.peak_in_flight[provider], self.in_flight[provider])
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight[provider] -= 1
+                    self.completed[provider] += 1
+
+    def submit(self, coroutine):
+        """Запуск корутины в цикле исполнителя; возвращает concurrent.futures.Future"""
+        if self._thread is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine, timeout=None):
+        """
+        Синхронный мост: результат корутины для кода без asyncio (обработчики Flask).
+        Вызов из самого цикла исполнителя привел бы к взаимной блокировке.
+        """
+        if self._thread is not None and threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError('PaymentExecutor.run() called from its own event loop; await the coroutine instead')
+
+        future = self.submit(coroutine)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def run_many(self, coroutines, timeout=None):
+        """Одновременное выполнение нескольких корутин; результаты или исключения - по порядку"""
+        async def gather():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+
+        return self.run(gather(), timeout)
+
+    def close(self):
+        """Остановка цикла событий"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._thread = None
+        if thread is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': dict(self.in_flight),
+                'peak_in_flight': dict(self.peak_in_flight),
+                'completed': dict(self.completed)
+            }
+
+
+_payment_executor = None
+_payment_executor_lock = threading.Lock()
+
+
+def get_payment_executor(config=None):
+    """Исполнитель платежей процесса (по настройкам PAYMENT_*)"""
+    global _payment_executor
+    if _payment_executor is None:
+        if config is None:
+            config = current_app.config if has_app_context() else {}
+        with _payment_executor_lock:
+            if _payment_executor is None:
+                _payment_executor = PaymentExecutor(
+                    limits=config.get('PAYMENT_PROVIDER_LIMITS'),
+                    default_limit=config.get('PAYMENT_DEFAULT_CONCURRENCY', 16),
+                    timeout=config.get('PAYMENT_TIMEOUT', 30.0),
+                    name='payments'
+                ).start()
+                atexit.register(_payment_executor.close)
+    return _payment_executor
@@ -0,0 +1,69 @@
+"""
+Реестр провайдеров для адаптеров: тип провайдера -> класс привязки,
+который переводит унифицированный интерфейс адаптера в вызовы провайдера
+"""
+
+import threading
+
+
+class ProviderRegistry:
+    """
+    Привязка ищется по MRO типа провайдера один раз, затем берется из кэша,
+    поэтому подклассы зарегистрированных провайдеров поддерживаются
+    автоматически, а адаптеру не нужны проверки типа при каждом вызове.
+    fallback(provider_type) - привязка для незарегистрированного типа
+    (например, по набору его методов) или None.
+    """
+
+    def __init__(self, name, fallback=None):
+        self.name = name
+        self._fallback = fallback
+        self._bindings = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def register(self, provider_type, binding=None):
+        """Регистрация привязки; без binding работает как декоратор класса привязки"""
+        if binding is None:
+            return lambda binding_class: self.register(provider_type, binding_class)
+
+        with self._lock:
+            self._bindings[provider_type] = binding
+            # Новая регистрация может изменить привязку подклассов
+            self._resolved.clear()
+        return binding
+
+    def resolve(self, provider_type):
+        """Класс привязки для типа провайдера"""
+        binding = self._resolved.get(provider_type)
+        if binding is not None:
+            return binding
+
+        with self._lock:
+            for klass in provider_type.__mro__:
+                binding = self._bindings.get(klass)
+                if binding is not None:
+                    break
+            else:
+                binding = self._fallback(provider_type) if self._fallback else None
+
+            if binding is None:
+                raise ValueError(f"Unsupported {self.name}: {provider_type.__name__}")
+            self._resolved[provider_type] = binding
+        return binding
+
+    def bind(self, provider):
+        """Привязка для экземпляра провайдера"""
+        return self.resolve(type(provider))(provider)
+
+    def providers(self):
+        """Зарегистрированные типы провайдеров"""
+        with self._lock:
+            return list(self._bindings)
+
+    def __contains__(self, provider_type):
+        try:
+            self.resolve(provider_type)
+        except ValueError:
+            return False
+        return True
@@ -1,58 +1,302 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from src.api.adapters.registry import ProviderRegistry
+
+class ShippingBinding:
+    """
+    Привязка службы доставки к интерфейсу ShippingAdapter.
+    Операции, которых служба не поддерживает, завершаются ValueError.
+    create_batch / track_batch - пакетный API службы (до max_batch_size
+    отправлений или номеров за вызов), None - если его нет.
+    """
+    
+    # Имена пакетных методов службы
+    create_batch_method = None
+    track_batch_method = None
+    
+    def __init__(self, service):
+        self.service = service
+        self.create_batch = self._create_batch if self._has(self.create_batch_method) else None
+        self.track_batch = self._track_batch if self._has(self.track_batch_method) else None
+        self.max_batch_size = getattr(service, 'max_batch_size', 1)
+    
+    def _has(self, method_name):
+        return method_name is not None and hasattr(self.service, method_name)
+    
+    def calculate(self, address, weight, dimensions):
+        raise ValueError("Unsupported shipping service")
+    
+    def normalize_quote(self, result):
+        """Ответ calculate в общем виде: carrier, service, cost, estimated_days"""
+        raise ValueError("Unsupported shipping service")
+    
+    def create_shipment(self, order_id, address, items):
+        raise ValueError("Unsupported shipment creation")
+    
+    def normalize_shipment(self, result):
+        """Номер отслеживания из ответа create_shipment"""
+        raise ValueError("Unsupported shipment creation")
+    
+    def track(self, tracking_number):
+        raise ValueError("Unsupported tracking method")
+    
+    def normalize_tracking(self, result):
+        """Ответ track в общем виде: status (in_transit, delivered, ...) и детали"""
+        raise ValueError("Unsupported tracking method")
+    
+    @staticmethod
+    def _status(text):
+        return '_'.join(str(text).lower().split())
+
+class CarrierApiBinding(ShippingBinding):
+    """Новая система доставки: get_shipping_cost / create_shipment / track_package"""
+    
+    create_batch_method = 'create_shipments'
+    track_batch_method = 'track_packages'
+    
+    def calculate(self, address, weight, dimensions):
+        return self.service.get_shipping_cost(
+            destination=address,
+            package_weight=weight,
+            package_dimensions=dimensions
+        )
+    
+    def normalize_quote(self, result):
+        return {
+            'carrier': result['carrier'],
+            'service': result.get('service', result['carrier']),
+            'cost': float(result['cost']),
+            'estimated_days': int(result['estimated_days'])
+        }
+    
+    def create_shipment(self, order_id, address, items):
+        return self.service.create_shipment(
+            order_reference=order_id,
+            delivery_address=address,
+            contents=items
+        )
+    
+    def _create_batch(self, shipments):
+        return self.service.create_shipments([
+            {'order_reference': order_id, 'delivery_address': address, 'contents': items}
+            for order_id, address, items in shipments
+        ])
+    
+    def normalize_shipment(self, result):
+        return result['tracking_number']
+    
+    def track(self, tracking_number):
+        return self.service.track_package(tracking_number)
+    
+    def _track_batch(self, tracking_numbers):
+        statuses = self.service.track_packages(tracking_numbers)
+        return [statuses[tracking_number] for tracking_number in tracking_numbers]
+    
+    def normalize_tracking(self, result):
+        return {
+            'status': self._status(result['status']),
+            'location': result.get('location'),
+            'estimated_delivery': result.get('estimated_delivery')
+        }
+
+class LegacyCarrierBinding(ShippingBinding):
+    """Старая система доставки: calculate / ship / get_status"""
+    
+    def calculate(self, address, weight, dimensions):
+        return self.service.calculate(
+            to_address=address,
+            weight_kg=weight,
+            size=dimensions
+        )
+    
+    def normalize_quote(self, result):
+        # Срок приходит текстом: '2 business days'
+        days = re.search(r'\d+', str(result.get('delivery', '')))
+        return {
+            'carrier': result['service'].split()[0],
+            'service': result['service'],
+            'cost': float(result['price']),
+            'estimated_days': int(days.group()) if days else None
+        }
+    
+    def create_shipment(self, order_id, address, items):
+        return self.service.ship(
+            order_id=order_id,
+            address=address,
+            products=items
+        )
+    
+    def normalize_shipment(self, result):
+        return result['tracking_code']
+    
+    def track(self, tracking_number):
+        return self.service.get_status(tracking_number)
+    
+    def normalize_tracking(self, result):
+        return {
+            'status': self._status(result['state']),
+            'delivered_at': result.get('delivered_at')
+        }
+
+# Операция адаптера -> методы службы, по которым узнается интерфейс
+_SHIPPING_OPERATIONS = {
+    'calculate': (('get_shipping_cost', CarrierApiBinding), ('calculate', LegacyCarrierBinding)),
+    'create_shipment': (('create_shipment', CarrierApiBinding), ('ship', LegacyCarrierBinding)),
+    'track': (('track_package', CarrierApiBinding), ('get_status', LegacyCarrierBinding))
+}
+
+# Методы привязки, которые берутся вместе с операцией
+_SHIPPING_COMPANIONS = {
+    'calculate': ('normalize_quote',),
+    'create_shipment': ('normalize_shipment',),
+    'track': ('normalize_tracking',)
+}
+
+def _probe_shipping_binding(service_type):
+    """Привязка для незарегистрированной службы - по ее методам, один раз на тип"""
+    namespace = {}
+    for operation, candidates in _SHIPPING_OPERATIONS.items():
+        for method_name, binding in candidates:
+            if hasattr(service_type, method_name):
+                namespace[operation] = getattr(binding, operation)
+                for companion in _SHIPPING_COMPANIONS[operation]:
+                    namespace[companion] = getattr(binding, companion)
+                break
+    return type(f'{service_type.__name__}Binding', (ShippingBinding,), namespace)
+
+shipping_providers = ProviderRegistry('shipping service', fallback=_probe_shipping_binding)
+
 class ShippingAdapter:
-    """Адаптер для различных служб доставки"""
+    """
+    Адаптер для различных служб доставки.
+    Привязка к службе берется из shipping_providers при создании адаптера.
+    """
     
     def __init__(self, shipping_service):
         self.shipping_service = shipping_service
+        
+        binding = shipping_providers.bind(shipping_service)
+        self._binding = binding
+        self._calculate = binding.calculate
+        self._normalize_quote = binding.normalize_quote
+        self._create_shipment = binding.create_shipment
+        self._track = binding.track
     
     def calculate_shipping(self, address, weight, dimensions):
         """Расчет стоимости доставки"""
-        if hasattr(self.shipping_service, 'get_shipping_cost'):
-            # Новая система доставки
-            return self.shipping_service.get_shipping_cost(
-                destination=address,
-                package_weight=weight,
-                package_dimensions=dimensions
-            )
-        elif hasattr(self.shipping_service, 'calculate'):
-            # Старая система доставки
-            return self.shipping_service.calculate(
-                to_address=address,
-                weight_kg=weight,
-                size=dimensions
-            )
-        else:
-            raise ValueError("Unsupported shipping service")
+        return self._calculate(address, weight, dimensions)
+    
+    def get_quote(self, address, weight, dimensions):
+        """Расчет стоимости в общем для всех служб формате"""
+        return self._normalize_quote(self._calculate(address, weight, dimensions))
     
     def create_shipment(self, order_id, address, items):
         """Создание отправления"""
-        if hasattr(self.shipping_service, 'create_shipment'):
-            return self.shipping_service.create_shipment(
-                order_reference=order_id,
-                delivery_address=address,
-                contents=items
-            )
-        elif hasattr(self.shipping_service, 'ship'):
-            return self.shipping_service.ship(
-                order_id=order_id,
-                address=address,
-                products=items
-            )
-        else:
-            raise ValueError("Unsupported shipment creation")
+        return self._create_shipment(order_id, address, items)
     
     def track_shipment(self, tracking_number):
         """Отслеживание отправления"""
-        if hasattr(self.shipping_service, 'track_package'):
-            return self.shipping_service.track_package(tracking_number)
-        elif hasattr(self.shipping_service, 'get_status'):
-            return self.shipping_service.get_status(tracking_number)
-        else:
-            raise ValueError("Unsupported tracking method")
+        return self._track(tracking_number)
+    
+    def create_shipments(self, shipments, concurrency=8):
+        """
+        Пакетное создание отправлений [(order_id, address, items), ...].
+        order_id передается службе как ссылка на заказ - ключ идемпотентности:
+        повторное создание отправления для того же заказа возвращает
+        существующее. Результаты - в порядке shipments: {'order_id', 'success',
+        'tracking_number', 'result'} или {'order_id', 'success': False, 'error'}.
+        """
+        shipments = [tuple(shipment) for shipment in shipments]
+        binding = self._binding
+        
+        def to_result(shipment, result):
+            return {
+                'order_id': shipment[0],
+                'success': True,
+                'tracking_number': binding.normalize_shipment(result),
+                'result': result
+            }
+        
+        def to_error(shipment, error):
+            return {'order_id': shipment[0], 'success': False, 'error': str(error)}
+        
+        return self._run_batched(shipments, lambda shipment: self._create_shipment(*shipment),
+                                 binding.create_batch, concurrency, to_result, to_error)
+    
+    def track_many(self, tracking_numbers, concurrency=8):
+        """
+        Статусы нескольких отправлений. Результаты - в порядке tracking_numbers:
+        {'tracking_number', 'success', 'status', 'details'} или ошибка.
+        """
+        binding = self._binding
+        
+        def to_result(tracking_number, result):
+            details = binding.normalize_tracking(result)
+            return {
+                'tracking_number': tracking_number,
+                'success': True,
+                'status': details.pop('status'),
+                'details': details
+            }
+        
+        def to_error(tracking_number, error):
+            return {'tracking_number': tracking_number, 'success': False, 'error': str(error)}
+        
+        return self._run_batched(list(tracking_numbers), self._track, binding.track_batch,
+                                 concurrency, to_result, to_error)
+    
+    def _run_batched(self, items, single, batch, concurrency, to_result, to_error):
+        """
+        Пачки по max_batch_size через пакетный API службы или по одному
+        элементу; пачки выполняются параллельно, не более concurrency сразу.
+        Результат - ровно по одному на элемент: позиции, на которые служба
+        не ответила, становятся ошибками; при лишних ответах соответствие
+        позиций не определено, и ошибкой считается вся пачка.
+        """
+        if not items:
+            return []
+        size = self._binding.max_batch_size if batch is not None else 1
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        
+        def run_chunk(chunk):
+            try:
+                results = batch(chunk) if batch is not None else [single(chunk[0])]
+            except Exception as e:
+                return [to_error(item, e) for item in chunk]
+            
+            results = list(results)
+            if len(results) > len(chunk):
+                error = ValueError(f"Batch response has {len(results)} results for {len(chunk)} items")
+                return [to_error(item, error) for item in chunk]
+            
+            converted = []
+            for position, item in enumerate(chunk):
+                if position >= len(results):
+                    converted.append(to_error(item, ValueError('No result in batch response')))
+                    continue
+                try:
+                    converted.append(to_result(item, results[position]))
+                except Exception as e:
+                    converted.append(to_error(item, e))
+            return converted
+        
+        if len(chunks) == 1:
+            return run_chunk(chunks[0])
+        
+        results = []
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks)),
+                                thread_name_prefix='shipping-batch') as executor:
+            for chunk_results in executor.map(run_chunk, chunks):
+                results.extend(chunk_results)
+        return results
 
 # Примеры служб доставки
 class FedExService:
     """Служба доставки FedEx"""
     
+    # Пакетный API: до 30 отправлений или номеров за запрос
+    max_batch_size = 30
+    
     def get_shipping_cost(self, destination, package_weight, package_dimensions):
         return {
             'carrier': 'FedEx',
@@ -66,12 +310,18 @@ class FedExService:
             'label_url': f"https://fedex.com/labels/{order_reference}"
         }
     
+    def create_shipments(self, shipments):
+        return [self.create_shipment(**shipment) for shipment in shipments]
+    
     def track_package(self, tracking_number):
         return {
             'status': 'In transit',
             'location': 'New York',
             'estimated_delivery': '2024-12-25'
         }
+    
+    def track_packages(self, tracking_numbers):
+        return {tracking_number: self.track_package(tracking_number) for tracking_number in tracking_numbers}
 
 class UPSService:
     """Служба доставки UPS"""
@@ -93,4 +343,7 @@ class UPSService:
         return {
             'state': 'Delivered',
             'delivered_at': '2024-12-24 14:30:00'
-        }
\ No newline at end of file
+        }
+
+shipping_providers.register(FedExService, CarrierApiBinding)
+shipping_providers.register(UPSService, LegacyCarrierBinding)
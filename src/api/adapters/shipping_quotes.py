@@ -0,0 +1,203 @@
+"""
+Расчет доставки сразу у всех служб: параллельные запросы с таймаутом
+на службу и кэш тарифов по зоне доставки и размерам посылки
+"""
+
+import atexit
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from src.api.adapters.shipping_adapter import ShippingAdapter, FedExService, UPSService
+from src.utils.cache import LRUCache
+from src.utils.metrics import upstream_request_duration
+
+
+class _Carrier:
+    """Служба доставки движка: адаптер, таймаут и собственные потоки"""
+    __slots__ = ('adapter', 'timeout', 'executor', 'slots')
+
+    def __init__(self, name, adapter, timeout, workers):
+        self.adapter = adapter
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'shipping-quote-{name}')
+        self.slots = threading.BoundedSemaphore(workers)
+
+
+class ShippingQuoteEngine:
+    """
+    Опрос всех зарегистрированных служб доставки.
+    Службы опрашиваются одновременно; служба, не ответившая за свой таймаут,
+    попадает в errors и не задерживает ответ. У каждой службы свои
+    carrier_workers потоков: зависшие вызовы одной службы не занимают
+    потоки остальных, а пока все ее потоки заняты, служба сразу получает
+    ошибку 'busy' вместо ожидания в очереди. Тарифы кэшируются на cache_ttl
+    по ключу (зона, корзина веса, корзина размеров): служба получает
+    верхние границы корзин, поэтому тариф верен для любой посылки из корзины,
+    а повторный расчет для той же зоны обходится без запросов к службам.
+    """
+
+    def __init__(self, timeout=2.0, cache_ttl=600, cache_size=4096, weight_step=0.5, dimension_step=10,
+                 carrier_workers=2, clock=time.monotonic):
+        self.timeout = timeout
+        self.carrier_workers = carrier_workers
+        self.weight_step = weight_step
+        self.dimension_step = dimension_step
+        self.cache = LRUCache(max_entries=cache_size, ttl=cache_ttl, clock=clock)
+
+        self._carriers = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, service, timeout=None, workers=None):
+        """
+        Подключение службы доставки (timeout - собственный таймаут службы,
+        workers - число ее одновременных запросов)
+        """
+        carrier = _Carrier(name, ShippingAdapter(service), timeout or self.timeout, workers or self.carrier_workers)
+        with self._lock:
+            previous = self._carriers.get(name)
+            self._carriers[name] = carrier
+        if previous is not None:
+            previous.executor.shutdown(wait=False)
+
+    def unregister(self, name):
+        with self._lock:
+            carrier = self._carriers.pop(name, None)
+        if carrier is not None:
+            carrier.executor.shutdown(wait=False)
+
+    @property
+    def carriers(self):
+        with self._lock:
+            return list(self._carriers)
+
+    @staticmethod
+    def normalize_destination(address):
+        """Зона доставки: адрес без регистра, знаков препинания и лишних пробелов"""
+        return ' '.join(re.findall(r'\w+', str(address).lower()))
+
+    def _bucket(self, value, step):
+        return math.ceil(float(value) / step - 1e-9) * step
+
+    def _dimensions_bucket(self, dimensions):
+        """'30x20x15 cm' -> (30, 20, 20) при шаге 10; нераспознанные размеры - как есть"""
+        numbers = re.findall(r'\d+(?:\.\d+)?', str(dimensions))
+        if len(numbers) != 3:
+            return str(dimensions).strip().lower()
+        return tuple(self._bucket(number, self.dimension_step) for number in numbers)
+
+    def cache_key(self, address, weight, dimensions):
+        return (
+            self.normalize_destination(address),
+            self._bucket(weight, self.weight_step),
+            self._dimensions_bucket(dimensions)
+        )
+
+    def _fetch(self, name, carrier, call, address, weight, dimensions):
+        # Срок ответа отсчитывается от начала вызова, а не от постановки в очередь
+        call['started'] = time.monotonic()
+        start_time = time.perf_counter()
+        outcome = 'error'
+        try:
+            quote = carrier.adapter.get_quote(address, weight, dimensions)
+            outcome = 'ok'
+            return quote
+        finally:
+            carrier.slots.release()
+            upstream_request_duration.observe(time.perf_counter() - start_time,
+                                              upstream=f'shipping:{name}', method='quote', outcome=outcome)
+
+    def quote(self, address, weight, dimensions):
+        """
+        Тарифы всех служб: quotes (по возрастанию цены), cheapest, fastest,
+        errors (служба -> причина) и cached (ответ целиком из кэша).
+        """
+        key = self.cache_key(address, weight, dimensions)
+        destination, weight_bucket, dimensions_bucket = key
+        if isinstance(dimensions_bucket, tuple):
+            dimensions = 'x'.join(f'{value:g}' for value in dimensions_bucket) + ' cm'
+
+        with self._lock:
+            carriers = dict(self._carriers)
+
+        quotes = {}
+        pending = {}
+        errors = {}
+        for name, carrier in carriers.items():
+            cached = self.cache.get(key + (name,))
+            if cached is not None:
+                quotes[name] = cached
+            elif not carrier.slots.acquire(blocking=False):
+                # Все потоки службы заняты (служба зависла) - без ожидания
+                errors[name] = 'busy'
+            else:
+                call = {'started': None}
+                future = carrier.executor.submit(self._fetch, name, carrier, call, address, weight_bucket, dimensions)
+                pending[name] = (future, call, carrier)
+
+        for name, (future, call, carrier) in pending.items():
+            started = call['started'] or time.monotonic()
+            try:
+                quotes[name] = future.result(max(0.0, started + carrier.timeout - time.monotonic()))
+            except TimeoutError:
+                if future.cancel():
+                    # Вызов так и не начался - слот освобождается здесь
+                    carrier.slots.release()
+                errors[name] = 'timeout'
+                continue
+            except Exception as e:
+                errors[name] = str(e)
+                continue
+            self.cache.set(key + (name,), quotes[name])
+
+        options = sorted(
+            ({'carrier_id': name, **quote} for name, quote in quotes.items()),
+            key=lambda option: (option['cost'], option['carrier_id'])
+        )
+        with_days = [option for option in options if option['estimated_days'] is not None]
+        return {
+            'destination': destination,
+            'weight_bucket': weight_bucket,
+            'quotes': options,
+            'cheapest': options[0] if options else None,
+            'fastest': min(with_days, key=lambda option: (option['estimated_days'], option['cost'])) if with_days else None,
+            'errors': errors,
+            'cached': not pending and not errors
+        }
+
+    def close(self):
+        with self._lock:
+            carriers, self._carriers = list(self._carriers.values()), {}
+        for carrier in carriers:
+            carrier.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {'carriers': self.carriers, 'cache': self.cache.stats()}
+
+
+_quote_engine = None
+_quote_engine_lock = threading.Lock()
+
+
+def get_shipping_quote_engine(config=None):
+    """Движок расчета доставки процесса со стандартными службами (настройки SHIPPING_*)"""
+    global _quote_engine
+    if _quote_engine is None:
+        if config is None:
+            config = current_app.config if has_app_context() else {}
+        with _quote_engine_lock:
+            if _quote_engine is None:
+                engine = ShippingQuoteEngine(
+                    timeout=config.get('SHIPPING_QUOTE_TIMEOUT', 2.0),
+                    cache_ttl=config.get('SHIPPING_RATE_CACHE_TTL', 600),
+                    weight_step=config.get('SHIPPING_WEIGHT_STEP', 0.5),
+                    dimension_step=config.get('SHIPPING_DIMENSION_STEP', 10),
+                    carrier_workers=config.get('SHIPPING_CARRIER_WORKERS', 2)
+                )
+                engine.register('fedex', FedExService())
+                engine.register('ups', UPSService())
+                atexit.register(engine.close)
+                _quote_engine = engine
+    return _quote_engine
@@ -1,10 +1,36 @@
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from flask import request, jsonify
 from src.services.facade import ECommerceFacade
+from src.api.http_client import UpstreamClient
+from src.utils.metrics import upstream_request_duration
+from src.api.resilience import (
+    CircuitBreakerRegistry,
+    Bulkhead,
+    RetryBudget,
+    RetryPolicy,
+    ResilienceError,
+    DeadlineExceededError
+)
+
+class UpstreamError(Exception):
+    """Микросервис вернул неуспешный ответ"""
+    pass
 
 class APIGateway:
     """API Gateway для маршрутизации запросов к микросервисам"""
     
+    SUPPORTED_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+    # Повторять можно только идемпотентные запросы
+    RETRYABLE_METHODS = ('GET', 'PUT', 'DELETE')
+    
+    # Разделы агрегированных данных пользователя: имя -> сервис и endpoint
+    AGGREGATED_SECTIONS = {
+        'orders': {'service': 'orders', 'endpoint': '/users/{user_id}/orders'},
+        'cart': {'service': 'orders', 'endpoint': '/users/{user_id}/cart'}
+    }
+    
     def __init__(self, config):
         self.config = config
         self.facade = ECommerceFacade()
@@ -13,41 +39,147 @@ class APIGateway:
         self.product_service_url = config.get('PRODUCT_SERVICE_URL')
         self.order_service_url = config.get('ORDER_SERVICE_URL')
         self.payment_service_url = config.get('PAYMENT_SERVICE_URL')
+        
+        # Пул keep-alive соединений для каждого микросервиса
+        pool_options = {
+            'pool_size': config.get('GATEWAY_POOL_SIZE', 20),
+            'connect_timeout': config.get('GATEWAY_CONNECT_TIMEOUT', 2.0),
+            'read_timeout': config.get('GATEWAY_READ_TIMEOUT', 10.0)
+        }
+        self.upstreams = {
+            'products': UpstreamClient('products', self.product_service_url, **pool_options),
+            'orders': UpstreamClient('orders', self.order_service_url, **pool_options),
+            'payments': UpstreamClient('payments', self.payment_service_url, **pool_options)
+        }
+        
+        # Отказоустойчивость: Circuit Breaker и Bulkhead на каждый микросервис
+        self.breakers = {
+            name: CircuitBreakerRegistry.get(
+                name,
+                failure_rate=config.get('GATEWAY_BREAKER_FAILURE_RATE', 0.5),
+                window_size=config.get('GATEWAY_BREAKER_WINDOW', 20),
+                min_calls=config.get('GATEWAY_BREAKER_MIN_CALLS', 5),
+                recovery_timeout=config.get('GATEWAY_BREAKER_RECOVERY_TIMEOUT', 30.0)
+            )
+            for name in self.upstreams
+        }
+        self.bulkheads = {
+            name: Bulkhead(
+                name,
+                max_concurrent=config.get('GATEWAY_MAX_CONCURRENT', pool_options['pool_size']),
+                max_wait=config.get('GATEWAY_BULKHEAD_MAX_WAIT', 0.5)
+            )
+            for name in self.upstreams
+        }
+        self.retry_budget = RetryBudget(ratio=config.get('GATEWAY_RETRY_BUDGET', 0.2))
+        self.retry_policy = RetryPolicy(
+            max_attempts=config.get('GATEWAY_RETRY_ATTEMPTS', 3),
+            base_delay=config.get('GATEWAY_RETRY_BASE_DELAY', 0.05),
+            max_delay=config.get('GATEWAY_RETRY_MAX_DELAY', 1.0),
+            retry_on=(requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+            budget=self.retry_budget
+        )
+        
+        # Параллельная агрегация данных из нескольких сервисов
+        self.aggregated_sections = {name: dict(section) for name, section in self.AGGREGATED_SECTIONS.items()}
+        self.section_timeout = config.get('GATEWAY_SECTION_TIMEOUT', 2.0)
+        self.aggregation_timeout = config.get('GATEWAY_AGGREGATION_TIMEOUT', 3.0)
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get('GATEWAY_AGGREGATION_WORKERS', 8),
+            thread_name_prefix='gateway-aggregation'
+        )
     
     def route_request(self, service_name, endpoint, method='GET', data=None):
         """Маршрутизация запроса к микросервису"""
-        # Определение URL целевого сервиса
-        if service_name == 'products':
-            base_url = self.product_service_url
-        elif service_name == 'orders':
-            base_url = self.order_service_url
-        elif service_name == 'payments':
-            base_url = self.payment_service_url
-        else:
+        # Определение целевого сервиса
+        upstream = self.upstreams.get(service_name)
+        if upstream is None:
             return {'error': f'Unknown service: {service_name}'}, 400
         
-        # Формирование полного URL
-        url = f"{base_url}{endpoint}"
+        if method not in self.SUPPORTED_METHODS:
+            return {'error': f'Unsupported method: {method}'}, 400
         
         try:
-            # Отправка запроса к микросервису
-            if method == 'GET':
-                response = requests.get(url, params=data)
-            elif method == 'POST':
-                response = requests.post(url, json=data)
-            elif method == 'PUT':
-                response = requests.put(url, json=data)
-            elif method == 'DELETE':
-                response = requests.delete(url)
-            else:
-                return {'error': f'Unsupported method: {method}'}, 400
+            # Отправка запроса к микросервису через пул соединений
+            response = self._call_upstream(service_name, method, endpoint, data)
             
             # Возврат ответа от микросервиса
             return response.json(), response.status_code
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ResilienceError) as e:
             return {'error': f'Service unavailable: {str(e)}'}, 503
     
+    def _call_upstream(self, service_name, method, endpoint, data=None, timeout=None, deadline=None):
+        """
+        Вызов микросервиса через Bulkhead, Circuit Breaker и политику повторов.
+        deadline (по time.monotonic()) ограничивает весь вызов: ожидание места
+        в Bulkhead, таймауты каждой попытки и паузы между повторами.
+        """
+        upstream = self.upstreams[service_name]
+        breaker = self.breakers[service_name]
+        bulkhead = self.bulkheads[service_name]
+        
+        def attempt():
+            attempt_timeout = timeout
+            max_wait = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceededError()
+                connect_timeout, read_timeout = timeout or upstream.timeout
+                attempt_timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+                max_wait = min(bulkhead.max_wait, remaining)
+            
+            bulkhead.acquire(max_wait)
+            try:
+                return breaker.call(upstream.request, method, endpoint, data, timeout=attempt_timeout,
+                                    is_failure=lambda response: response.status_code >= 500)
+            finally:
+                bulkhead.release()
+        
+        start_time = time.perf_counter()
+        outcome = 'error'
+        try:
+            if method not in self.RETRYABLE_METHODS:
+                response = attempt()
+            else:
+                response = self.retry_policy.call(attempt, deadline=deadline)
+            outcome = str(response.status_code)
+            return response
+        except DeadlineExceededError:
+            outcome = 'deadline'
+            raise
+        except ResilienceError:
+            outcome = 'rejected'
+            raise
+        finally:
+            # Время вызова вместе с повторами - то, что видит клиент шлюза
+            upstream_request_duration.observe(time.perf_counter() - start_time,
+                                              upstream=service_name, method=method, outcome=outcome)
+    
+    def get_pool_stats(self):
+        """Метрики пулов соединений по микросервисам"""
+        return {name: upstream.stats() for name, upstream in self.upstreams.items()}
+    
+    def get_resilience_stats(self):
+        """Состояние Circuit Breaker, Bulkhead и бюджета повторов"""
+        return {
+            'upstreams': {
+                name: {
+                    'circuit': self.breakers[name].stats(),
+                    'bulkhead': self.bulkheads[name].stats()
+                }
+                for name in self.upstreams
+            },
+            'retry_budget': self.retry_budget.stats()
+        }
+    
+    def close(self):
+        """Закрытие соединений со всеми микросервисами"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for upstream in self.upstreams.values():
+            upstream.close()
+    
     def handle_product_request(self):
         """Обработка запроса к сервису товаров через Facade"""
         endpoint = request.path.replace('/api/products', '')
@@ -78,30 +210,90 @@ class APIGateway:
         endpoint = request.path.replace('/api/payments', '')
         return self.route_request('payments', endpoint, request.method, request.json)
     
-    def get_aggregated_data(self, user_id):
-        """Получение агрегированных данных пользователя"""
-        # Сбор данных из нескольких сервисов
+    def register_section(self, name, service, endpoint, timeout=None):
+        """Добавление раздела агрегированных данных (endpoint может содержать {user_id})"""
+        if service not in self.upstreams:
+            raise ValueError(f"Unknown service: {service}")
+        self.aggregated_sections[name] = {'service': service, 'endpoint': endpoint, 'timeout': timeout}
+    
+    def _fetch_section(self, section, user_id, deadline):
+        """Запрос одного раздела агрегированных данных не дольше дедлайна"""
+        response = self._call_upstream(
+            section['service'],
+            'GET',
+            section['endpoint'].format(user_id=user_id),
+            deadline=deadline
+        )
+        if response.status_code != 200:
+            raise UpstreamError(f"HTTP {response.status_code}")
+        return response.json()
+    
+    def get_aggregated_data(self, user_id, sections=None, total_timeout=None):
+        """
+        Получение агрегированных данных пользователя.
+        Все разделы запрашиваются параллельно; у каждого свой дедлайн,
+        у агрегации в целом - общий бюджет времени. Дедлайн передается
+        в сам запрос раздела: future.cancel() не останавливает уже
+        начатый вызов, поэтому таймауты и повторы обрезаются по нему.
+        Разделы, не успевшие ответить или завершившиеся ошибкой,
+        попадают в errors, остальные возвращаются как есть
+        (частичный результат).
+        """
+        names = list(sections or self.aggregated_sections)
+        total_timeout = total_timeout or self.aggregation_timeout
+        
         aggregated_data = {
             'user_id': user_id,
-            'services': []
+            'services': [],
+            'errors': {},
+            'timings': {}
         }
         
-        # Получение данных о заказах
-        try:
-            orders_response = requests.get(f"{self.order_service_url}/users/{user_id}/orders")
-            if orders_response.status_code == 200:
-                aggregated_data['orders'] = orders_response.json()
-                aggregated_data['services'].append('orders')
-        except:
-            pass
+        start_time = time.monotonic()
+        futures = {}
+        deadlines = {}
+        for name in names:
+            section = self.aggregated_sections.get(name)
+            if section is None:
+                aggregated_data['errors'][name] = 'Unknown section'
+                continue
+            
+            timeout = min(section.get('timeout') or self.section_timeout, total_timeout)
+            deadline = start_time + timeout
+            future = self._executor.submit(self._fetch_section, section, user_id, deadline)
+            futures[future] = name
+            deadlines[future] = deadline
         
-        # Получение данных о корзине
-        try:
-            cart_response = requests.get(f"{self.order_service_url}/users/{user_id}/cart")
-            if cart_response.status_code == 200:
-                aggregated_data['cart'] = cart_response.json()
-                aggregated_data['services'].append('cart')
-        except:
-            pass
+        results = {}
+        pending = set(futures)
+        while pending:
+            next_deadline = min(deadlines[future] for future in pending)
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            
+            now = time.monotonic()
+            for future in done:
+                name = futures[future]
+                aggregated_data['timings'][name] = round((now - start_time) * 1000, 2)
+                try:
+                    results[name] = future.result()
+                except (requests.exceptions.RequestException, ResilienceError, UpstreamError, ValueError) as e:
+                    aggregated_data['errors'][name] = str(e)
+            
+            # Разделы с истекшим дедлайном больше не ждем
+            for future in [f for f in pending if deadlines[f] <= now]:
+                name = futures[future]
+                future.cancel()
+                aggregated_data['errors'][name] = 'Deadline exceeded'
+                aggregated_data['timings'][name] = round((now - start_time) * 1000, 2)
+                pending.discard(future)
+        
+        # Разделы в порядке объявления
+        for name in names:
+            if name in results:
+                aggregated_data[name] = results[name]
+                aggregated_data['services'].append(name)
         
-        return aggregated_data
\ No newline at end of file
+        aggregated_data['partial'] = bool(aggregated_data['errors'])
+        aggregated_data['elapsed_ms'] = round((time.monotonic() - start_time) * 1000, 2)
+        return aggregated_data
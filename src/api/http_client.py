@@ -0,0 +1,88 @@
+"""
+HTTP-клиент API Gateway с пулом keep-alive соединений к микросервисам
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamClient:
+    """
+    Клиент одного микросервиса: собственная сессия requests с пулом
+    соединений (keep-alive), таймаутами на подключение и чтение
+    и счетчиками использования пула.
+    """
+
+    def __init__(self, name, base_url, pool_size=10, connect_timeout=2.0, read_timeout=10.0, pool_block=True):
+        self.name = name
+        self.base_url = (base_url or '').rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        # pool_block=True: при исчерпании пула запрос ждет свободное соединение,
+        # а не открывает лишнее (иначе под нагрузкой заканчиваются порты)
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._lock = threading.Lock()
+        self.requests_count = 0
+        self.errors_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def request(self, method, endpoint, data=None, timeout=None):
+        """Отправка запроса; GET передает data как query-параметры, POST/PUT - как JSON"""
+        url = f"{self.base_url}{endpoint}"
+        kwargs = {'timeout': timeout or self.timeout}
+        if method == 'GET':
+            kwargs['params'] = data
+        elif method in ('POST', 'PUT'):
+            kwargs['json'] = data
+
+        with self._lock:
+            self.requests_count += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self.errors_count += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _connection_pools(self):
+        pools = self.adapter.poolmanager.pools
+        return [pools[key] for key in pools.keys() if key in pools]
+
+    def stats(self):
+        """Метрики использования пула соединений"""
+        opened = 0
+        idle = 0
+        for pool in self._connection_pools():
+            opened += pool.num_connections
+            # В очереди пула лежат простаивающие соединения и пустые слоты (None)
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+
+        with self._lock:
+            return {
+                'base_url': self.base_url,
+                'pool_size': self.pool_size,
+                'requests': self.requests_count,
+                'errors': self.errors_count,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'utilization': self.in_flight / self.pool_size if self.pool_size else 0.0,
+                'connections_opened': opened,
+                'idle_connections': idle
+            }
+
+    def close(self):
+        """Закрытие всех соединений пула"""
+        self.session.close()
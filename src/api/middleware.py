@@ -1,32 +1,48 @@
 import time
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 import json
+from src.api.rate_limiter import get_rate_limit_store
+from src.utils.request_logger import get_request_logger
+from src.utils.metrics import http_request_duration
 
-def rate_limit(max_requests, window_size):
-    """Middleware для ограничения скорости запросов"""
-    requests = {}
+def _rate_limit_identity(key_by):
+    """Идентификатор клиента для ключа ограничения"""
+    if callable(key_by):
+        return str(key_by())
+    
+    user_id = getattr(request, 'user_id', None)
+    if key_by == 'user' and user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.remote_addr}"
+
+def rate_limit(max_requests, window_size, key_by='ip', scope=None, store=None):
+    """
+    Middleware для ограничения скорости запросов (token bucket).
+    Корзина вмещает max_requests запросов и пополняется со скоростью
+    max_requests / window_size в секунду.
+    key_by: 'ip', 'user' (request.user_id после authenticate) или функция;
+    scope: имя маршрута в ключе (по умолчанию - имя обработчика);
+    store: хранилище, по умолчанию - из настройки RATE_LIMIT_STORAGE.
+    """
+    refill_rate = max_requests / window_size
     
     def decorator(f):
+        route = scope or f.__name__
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            ip = request.remote_addr
-            current_time = time.time()
-            
-            # Очистка старых записей
-            requests[ip] = [t for t in requests.get(ip, []) 
-                           if current_time - t < window_size]
+            limiter_store = store if store is not None else get_rate_limit_store(
+                current_app.config.get('RATE_LIMIT_STORAGE'))
+            key = f"{route}:{_rate_limit_identity(key_by)}"
             
-            # Проверка количества запросов
-            if len(requests[ip]) >= max_requests:
+            result = limiter_store.consume(key, max_requests, refill_rate)
+            if not result.allowed:
                 return jsonify({
                     'error': 'Too many requests',
-                    'retry_after': window_size,
+                    'retry_after': result.retry_after,
                     'timestamp': time.time()
-                }), 429
-            
-            # Добавление текущего запроса
-            requests[ip].append(current_time)
+                }), 429, {'Retry-After': str(result.retry_after)}
             
             return f(*args, **kwargs)
         return decorated_function
@@ -55,27 +71,42 @@ def authenticate(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _status_code(response):
+    """Код ответа обработчика: кортеж (data, status), объект Response или 200"""
+    if isinstance(response, tuple):
+        return response[1] if len(response) > 1 and isinstance(response[1], int) else 200
+    return getattr(response, 'status_code', 200)
+
 def log_request(f):
     """Middleware для логирования запросов"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         # Выполнение запроса
         response = f(*args, **kwargs)
         
+        response_time = time.perf_counter() - start_time
+        status_code = _status_code(response)
+        
+        # Гистограмма по шаблону маршрута, а не по пути: /products/<int:product_id> - одна серия
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        http_request_duration.observe(response_time, method=request.method, route=route, status=status_code)
+        
         # Логирование информации
         log_data = {
             'timestamp': time.time(),
             'method': request.method,
+            'route': route,
             'endpoint': request.path,
             'ip': request.remote_addr,
             'user_agent': request.user_agent.string if request.user_agent else 'Unknown',
-            'response_time': time.time() - start_time,
-            'status_code': response[1] if isinstance(response, tuple) else 200
+            'response_time': response_time,
+            'status_code': status_code
         }
         
-        print(f"Request log: {log_data}")
+        # Запись выполняется фоновым потоком пачками, поток запроса не ждет вывода
+        get_request_logger(current_app.config).log(log_data)
         
         return response
     return decorated_function
@@ -0,0 +1,212 @@
+"""
+Ограничение скорости запросов по алгоритму token bucket.
+Состояние ключа - два числа (токены и время обновления), проверка O(1).
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'remaining', 'retry_after'])
+
+
+def refill(tokens, updated_at, now, capacity, refill_rate):
+    """Количество токенов после пополнения за прошедшее время"""
+    return min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+
+
+def make_result(allowed, tokens, cost, refill_rate):
+    """Результат проверки; retry_after - время до накопления нужного числа токенов"""
+    retry_after = 0 if allowed else max(1, math.ceil((cost - tokens) / refill_rate))
+    return RateLimitResult(allowed, int(tokens), retry_after)
+
+
+class MemoryRateLimitStore:
+    """
+    Хранилище в памяти процесса.
+    Таблица ключей ограничена max_keys (вытесняются давно не использованные),
+    ключи без запросов дольше idle_timeout удаляются: их корзина уже полна,
+    и хранить ее незачем.
+    """
+
+    def __init__(self, max_keys=10000, idle_timeout=3600, clock=time.time):
+        self.max_keys = max_keys
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (tokens, updated_at), порядок - от давно использованных к недавним
+        self._buckets = OrderedDict()
+        self.evictions = 0
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = self._clock()
+        with self._lock:
+            self._evict_idle(now)
+
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = refill(tokens, updated_at, now, capacity, refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+
+        return make_result(allowed, tokens, cost, refill_rate)
+
+    def _evict_idle(self, now):
+        """Удаление простаивающих ключей (с начала LRU, амортизированно O(1))"""
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.idle_timeout:
+                break
+            del self._buckets[key]
+            self.evictions += 1
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteRateLimitStore:
+    """
+    Общее хранилище в файле SQLite: лимиты действуют для всех
+    процессов-воркеров на одном хосте. Проверка выполняется
+    в транзакции BEGIN IMMEDIATE, поэтому атомарна между процессами.
+    """
+
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path, idle_timeout=3600, clock=time.time):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._local = threading.local()
+        self._calls = 0
+
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = self._clock()
+            row = connection.execute(
+                'SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens = refill(tokens, updated_at, now, capacity, refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            connection.execute(
+                'INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now)
+            )
+
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                connection.execute(
+                    'DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - self.idle_timeout,)
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        return make_result(allowed, tokens, cost, refill_rate)
+
+    def reset(self):
+        self._connection().execute('DELETE FROM rate_limit_buckets')
+
+
+class RedisRateLimitStore:
+    """
+    Общее хранилище в Redis для нескольких хостов.
+    Пополнение и списание выполняются одним Lua-скриптом (атомарно),
+    время берется с сервера Redis, ключ истекает после idle_timeout.
+    """
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local ttl = tonumber(ARGV[4])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], ttl)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client=None, prefix='ratelimit:', idle_timeout=3600):
+        if client is None:
+            from src.models.database import DatabaseSingleton
+            client = DatabaseSingleton().get_redis_client()
+        self.client = client
+        self.prefix = prefix
+        self.idle_timeout = idle_timeout
+        self._script = client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        allowed, tokens = self._script(
+            keys=[f"{self.prefix}{key}"],
+            args=[capacity, refill_rate, cost, self.idle_timeout]
+        )
+        return make_result(bool(allowed), float(tokens), cost, refill_rate)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_rate_limit_store(uri=None):
+    """
+    Хранилище по URI из настройки RATE_LIMIT_STORAGE:
+    'memory' (по умолчанию), 'sqlite:///path/to/file.db' или 'redis'.
+    Экземпляры переиспользуются в пределах процесса.
+    """
+    uri = uri or 'memory'
+    with _stores_lock:
+        store = _stores.get(uri)
+        if store is None:
+            if uri == 'memory':
+                store = MemoryRateLimitStore()
+            elif uri.startswith('sqlite:///'):
+                store = SQLiteRateLimitStore(uri[len('sqlite:///'):])
+            elif uri == 'redis':
+                store = RedisRateLimitStore()
+            else:
+                raise ValueError(f"Unknown rate limit storage: {uri}")
+            _stores[uri] = store
+        return store
@@ -0,0 +1,321 @@
+"""
+Отказоустойчивость вызовов микросервисов:
+Circuit Breaker, повторы с экспоненциальной задержкой и Bulkhead
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from src.utils.decorators import exponential_backoff
+
+
+class ResilienceError(Exception):
+    """Вызов отклонен без обращения к микросервису"""
+    pass
+
+
+class CircuitOpenError(ResilienceError):
+    """Цепь разомкнута - микросервис временно считается недоступным"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+
+
+class BulkheadFullError(ResilienceError):
+    """Исчерпан лимит одновременных вызовов микросервиса"""
+
+    def __init__(self, name):
+        self.name = name
+        super().__init__(f"Too many concurrent calls to '{name}'")
+
+
+class DeadlineExceededError(ResilienceError):
+    """Дедлайн вызова истек - новая попытка не начинается"""
+
+    def __init__(self):
+        super().__init__('Deadline exceeded')
+
+
+class CircuitBreaker:
+    """
+    Circuit Breaker с тремя состояниями:
+    closed - вызовы проходят, результаты копятся в скользящем окне;
+    open - доля ошибок в окне превысила порог, вызовы сразу отклоняются;
+    half_open - после recovery_timeout пропускается несколько пробных вызовов,
+    успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, window_size=20, min_calls=5,
+                 recovery_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._half_open_calls = 0
+        self._changes = []
+        self.rejected = 0
+        self.transitions = 0
+
+    @contextmanager
+    def _locked(self):
+        """Захват блокировки; о сменах состояния сообщается уже после ее освобождения"""
+        with self._lock:
+            yield
+            changes, self._changes = self._changes, []
+        for state in changes:
+            print(f"Circuit '{self.name}' -> {state}")
+
+    @property
+    def state(self):
+        with self._locked():
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        """Переход open -> half_open по истечении recovery_timeout"""
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._transition(self.HALF_OPEN)
+
+    def _transition(self, state):
+        self._state = state
+        self.transitions += 1
+        if state == self.OPEN:
+            self._opened_at = self._clock()
+        elif state == self.CLOSED:
+            self._window.clear()
+        self._half_open_calls = 0
+        self._changes.append(state)
+
+    def allow_request(self):
+        """Разрешение вызова (в half_open - не больше half_open_max_calls пробных)"""
+        with self._locked():
+            self._refresh_state()
+
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._locked():
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+            else:
+                self._window.append(True)
+
+    def record_failure(self):
+        with self._locked():
+            if self._state == self.HALF_OPEN:
+                self._transition(self.OPEN)
+                return
+
+            self._window.append(False)
+            if self._state == self.CLOSED and len(self._window) >= self.min_calls:
+                failures = self._window.count(False)
+                if failures / len(self._window) >= self.failure_rate:
+                    self._transition(self.OPEN)
+
+    def retry_after(self):
+        """Секунды до пробного вызова"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (self._clock() - self._opened_at))
+
+    def call(self, func, *args, is_failure=None, **kwargs):
+        """
+        Вызов через Circuit Breaker.
+        is_failure(result) позволяет считать ошибкой успешно вернувшийся результат (например, HTTP 5xx).
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+
+        if is_failure and is_failure(result):
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+    def stats(self):
+        with self._locked():
+            self._refresh_state()
+            calls = len(self._window)
+            failures = self._window.count(False)
+            return {
+                'state': self._state,
+                'calls_in_window': calls,
+                'failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'rejected': self.rejected,
+                'transitions': self.transitions
+            }
+
+
+class CircuitBreakerRegistry:
+    """Реестр Circuit Breaker'ов процесса (по одному на микросервис)"""
+
+    _breakers = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name, **options):
+        """Получение или создание Circuit Breaker по имени"""
+        with cls._lock:
+            breaker = cls._breakers.get(name)
+            if breaker is None:
+                breaker = cls._breakers[name] = CircuitBreaker(name, **options)
+            return breaker
+
+    @classmethod
+    def states(cls):
+        """Состояние всех Circuit Breaker'ов"""
+        with cls._lock:
+            breakers = dict(cls._breakers)
+        return {name: breaker.stats() for name, breaker in breakers.items()}
+
+    @classmethod
+    def reset(cls):
+        """Удаление всех Circuit Breaker'ов"""
+        with cls._lock:
+            cls._breakers.clear()
+
+
+class RetryBudget:
+    """
+    Бюджет повторов: каждый запрос пополняет бюджет на ratio,
+    каждый повтор расходует единицу. При массовых ошибках число
+    повторов ограничено долей от трафика и не умножает нагрузку.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, max_balance=None):
+        self.ratio = ratio
+        self.max_balance = max_balance or max(min_retries, 100)
+        self._balance = float(min_retries)
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def record_request(self):
+        with self._lock:
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def can_retry(self):
+        """Списание одного повтора из бюджета"""
+        with self._lock:
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {'balance': round(self._balance, 2), 'exhausted': self.exhausted}
+
+
+class RetryPolicy:
+    """Повторы с экспоненциальной задержкой, jitter и бюджетом"""
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=2.0, jitter=True,
+                 retry_on=(Exception,), budget=None, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_on = retry_on
+        self.budget = budget
+        self._sleep = sleep
+
+    def call(self, func, *args, deadline=None, **kwargs):
+        """
+        Вызов func с повторами. deadline - момент по time.monotonic(),
+        после которого попытки не начинаются: если задержка перед
+        повтором выходит за него, выбрасывается последняя ошибка.
+        """
+        if self.budget:
+            self.budget.record_request()
+
+        for attempt in range(self.max_attempts):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceededError()
+            try:
+                return func(*args, **kwargs)
+            except ResilienceError:
+                # Отказ Circuit Breaker или Bulkhead не повторяется
+                raise
+            except self.retry_on:
+                if attempt == self.max_attempts - 1:
+                    raise
+                if self.budget and not self.budget.can_retry():
+                    raise
+                delay = exponential_backoff(attempt, self.base_delay, self.max_delay, self.jitter)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                self._sleep(delay)
+
+
+class Bulkhead:
+    """Ограничение числа одновременных вызовов микросервиса"""
+
+    def __init__(self, name, max_concurrent=10, max_wait=0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self, max_wait=None):
+        """Занять место; ожидание не дольше max_wait (по умолчанию - self.max_wait)"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        if max_wait > 0:
+            acquired = self._semaphore.acquire(timeout=max_wait)
+        else:
+            acquired = self._semaphore.acquire(blocking=False)
+
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFullError(self.name)
+        with self._lock:
+            self.active += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'max_concurrent': self.max_concurrent, 'rejected': self.rejected}
@@ -3,6 +3,8 @@ from src.controllers import UserController, ProductController, OrderController,
 from src.services.facade.ecommerce_facade import ECommerceFacade
 from src.controllers.payment_strategy import PaymentContext, CreditCardPayment, PayPalPayment
 from src.api.middleware import authenticate, log_request
+from src.api.resilience import CircuitBreaker, CircuitBreakerRegistry
+from src.utils.metrics import metrics_registry, PROMETHEUS_CONTENT_TYPE
 from datetime import datetime
 
 def init_routes(app):
@@ -144,8 +146,50 @@ def init_routes(app):
     @app.route('/api/products', methods=['GET'])
     def api_get_products():
         from src.models import Product
-        products = Product.get_all()
-        return jsonify([p.to_dict() for p in products])
+        from src.utils.helpers import Helpers
+        
+        # Без page/per_page/cursor - весь список, как до пагинации: клиенты,
+        # не знающие о страницах, получают все товары. Иначе - keyset-страница
+        # по id: ?cursor=<X-Next-Cursor>. Тело ответа - всегда массив товаров,
+        # сведения о странице - в заголовках X-Has-Next и X-Next-Cursor
+        if not any(arg in request.args for arg in ('page', 'per_page', 'cursor')):
+            response = jsonify([p.to_dict() for p in Product.get_all()])
+            response.headers['X-Has-Next'] = 'false'
+            return response
+        
+        try:
+            pagination = Helpers.paginate(
+                Product.query,
+                page=max(request.args.get('page', 1, type=int), 1),
+                per_page=min(max(request.args.get('per_page', 50, type=int), 1), 200),
+                count=False,
+                cursor=request.args.get('cursor'),
+                keyset=(Product.id,)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify([p.to_dict() for p in pagination['items']])
+        response.headers['X-Has-Next'] = 'true' if pagination['has_next'] else 'false'
+        if pagination['next_cursor']:
+            response.headers['X-Next-Cursor'] = pagination['next_cursor']
+        return response
+    
+    # Поиск с фильтрами, сортировкой и пагинацией
+    @app.route('/api/products/search', methods=['GET'])
+    def api_search_products():
+        filters = {
+            'keyword': request.args.get('q', ''),
+            'category': request.args.get('category'),
+            'min_price': request.args.get('min_price', type=float),
+            'max_price': request.args.get('max_price', type=float),
+            'sort_by': request.args.get('sort_by', 'name'),
+            'page': max(request.args.get('page', 1, type=int), 1),
+            'per_page': min(max(request.args.get('per_page', 20, type=int), 1), 100),
+            'cursor': request.args.get('cursor')
+        }
+        result = ECommerceFacade().search_products_advanced(filters)
+        return jsonify(result), 200 if result['success'] else 400
     
     # Фасад для покупки
     @app.route('/api/purchase', methods=['POST'])
@@ -184,28 +228,38 @@ def init_routes(app):
     # API для адаптеров
     @app.route('/api/shipping/calculate', methods=['POST'])
     def calculate_shipping():
-        from src.api.adapters.shipping_adapter import ShippingAdapter, FedExService
+        from src.api.adapters.shipping_quotes import get_shipping_quote_engine
         
         data = request.json
-        adapter = ShippingAdapter(FedExService())
-        result = adapter.calculate_shipping(
+        # Тарифы всех служб доставки: параллельно и с кэшем по зоне и размерам
+        result = get_shipping_quote_engine().quote(
             address=data['address'],
             weight=data['weight'],
             dimensions=data['dimensions']
         )
+        if not result['quotes']:
+            return jsonify({'error': 'No shipping carrier is available', 'errors': result['errors']}), 503
         
         return jsonify(result)
     
     # Health check для микросервисов
     @app.route('/health', methods=['GET'])
     def health_check():
+        breakers = CircuitBreakerRegistry.states()
+        degraded = any(b['state'] != CircuitBreaker.CLOSED for b in breakers.values())
         return jsonify({
-            'status': 'healthy',
+            'status': 'degraded' if degraded else 'healthy',
             'service': 'ecommerce-store',
             'version': '1.0.0',
+            'circuit_breakers': breakers,
             'timestamp': datetime.now().isoformat()
         })
     
+    # Метрики в текстовом формате Prometheus
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return metrics_registry.render(), 200, {'Content-Type': PROMETHEUS_CONTENT_TYPE}
+    
     # Пример маршрута с использованием фабрики
     @app.route('/api/create-user', methods=['POST'])
     def api_create_user():
@@ -1,8 +1,6 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
-import threading
-import queue
 import time
 from datetime import datetime
 
@@ -43,35 +41,32 @@ def init_database():
             db.session.commit()
             print("Демо данные созданы")
 
-# Очередь для Producer-Consumer pattern
-task_queue = queue.Queue()
-result_queue = queue.Queue()
+# Фоновые задачи (Producer-Consumer), создаются в init_app
+task_engine = None
 
 # Импорт после инициализации приложения
 from src.models import User, Product, Order, Cart
 from src.controllers import UserController, ProductController, OrderController, CartController
 from src.api.routes import init_routes
-from src.utils.producers_consumers import Producer, Consumer
+from src.utils.producers_consumers import create_task_engine
+from src.services.notification_service import NotificationService
+from src.services.task_handlers import default_task_handlers
 
 def init_app():
     """Инициализация приложения"""
+    global task_engine
+    
     # Инициализация базы данных
     init_database()
     
     # Регистрация маршрутов
     init_routes(app)
     
-    # Запуск Producer-Consumer потоков (опционально, для демонстрации)
+    # Запуск пула потребителей фоновых задач
     try:
-        producer = Producer(task_queue)
-        consumer = Consumer(task_queue, result_queue)
-        
-        producer_thread = threading.Thread(target=producer.run, daemon=True)
-        consumer_thread = threading.Thread(target=consumer.run, daemon=True)
-        
-        producer_thread.start()
-        consumer_thread.start()
-        print("Producer-Consumer потоки запущены")
+        handlers = default_task_handlers(NotificationService(app.config))
+        task_engine = create_task_engine(handlers, app.config, app=app).start()
+        print(f"Фоновые задачи: запущено потребителей - {len(task_engine.consumers)}")
     except Exception as e:
         print(f"Ошибка при запуске потоков: {e}")
     
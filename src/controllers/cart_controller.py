@@ -12,7 +12,7 @@ class CartController(BaseController):
     def index(self):
         """Получение корзины (GET /cart)"""
         # В реальном приложении здесь была бы аутентификация
-        cart = self._get_or_create_cart()
+        cart = self._get_or_create_cart(with_products=True)
         return self.view.render('cart.html', cart=cart)
     
     def show(self, cart_id):
@@ -108,11 +108,11 @@ class CartController(BaseController):
         cart.clear()
         return self.view.render('cart_cleared.html', cart=cart), 200
     
-    def _get_or_create_cart(self):
+    def _get_or_create_cart(self, with_products=False):
         """Получение или создание корзины для текущего пользователя/сессии"""
         # В реальном приложении здесь была бы логика аутентификации
         # Для демонстрации используем фиксированный user_id
-        cart = Cart.get_by_user(1)  # Демо пользователь
+        cart = Cart.get_by_user(1, with_products=with_products)  # Демо пользователь
         
         if not cart:
             cart = Cart(user_id=1)
@@ -1,14 +1,15 @@
 from src.controllers.base_controller import BaseController
-from src.models import Order, Product, Cart
+from src.models import Order, Product, Cart, InsufficientStockError
 from src.views import TemplateView
 from src.views.notifications import OrderNotifier, EmailNotifier
+from src.utils.event_dispatcher import get_event_dispatcher
 
 class OrderController(BaseController):
     """Контроллер для управления заказами"""
     
     def __init__(self):
         self.view = TemplateView()
-        self.notifier = OrderNotifier()
+        self.notifier = OrderNotifier(dispatcher=get_event_dispatcher())
         
         # Добавляем наблюдателей
         email_notifier = EmailNotifier()
@@ -32,40 +33,35 @@ class OrderController(BaseController):
         """Создание нового заказа (POST /orders)"""
         data = self.get_request_data()
         
-        # Получение корзины пользователя
-        cart = Cart.get_by_user(1)  # Демо пользователь
+        # Получение корзины пользователя вместе с товарами
+        cart = Cart.get_by_user(1, with_products=True)  # Демо пользователь
         if not cart or not cart.items:
             return self.view.error_response('Cart is empty', 400)
         
         # Подготовка данных для создания заказа
         items_data = []
+        products = {}
         for item in cart.items:
-            # Проверка наличия товара
-            product = Product.get_by_id(item.product_id)
-            if product.stock < item.quantity:
-                return self.view.error_response(
-                    f'Not enough stock for product: {product.name}',
-                    400
-                )
-            
+            products[item.product_id] = item.product
             items_data.append({
                 'product_id': item.product_id,
                 'quantity': item.quantity,
-                'price': product.price
+                'price': item.product.price
             })
         
-        # Создание заказа
-        order = Order.create(
-            user_id=1,  # Демо пользователь
-            items_data=items_data,
-            shipping_address=data.get('shipping_address'),
-            payment_method=data.get('payment_method', 'credit_card')
-        )
-        
-        # Уменьшение количества товара на складе
-        for item in cart.items:
-            product = Product.get_by_id(item.product_id)
-            product.reduce_stock(item.quantity)
+        # Резервирование товара и создание заказа одной транзакцией
+        try:
+            order = Order.create(
+                user_id=1,  # Демо пользователь
+                items_data=items_data,
+                shipping_address=data.get('shipping_address'),
+                payment_method=data.get('payment_method', 'credit_card')
+            )
+        except InsufficientStockError as e:
+            return self.view.error_response(
+                f'Not enough stock for product: {products[e.product_id].name}',
+                400
+            )
         
         # Очистка корзины
         cart.clear()
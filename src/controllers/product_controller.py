@@ -1,5 +1,7 @@
 from src.controllers.base_controller import BaseController
+from flask import request
 from src.models import Product
+from src.utils.helpers import Helpers
 from src.views import TemplateView
 
 class ProductController(BaseController):
@@ -9,9 +11,19 @@ class ProductController(BaseController):
         self.view = TemplateView()
     
     def index(self):
-        """Получение списка товаров (GET /products)"""
-        products = Product.get_all()
-        return self.view.render('product_list.html', products=products)
+        """
+        Получение списка товаров (GET /products).
+        Без page/per_page - весь список, как раньше; с ними - одна страница.
+        """
+        if 'page' not in request.args and 'per_page' not in request.args:
+            return self.view.render('product_list.html', products=Product.get_all(), pagination=None)
+        
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        
+        # Из базы читается только текущая страница
+        pagination = Helpers.paginate(Product.query.order_by(Product.id), page, per_page)
+        return self.view.render('product_list.html', products=pagination['items'], pagination=pagination)
     
     def show(self, product_id):
         """Получение товара по ID (GET /products/:id)"""
@@ -1,6 +1,10 @@
 from flask import request, jsonify, render_template
 from src.models import User
 from src import db
+from src.utils.helpers import Helpers
+from src.utils.password_hasher import (
+    get_password_hasher, encode_password_hash, PasswordHasherBusyError, PBKDF2_ITERATIONS
+)
 
 class UserController:
     """Контроллер для управления пользователями"""
@@ -26,11 +30,18 @@ class UserController:
         if not data.get('username') or not data.get('email'):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        # В реальном приложении здесь должно быть хеширование пароля
+        # PBKDF2 считается в пуле процессов, если он включен (PASSWORD_HASH_OFFLOAD)
+        password = data.get('password', '')
+        hasher = get_password_hasher()
+        try:
+            hashed = hasher.hash_password(password) if hasher else Helpers.hash_password(password)
+        except (PasswordHasherBusyError, TimeoutError):
+            return jsonify({'error': 'Service is busy, try again later'}), 503
+        
         user = User.create(
             username=data['username'],
             email=data['email'],
-            password_hash=data.get('password', '')
+            password_hash=encode_password_hash(hashed, hasher.iterations if hasher else PBKDF2_ITERATIONS)
         )
         
         return render_template('user_created.html', user=user), 201
@@ -2,7 +2,7 @@ from src import db  # Импортируем db из основного моду
 
 # Импорт моделей
 from src.models.user import User
-from src.models.product import Product
+from src.models.product import Product, InsufficientStockError
 from src.models.order import Order
 from src.models.cart import Cart
 from src.models.database import DatabaseSingleton
@@ -16,6 +16,7 @@ __all__ = [
     'db',  # Добавляем db в экспорт
     'User',
     'Product', 
+    'InsufficientStockError',
     'Order',
     'Cart',
     'OrderItem',
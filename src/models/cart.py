@@ -1,6 +1,7 @@
 from src import db
 from src.models.base_model import BaseModel
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 class Cart(db.Model, BaseModel):
     """Модель корзины покупателя"""
@@ -21,14 +22,22 @@ class Cart(db.Model, BaseModel):
     
     def to_dict(self):
         """Преобразование в словарь"""
+        # Позиции, подытоги и итог считаются за один проход по items
+        items = []
+        total = 0
+        for item in self.items:
+            item_data = item.to_dict()
+            total += item_data['subtotal']
+            items.append(item_data)
+        
         return {
             'id': self.id,
             'user_id': self.user_id,
             'session_id': self.session_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'items': [item.to_dict() for item in self.items],
-            'total': self.get_total()
+            'items': items,
+            'total': total
         }
     
     def save(self):
@@ -54,9 +63,21 @@ class Cart(db.Model, BaseModel):
         return cls.query.all()
     
     @classmethod
-    def get_by_user(cls, user_id):
-        """Получение корзины пользователя"""
-        return cls.query.filter_by(user_id=user_id).first()
+    def get_by_user(cls, user_id, with_products=False):
+        """
+        Получение корзины пользователя.
+        При with_products=True позиции и товары загружаются одним запросом (без N+1).
+        """
+        query = cls.query.filter_by(user_id=user_id)
+        if with_products:
+            query = query.options(cls._eager_items())
+        return query.first()
+    
+    @staticmethod
+    def _eager_items():
+        """Опция жадной загрузки позиций корзины вместе с товарами"""
+        from src.models.cart_item import CartItem
+        return joinedload(Cart.items).joinedload(CartItem.product)
     
     @classmethod
     def get_by_session(cls, session_id):
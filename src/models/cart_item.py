@@ -19,6 +19,8 @@ class CartItem(db.Model):
     
     def to_dict(self):
         """Преобразование в словарь"""
+        # Товар читается один раз и для сериализации, и для подытога
+        product = self.product
         return {
             'id': self.id,
             'cart_id': self.cart_id,
@@ -26,8 +28,8 @@ class CartItem(db.Model):
             'quantity': self.quantity,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'product': self.product.to_dict() if self.product else None,
-            'subtotal': self.get_subtotal()
+            'product': product.to_dict() if product else None,
+            'subtotal': product.price * self.quantity if product else 0
         }
     
     def save(self):
@@ -7,11 +7,16 @@ class Order(db.Model, BaseModel):
     """Модель заказа"""
     __tablename__ = 'orders'
     
+    # Статусы, после которых заказ больше не меняется
+    TERMINAL_STATUSES = ('delivered', 'cancelled')
+    # Статусы, из которых заказ можно передать в доставку
+    SHIPPABLE_STATUSES = ('pending', 'paid')
+    
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(50), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     total_amount = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(50), default='pending')  # pending, paid, shipped, delivered, cancelled
+    status = db.Column(db.String(50), default='pending')  # pending, paid, shipping, shipped, delivered, cancelled
     shipping_address = db.Column(db.Text)
     billing_address = db.Column(db.Text)
     payment_method = db.Column(db.String(50))
@@ -85,9 +90,13 @@ class Order(db.Model, BaseModel):
         return cls.query.filter_by(user_id=user_id).all()
     
     @classmethod
-    def create(cls, user_id, items_data, shipping_address=None, payment_method=None):
-        """Создание нового заказа"""
-        from src.models.order_item import OrderItem
+    def create(cls, user_id, items_data, shipping_address=None, payment_method=None,
+               reserve_stock=True, commit=True):
+        """
+        Создание нового заказа.
+        Резервирование товара, заказ и позиции фиксируются одной транзакцией.
+        """
+        from src.models.product import Product
         
         # Расчет общей суммы
         total_amount = sum(item['price'] * item['quantity'] for item in items_data)
@@ -99,21 +108,41 @@ class Order(db.Model, BaseModel):
             payment_method=payment_method
         )
         
-        order.save()
+        try:
+            if reserve_stock:
+                Product.reserve_stock(items_data, commit=False)
+            
+            db.session.add(order)
+            db.session.flush()  # Получение order.id без фиксации транзакции
+            cls._insert_items([(order, items_data)])
+            
+            if commit:
+                db.session.commit()
+        except Exception:
+            if commit:
+                db.session.rollback()
+            raise
         
-        # Создание позиций заказа
-        for item_data in items_data:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item_data['product_id'],
-                quantity=item_data['quantity'],
-                price=item_data['price']
-            )
-            db.session.add(order_item)
-        
-        db.session.commit()
         return order
     
+    @staticmethod
+    def _insert_items(orders_with_items):
+        """Пакетная вставка позиций для уже сохраненных (flush) заказов"""
+        from src.models.order_item import OrderItem
+        
+        mappings = [
+            {
+                'order_id': order.id,
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'price': item['price']
+            }
+            for order, items_data in orders_with_items
+            for item in items_data
+        ]
+        if mappings:
+            db.session.bulk_insert_mappings(OrderItem, mappings)
+    
     def update_status(self, new_status):
         """Обновление статуса заказа"""
         self.status = new_status
@@ -1,6 +1,18 @@
 from src import db
 from src.models.base_model import BaseModel
 from datetime import datetime
+from sqlalchemy import event, inspect, update
+from src.utils.cache import EntityCache
+from src.utils.transaction_hooks import on_commit
+
+
+class InsufficientStockError(ValueError):
+    """Недостаточно товара на складе для резервирования"""
+    
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f"Product {product_id} is not available")
 
 class Product(db.Model, BaseModel):
     """Модель товара"""
@@ -21,6 +33,9 @@ class Product(db.Model, BaseModel):
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     
+    # Максимальное число параметров в одном запросе IN
+    IN_BATCH_SIZE = 900
+    
     def __init__(self, name, price, category, stock=0, description="", sku=None, image_url=None):
         self.name = name
         self.price = price
@@ -67,6 +82,14 @@ class Product(db.Model, BaseModel):
         """Получение всех товаров"""
         return cls.query.all()
     
+    @classmethod
+    def get_by_ids(cls, product_ids):
+        """Получение нескольких товаров одним запросом (IN)"""
+        product_ids = list(set(product_ids))
+        if not product_ids:
+            return []
+        return cls.query.filter(cls.id.in_(product_ids)).all()
+    
     @classmethod
     def create(cls, **kwargs):
         """Создание нового товара"""
@@ -80,22 +103,122 @@ class Product(db.Model, BaseModel):
     
     @classmethod
     def search(cls, keyword):
-        """Поиск товаров по ключевому слову"""
-        return cls.query.filter(
-            (cls.name.ilike(f'%{keyword}%')) | 
-            (cls.description.ilike(f'%{keyword}%'))
-        ).all()
+        """Поиск товаров по ключевому слову (через инвертированный индекс)"""
+        from src.services.search_index import product_search_index
+        
+        ranked_ids = [product_id for product_id, _ in product_search_index.search(keyword)]
+        return cls.get_ranked(ranked_ids)
+    
+    @classmethod
+    def get_ranked(cls, ranked_ids, query=None):
+        """Загрузка товаров по списку ID с сохранением порядка ранжирования"""
+        query = query if query is not None else cls.query
+        
+        products = {}
+        # Пакеты не превышают лимит параметров SQLite
+        for start in range(0, len(ranked_ids), cls.IN_BATCH_SIZE):
+            batch = ranked_ids[start:start + cls.IN_BATCH_SIZE]
+            for product in query.filter(cls.id.in_(batch)).all():
+                products[product.id] = product
+        
+        return [products[product_id] for product_id in ranked_ids if product_id in products]
+    
+    @staticmethod
+    def _aggregate_quantities(items):
+        """Суммирование количества по товарам (dict или список позиций заказа)"""
+        if isinstance(items, dict):
+            items = [{'product_id': pid, 'quantity': qty} for pid, qty in items.items()]
+        
+        quantities = {}
+        for item in items:
+            product_id = item['product_id']
+            quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+        return quantities
+    
+    @classmethod
+    def reserve_stock(cls, items, commit=True):
+        """
+        Атомарное резервирование товара для всех позиций заказа.
+        Каждая позиция списывается условным UPDATE ... WHERE stock >= :qty,
+        при нехватке хотя бы одного товара не списывается ничего.
+        """
+        quantities = cls._aggregate_quantities(items)
+        
+        try:
+            # Фиксированный порядок блокировок исключает взаимоблокировки
+            for product_id in sorted(quantities):
+                quantity = quantities[product_id]
+                result = db.session.execute(
+                    update(cls)
+                    .where(cls.id == product_id, cls.stock >= quantity)
+                    .values(stock=cls.stock - quantity)
+                    .execution_options(synchronize_session='fetch')
+                )
+                if result.rowcount != 1:
+                    raise InsufficientStockError(product_id, quantity)
+            
+            if commit:
+                db.session.commit()
+        except Exception:
+            # Без commit откат остается за вызывающим кодом (общая транзакция)
+            if commit:
+                db.session.rollback()
+            raise
+        
+        # Массовый UPDATE не вызывает событий маппера - снимки сбрасываются явно
+        cls._invalidate_cached(quantities)
+        return quantities
+    
+    @classmethod
+    def release_stock(cls, items, commit=True):
+        """Возврат зарезервированного товара на склад"""
+        quantities = cls._aggregate_quantities(items)
+        
+        for product_id in sorted(quantities):
+            db.session.execute(
+                update(cls)
+                .where(cls.id == product_id)
+                .values(stock=cls.stock + quantities[product_id])
+                .execution_options(synchronize_session='fetch')
+            )
+        
+        if commit:
+            db.session.commit()
+        
+        cls._invalidate_cached(quantities)
+        return quantities
+    
+    @staticmethod
+    def _invalidate_cached(product_ids):
+        """Сброс кэшированных снимков товаров после commit текущей транзакции"""
+        product_ids = list(product_ids)
+        
+        def invalidate():
+            for product_id in product_ids:
+                EntityCache.invalidate_everywhere('product', product_id)
+        
+        on_commit(db.session(), invalidate)
     
     def reduce_stock(self, quantity):
         """Уменьшение количества товара на складе"""
-        if self.stock >= quantity:
-            self.stock -= quantity
-            self.save()
-            return True
-        return False
+        try:
+            self.reserve_stock({self.id: quantity})
+        except InsufficientStockError:
+            return False
+        return True
     
     def increase_stock(self, quantity):
         """Увеличение количества товара на складе"""
-        self.stock += quantity
-        self.save()
-        return True
\ No newline at end of file
+        self.release_stock({self.id: quantity})
+        return True
+
+
+# ========== Инвалидация кэша сущностей ==========
+# Снимок сбрасывается после commit: при сбросе во время flush другой поток
+# успевал закэшировать еще не зафиксированные (или откаченные) данные
+
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def _invalidate_cached_product(mapper, connection, target):
+    product_id = target.id
+    on_commit(inspect(target).session, lambda: EntityCache.invalidate_everywhere('product', product_id))
@@ -1,5 +1,8 @@
 from src import db
+from src.utils.cache import EntityCache
 from datetime import datetime
+from sqlalchemy import event, inspect
+from src.utils.transaction_hooks import on_commit
 
 class User(db.Model):
     """Модель пользователя"""
@@ -58,4 +61,14 @@ class User(db.Model):
     def delete(self):
         """Удалить пользователя"""
         db.session.delete(self)
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+
+# ========== Инвалидация кэша сущностей ==========
+# Как и для товаров, снимок сбрасывается только после commit
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    user_id = target.id
+    on_commit(inspect(target).session, lambda: EntityCache.invalidate_everywhere('user', user_id))
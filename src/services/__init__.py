@@ -2,10 +2,12 @@ from src.services.product_service import ProductService
 from src.services.order_service import OrderService
 from src.services.payment_service import PaymentService
 from src.services.notification_service import NotificationService
+from src.services.search_index import ProductSearchIndex
 
 __all__ = [
     'ProductService',
     'OrderService',
     'PaymentService',
-    'NotificationService'
+    'NotificationService',
+    'ProductSearchIndex'
 ]
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Шаблоны писем: Jinja2-шаблоны компилируются один раз, общие для всех
+получателей части кэшируются, при отправке подставляются только поля
+конкретного получателя
+"""
+
+import os
+import re
+import threading
+from collections import namedtuple
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from markupsafe import escape
+
+
+TEMPLATE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'views', 'templates', 'email'))
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'body', 'html_body'])
+
+# Маркер поля получателя: управляющий символ не встречается в шаблонах и не экранируется
+_FIELD_MARK = '\x00'
+_FIELD_PATTERN = re.compile('\x00([A-Za-z_][A-Za-z0-9_]*)\x00')
+
+
+class _CompiledPart:
+    """
+    Часть письма (тема, текст или HTML), отрендеренная с общим контекстом.
+    Поля получателя на этом шаге заменены маркерами, поэтому результат -
+    чередование готовых статических фрагментов и имен полей.
+    """
+
+    __slots__ = ('chunks', 'fields', 'html')
+
+    def __init__(self, template, static_context, fields, html):
+        markers = {name: f'{_FIELD_MARK}{name}{_FIELD_MARK}' for name in fields}
+        rendered = template.render({**static_context, **markers})
+
+        parts = _FIELD_PATTERN.split(rendered)
+        # Нечетные элементы - имена полей, четные - статический текст
+        self.chunks = parts
+        self.fields = set(parts[1::2])
+        self.html = html
+
+        unknown = self.fields - set(fields)
+        if unknown or _FIELD_MARK in ''.join(parts[0::2]):
+            raise ValueError(f"Template {template.name} uses recipient fields outside of plain substitutions")
+
+    def render(self, values):
+        convert = escape if self.html else str
+        chunks = self.chunks
+        out = [chunks[0]]
+        for i in range(1, len(chunks), 2):
+            out.append(convert(values[chunks[i]]))
+            out.append(chunks[i + 1])
+        return ''.join(out)
+
+
+class EmailTemplate:
+    """
+    Письмо из шаблонов темы, текста и (необязательно) HTML.
+    fields - поля получателя; они должны использоваться в шаблоне как
+    простые подстановки {{ field }} (без условий и фильтров), все
+    остальное вычисляется один раз из static_context.
+    """
+
+    def __init__(self, name, subject, text, html=None, fields=(), static_context=None, environment=None):
+        self.name = name
+        self.fields = tuple(fields)
+        env = environment or default_environment()
+        context = dict(static_context or {})
+
+        self._subject = _CompiledPart(env.from_string(subject), context, self.fields, html=False)
+        self._text = _CompiledPart(env.get_template(text), context, self.fields, html=False)
+        self._html = _CompiledPart(env.get_template(html), context, self.fields, html=True) if html else None
+
+    def render(self, **values):
+        """Письмо для одного получателя"""
+        missing = [name for name in self.fields if name not in values]
+        if missing:
+            raise KeyError(f"Template {self.name} requires fields: {', '.join(missing)}")
+
+        return RenderedEmail(
+            self._subject.render(values),
+            self._text.render(values),
+            self._html.render(values) if self._html else None
+        )
+
+    def render_batch(self, recipients):
+        """Письма для списка получателей (словари полей) в том же порядке"""
+        return [self.render(**values) for values in recipients]
+
+
+_environment = None
+
+
+def default_environment():
+    """Общее окружение Jinja2: шаблоны из views/templates/email, компиляция кэшируется"""
+    global _environment
+    if _environment is None:
+        _environment = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            autoescape=select_autoescape(['html'], default_for_string=False),
+            undefined=StrictUndefined,
+            keep_trailing_newline=False
+        )
+    return _environment
+
+
+class EmailTemplates:
+    """
+    Реестр шаблонов писем.
+    Шаблон компилируется при первом обращении и далее берется из кэша.
+    """
+
+    def __init__(self, static_context=None, environment=None):
+        self.static_context = dict(static_context or {})
+        self.environment = environment
+        self._definitions = {}
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, subject, text, html=None, fields=()):
+        """Регистрация шаблона; text и html - имена файлов шаблонов"""
+        with self._lock:
+            self._definitions[name] = {'subject': subject, 'text': text, 'html': html, 'fields': tuple(fields)}
+            self._compiled.pop(name, None)
+
+    def get(self, name):
+        template = self._compiled.get(name)
+        if template is None:
+            with self._lock:
+                template = self._compiled.get(name)
+                if template is None:
+                    definition = self._definitions.get(name)
+                    if definition is None:
+                        raise KeyError(f"Unknown email template: {name}")
+                    template = self._compiled[name] = EmailTemplate(
+                        name,
+                        static_context=self.static_context,
+                        environment=self.environment,
+                        **definition
+                    )
+        return template
+
+    def render(self, name, **values):
+        return self.get(name).render(**values)
+
+    def render_batch(self, name, recipients):
+        return self.get(name).render_batch(recipients)
+
+
+def create_email_templates(config=None):
+    """Реестр со стандартными письмами магазина"""
+    config = config or {}
+    templates = EmailTemplates(static_context={
+        'reset_url': config.get('PASSWORD_RESET_URL', 'https://example.com/reset-password'),
+        'reset_link_ttl': config.get('PASSWORD_RESET_TTL_TEXT', '1 hour')
+    })
+    templates.register(
+        'order_confirmation',
+        subject='Order Confirmation #{{ order_id }}',
+        text='order_confirmation.txt',
+        html='order_confirmation.html',
+        fields=('username', 'order_id')
+    )
+    templates.register(
+        'password_reset',
+        subject='Password Reset Request',
+        text='password_reset.txt',
+        html='password_reset.html',
+        fields=('username', 'reset_token')
+    )
+    templates.register(
+        'order_created',
+        subject='Заказ #{{ order_id }} создан',
+        text='order_created.txt',
+        fields=('username', 'order_id', 'total', 'status')
+    )
+    return templates
@@ -4,9 +4,12 @@ Facade Pattern - предоставляет упрощенный интерфе
 """
 
 from src.models import User, Product, Cart, Order
-from src.services import ProductService, OrderService, PaymentService
+from src.services import ProductService, OrderService, PaymentService, NotificationService
 from src.utils import Helpers
+from src.utils.cache import EntityCache
+from src.utils.event_dispatcher import get_event_dispatcher
 from src.views.notifications import OrderNotifier, EmailNotifier
+import functools
 import time
 
 class ECommerceFacade:
@@ -16,7 +19,7 @@ class ECommerceFacade:
     и предоставляет простые методы для основных операций.
     """
     
-    def __init__(self, config=None):
+    def __init__(self, config=None, notification_service=None):
         self.config = config or {}
         
         # Инициализация сервисов
@@ -25,11 +28,20 @@ class ECommerceFacade:
         self.payment_service = PaymentService()
         
         # Инициализация уведомлений
-        self.notifier = OrderNotifier()
+        self.notifier = OrderNotifier(dispatcher=get_event_dispatcher())
         self.notifier.attach(EmailNotifier())
         
-        # Кэш для часто используемых данных
-        self._cache = {}
+        # Отправка писем (NotificationService); без почтового сервера письма не формируются
+        self.notification_service = notification_service
+        if self.notification_service is None and self.config.get('MAIL_SERVER'):
+            self.notification_service = NotificationService(self.config)
+        
+        # Кэш снимков пользователей и товаров (LRU + TTL + лимит памяти)
+        self._cache = EntityCache(
+            max_entries=self.config.get('cache_max_entries', 1024),
+            ttl=self.config.get('cache_ttl', 300),
+            max_memory=self.config.get('cache_max_memory', 1024 * 1024)
+        )
     
     def purchase_product(self, user_id, product_id, quantity, payment_method):
         """
@@ -112,8 +124,8 @@ class ECommerceFacade:
         # Получение заказов пользователя
         orders = Order.get_by_user(user_id)
         
-        # Получение корзины пользователя
-        cart = Cart.get_by_user(user_id)
+        # Получение корзины пользователя (вместе с товарами, без N+1)
+        cart = Cart.get_by_user(user_id, with_products=True)
         
         # Получение рекомендаций товаров
         recommendations = self._get_recommendations(user_id)
@@ -144,21 +156,21 @@ class ECommerceFacade:
         max_price = filters.get('max_price')
         sort_by = filters.get('sort_by', 'name')
         
-        # Использование сервиса товаров для поиска
-        products = self.product_service.search_products(
-            keyword=keyword,
-            category=category,
-            min_price=min_price,
-            max_price=max_price
-        )
-        
-        # Сортировка результатов
-        sorted_products = self._sort_products(products, sort_by)
-        
-        # Пагинация
-        page = filters.get('page', 1)
-        per_page = filters.get('per_page', 20)
-        paginated = Helpers.paginate(sorted_products, page, per_page)
+        # Фильтрация, сортировка и пагинация выполняются в базе
+        try:
+            paginated = self.product_service.search_products_page(
+                keyword=keyword,
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                sort_by=sort_by,
+                page=filters.get('page', 1),
+                per_page=filters.get('per_page', 20),
+                cursor=filters.get('cursor')
+            )
+        except ValueError as e:
+            # Некорректный курсор - ошибка запроса, а не сервера
+            return self._error_response(str(e))
         
         # Форматирование цен
         for product in paginated['items']:
@@ -170,7 +182,9 @@ class ECommerceFacade:
                 'page': paginated['page'],
                 'per_page': paginated['per_page'],
                 'total': paginated['total_items'],
-                'pages': paginated['total_pages']
+                'pages': paginated['total_pages'],
+                'has_next': paginated['has_next'],
+                'next_cursor': paginated['next_cursor']
             },
             'filters_applied': filters,
             'search_summary': {
@@ -246,26 +260,12 @@ class ECommerceFacade:
     # ========== Вспомогательные методы ==========
     
     def _get_user(self, user_id):
-        """Получение пользователя с кэшированием"""
-        cache_key = f"user_{user_id}"
-        if cache_key in self._cache:
-            return self._cache[cache_key]
-        
-        user = User.get_by_id(user_id)
-        if user:
-            self._cache[cache_key] = user
-        return user
+        """Получение снимка пользователя с кэшированием"""
+        return self._cache.get_entity('user', user_id, User.get_by_id)
     
     def _get_product(self, product_id):
-        """Получение товара с кэшированием"""
-        cache_key = f"product_{product_id}"
-        if cache_key in self._cache:
-            return self._cache[cache_key]
-        
-        product = self.product_service.get_product_with_details(product_id)
-        if product:
-            self._cache[cache_key] = product
-        return product
+        """Получение снимка товара с кэшированием"""
+        return self._cache.get_entity('product', product_id, self.product_service.get_product_with_details)
     
     def _get_or_create_cart(self, user_id):
         """Получение или создание корзины"""
@@ -306,16 +306,19 @@ class ECommerceFacade:
         # Уведомление о создании заказа
         self.notifier.order_created(order.id)
         
-        # Email уведомление
-        email_body = f"""
-        Уважаемый {user.username},
-        
-        Ваш заказ #{order.id} успешно создан!
-        Сумма заказа: {Helpers.format_price(order.total_amount, 'RUB')}
-        Статус: {order.status}
-        
-        Спасибо за покупку!
-        """
+        # Email уведомление: письмо рендерится, только если есть через что его отправить
+        if self.notification_service is not None:
+            fields = {
+                'username': user.username,
+                'order_id': order.id,
+                'total': Helpers.format_price(order.total_amount, 'RUB'),
+                'status': order.status
+            }
+            send = functools.partial(self.notification_service.send_templated, 'order_created', user.email, **fields)
+            if self.notifier.dispatcher is not None:
+                self.notifier.dispatcher.submit(send)
+            else:
+                send()
         
         print(f"FACADE: Отправлено уведомление для заказа #{order.id}")
     
@@ -344,19 +347,6 @@ class ECommerceFacade:
             'last_order_date': max(order.created_at for order in orders).isoformat()
         }
     
-    def _sort_products(self, products, sort_by):
-        """Сортировка товаров"""
-        if sort_by == 'price_asc':
-            return sorted(products, key=lambda x: x.price)
-        elif sort_by == 'price_desc':
-            return sorted(products, key=lambda x: x.price, reverse=True)
-        elif sort_by == 'name':
-            return sorted(products, key=lambda x: x.name)
-        elif sort_by == 'newest':
-            return sorted(products, key=lambda x: x.created_at, reverse=True)
-        
-        return products
-    
     def _get_user_notifications(self, user_id):
         """Получение уведомлений пользователя"""
         # В реальной системе здесь была бы логика получения уведомлений
@@ -390,6 +380,10 @@ class ECommerceFacade:
         """Очистка кэша"""
         self._cache.clear()
         print("FACADE: Кэш очищен")
+    
+    def get_cache_stats(self):
+        """Счетчики кэша: попадания, промахи, вытеснения"""
+        return self._cache.stats()
 
 # Пример использования Facade Pattern
 def demonstrate_facade_pattern():
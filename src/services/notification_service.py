@@ -1,9 +1,17 @@
-import smtplib
+from email.message import Message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from src.models import User
+from src.services.email_templates import create_email_templates
+from src.services.smtp_pool import SMTPConnectionPool
 from src.views.notifications import Observer
 
+def _as_bool(value):
+    """Флаг из настроек: переменные окружения приходят строками"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
 class NotificationService(Observer):
     """Сервис для отправки уведомлений"""
     
@@ -13,34 +21,52 @@ class NotificationService(Observer):
         self.smtp_port = config.get('MAIL_PORT')
         self.smtp_username = config.get('MAIL_USERNAME')
         self.smtp_password = config.get('MAIL_PASSWORD')
+        
+        # Авторизованные SMTP-сессии переиспользуются между письмами
+        self.smtp_pool = SMTPConnectionPool(
+            self.smtp_server,
+            self.smtp_port,
+            username=self.smtp_username,
+            password=self.smtp_password,
+            use_tls=_as_bool(config.get('MAIL_USE_TLS', True)),
+            timeout=config.get('MAIL_TIMEOUT', 10.0),
+            max_connections=config.get('MAIL_POOL_SIZE', 4),
+            max_messages_per_connection=config.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100)
+        )
+        
+        # Шаблоны писем компилируются один раз на сервис
+        self.templates = create_email_templates(config)
     
     def update(self, message):
         """Обработка уведомления от Subject"""
         print(f"Notification received: {message}")
         # В реальном приложении здесь была бы логика отправки уведомлений
     
+    def build_message(self, to_email, subject, body, html_body=None):
+        """MIME-письмо с текстовой и (необязательно) HTML-частью"""
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.smtp_username
+        msg['To'] = to_email
+        
+        # Текстовое содержимое
+        text_part = MIMEText(body, 'plain')
+        msg.attach(text_part)
+        
+        # HTML содержимое (если есть)
+        if html_body:
+            html_part = MIMEText(html_body, 'html')
+            msg.attach(html_part)
+        
+        return msg
+    
     def send_email(self, to_email, subject, body, html_body=None):
         """Отправка email"""
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.smtp_username
-            msg['To'] = to_email
-            
-            # Текстовое содержимое
-            text_part = MIMEText(body, 'plain')
-            msg.attach(text_part)
-            
-            # HTML содержимое (если есть)
-            if html_body:
-                html_part = MIMEText(html_body, 'html')
-                msg.attach(html_part)
-            
-            # Подключение к SMTP серверу
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
+            msg = self.build_message(to_email, subject, body, html_body)
+            error = self.smtp_pool.send(msg)
+            if error is not None:
+                raise error
             
             print(f"Email sent to {to_email}")
             return True
@@ -49,27 +75,57 @@ class NotificationService(Observer):
             print(f"Failed to send email: {e}")
             return False
     
+    def send_bulk(self, messages, batch_size=None):
+        """
+        Массовая отправка писем через пул SMTP-соединений.
+        messages - словари с ключами to_email, subject, body, html_body
+        или готовые MIME-письма. Возвращает число отправленных писем
+        и ошибки по индексам писем.
+        """
+        prepared = [
+            message if isinstance(message, Message) else self.build_message(**message)
+            for message in messages
+        ]
+        results = self.smtp_pool.send_bulk(prepared, batch_size=batch_size)
+        
+        errors = {index: str(error) for index, error in enumerate(results) if error is not None}
+        return {
+            'sent': len(results) - len(errors),
+            'failed': len(errors),
+            'errors': errors
+        }
+    
+    def close(self):
+        """Закрытие SMTP-соединений"""
+        self.smtp_pool.close()
+    
+    def send_templated(self, template_name, to_email, **fields):
+        """Отправка письма по шаблону"""
+        email = self.templates.render(template_name, **fields)
+        return self.send_email(to_email, email.subject, email.body, email.html_body)
+    
+    def send_templated_bulk(self, template_name, recipients, batch_size=None):
+        """
+        Массовая отправка писем по шаблону.
+        recipients - словари с to_email и полями шаблона; общие части
+        шаблона уже отрендерены, для каждого получателя подставляются только его поля.
+        """
+        template = self.templates.get(template_name)
+        messages = []
+        for recipient in recipients:
+            fields = dict(recipient)
+            to_email = fields.pop('to_email')
+            email = template.render(**fields)
+            messages.append(self.build_message(to_email, email.subject, email.body, email.html_body))
+        return self.send_bulk(messages, batch_size=batch_size)
+    
     def send_order_confirmation(self, order_id, user_id):
         """Отправка подтверждения заказа"""
         user = User.get_by_id(user_id)
         if not user:
             return False
         
-        subject = f"Order Confirmation #{order_id}"
-        body = f"Hello {user.username},\n\nYour order #{order_id} has been confirmed.\n\nThank you for your purchase!"
-        
-        html_body = f"""
-        <html>
-            <body>
-                <h1>Order Confirmation</h1>
-                <p>Hello {user.username},</p>
-                <p>Your order <strong>#{order_id}</strong> has been confirmed.</p>
-                <p>Thank you for your purchase!</p>
-            </body>
-        </html>
-        """
-        
-        return self.send_email(user.email, subject, body, html_body)
+        return self.send_templated('order_confirmation', user.email, username=user.username, order_id=order_id)
     
     def send_password_reset(self, user_id, reset_token):
         """Отправка ссылки для сброса пароля"""
@@ -77,21 +133,4 @@ class NotificationService(Observer):
         if not user:
             return False
         
-        reset_link = f"https://example.com/reset-password?token={reset_token}"
-        
-        subject = "Password Reset Request"
-        body = f"Hello {user.username},\n\nTo reset your password, click the link below:\n{reset_link}\n\nThis link will expire in 1 hour."
-        
-        html_body = f"""
-        <html>
-            <body>
-                <h1>Password Reset</h1>
-                <p>Hello {user.username},</p>
-                <p>To reset your password, click the link below:</p>
-                <p><a href="{reset_link}">Reset Password</a></p>
-                <p>This link will expire in 1 hour.</p>
-            </body>
-        </html>
-        """
-        
-        return self.send_email(user.email, subject, body, html_body)
\ No newline at end of file
+        return self.send_templated('password_reset', user.email, username=user.username, reset_token=reset_token)
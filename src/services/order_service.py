@@ -1,25 +1,33 @@
-from src.models import Order, Product
+from datetime import datetime
+from sqlalchemy import select, update
+from src import db
+from src.models import Order, OrderItem, Product
 from src.views.notifications import OrderNotifier, EmailNotifier, SMSNotifier
+from src.utils import timing_decorator
+from src.utils.helpers import Helpers
+from src.utils.event_dispatcher import get_event_dispatcher
 
 class OrderService:
     """Сервис для работы с заказами"""
     
+    # Статус отслеживания службы доставки -> статус заказа
+    TRACKING_STATUSES = {'delivered': 'delivered'}
+    
     def __init__(self):
-        self.notifier = OrderNotifier()
+        self.notifier = OrderNotifier(dispatcher=get_event_dispatcher())
         
         # Инициализация наблюдателей
         self.notifier.attach(EmailNotifier())
         self.notifier.attach(SMSNotifier())
     
+    @timing_decorator
     def create_order(self, user_id, items_data, shipping_address=None, payment_method=None):
         """Создание нового заказа"""
-        # Проверка наличия товаров
-        for item in items_data:
-            product = Product.get_by_id(item['product_id'])
-            if not product or product.stock < item['quantity']:
-                raise ValueError(f"Product {item['product_id']} is not available")
+        # Все товары заказа загружаются одним запросом
+        products = Product.get_by_ids(item['product_id'] for item in items_data)
+        items_data = self._prepare_items(items_data, {p.id: p.price for p in products})
         
-        # Создание заказа
+        # Резервирование товара, заказ и позиции - одна транзакция
         order = Order.create(
             user_id=user_id,
             items_data=items_data,
@@ -27,16 +35,167 @@ class OrderService:
             payment_method=payment_method
         )
         
-        # Уменьшение количества товара на складе
-        for item in items_data:
-            product = Product.get_by_id(item['product_id'])
-            product.reduce_stock(item['quantity'])
-        
         # Отправка уведомления
         self.notifier.order_created(order.id)
         
         return order
     
+    @timing_decorator
+    def create_orders_bulk(self, orders_data, batch_size=500):
+        """
+        Пакетное создание заказов (импорт B2B).
+        Каждый пакет: один запрос на резервирование по товару, один flush заказов,
+        пакетная вставка позиций и один commit. Строки с ошибками и заказы,
+        которые нельзя выполнить, пропускаются и возвращаются в списке failed.
+        Если остаток изменился конкурентно и пакет не прошел, его заказы
+        создаются по одному, чтобы отказ получили только невыполнимые.
+        """
+        product_ids = {
+            item.get('product_id')
+            for data in orders_data if isinstance(data, dict) and isinstance(data.get('items'), list)
+            for item in data['items'] if isinstance(item, dict)
+        }
+        products = Product.get_by_ids(product_ids)
+        
+        # Цены и остатки запоминаются локально, чтобы не перечитывать товары после commit
+        prices = {product.id: product.price for product in products}
+        available = {product.id: product.stock for product in products}
+        
+        created = []
+        created_ids = []
+        failed = []
+        
+        for start in range(0, len(orders_data), batch_size):
+            batch = []
+            reserved = {}
+            
+            for index in range(start, min(start + batch_size, len(orders_data))):
+                data = orders_data[index]
+                try:
+                    self._validate_order_row(data)
+                    items_data = self._prepare_items(data['items'], prices)
+                except ValueError as e:
+                    failed.append({'index': index, 'error': str(e)})
+                    continue
+                
+                quantities = Product._aggregate_quantities(items_data)
+                short = [pid for pid, qty in quantities.items() if available[pid] < qty]
+                if short:
+                    failed.append({'index': index, 'error': f"Product {short[0]} is not available"})
+                    continue
+                
+                for product_id, quantity in quantities.items():
+                    available[product_id] -= quantity
+                    reserved[product_id] = reserved.get(product_id, 0) + quantity
+                
+                order = Order(
+                    user_id=data['user_id'],
+                    total_amount=sum(item['price'] * item['quantity'] for item in items_data),
+                    shipping_address=data.get('shipping_address'),
+                    payment_method=data.get('payment_method')
+                )
+                batch.append((index, order, items_data))
+            
+            if not batch:
+                continue
+            
+            try:
+                # Условный UPDATE на суммарное количество по каждому товару пакета
+                Product.reserve_stock(reserved, commit=False)
+                db.session.add_all(order for _, order, _ in batch)
+                db.session.flush()
+                # id запоминаются до commit: после него объекты истекают
+                batch_ids = [order.id for _, order, _ in batch]
+                Order._insert_items([(order, items_data) for _, order, items_data in batch])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Локальные остатки пакета недействительны: берутся из базы,
+                # а списываются только заказы, созданные по одному
+                available.update(self._current_stock(reserved))
+                for order, order_id in self._create_orders_one_by_one(orders_data, batch, failed, available):
+                    created.append(order)
+                    created_ids.append(order_id)
+                continue
+            
+            created.extend(order for _, order, _ in batch)
+            created_ids.extend(batch_ids)
+        
+        for order_id in created_ids:
+            self.notifier.order_created(order_id)
+        
+        failed.sort(key=lambda failure: failure['index'])
+        return {
+            'created': created,
+            'failed': failed
+        }
+    
+    @staticmethod
+    def _current_stock(product_ids):
+        """Остатки товаров из базы (без объектов в сессии)"""
+        rows = db.session.execute(select(Product.id, Product.stock).where(Product.id.in_(list(product_ids))))
+        return dict(rows.all())
+    
+    def _create_orders_one_by_one(self, orders_data, batch, failed, available):
+        """
+        Создание заказов непрошедшего пакета по одному, каждый - своей
+        транзакцией; available уменьшается только на созданные заказы.
+        Возвращает пары (заказ, id)
+        """
+        created = []
+        for index, _, items_data in batch:
+            data = orders_data[index]
+            try:
+                order = Order.create(
+                    user_id=data['user_id'],
+                    items_data=items_data,
+                    shipping_address=data.get('shipping_address'),
+                    payment_method=data.get('payment_method'),
+                    commit=False
+                )
+                order_id = order.id
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                failed.append({'index': index, 'error': str(e)})
+                continue
+            for product_id, quantity in Product._aggregate_quantities(items_data).items():
+                available[product_id] -= quantity
+            created.append((order, order_id))
+        return created
+    
+    @staticmethod
+    def _validate_order_row(data):
+        """Проверка строки импорта: ValueError с описанием вместо KeyError/TypeError"""
+        if not isinstance(data, dict):
+            raise ValueError("Order row must be an object")
+        if data.get('user_id') is None:
+            raise ValueError("user_id is required")
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            raise ValueError("items must be a non-empty list")
+        for item in items:
+            if not isinstance(item, dict) or 'product_id' not in item:
+                raise ValueError("Each item requires product_id")
+            quantity = item.get('quantity')
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                raise ValueError(f"Invalid quantity for product {item['product_id']}")
+    
+    def _prepare_items(self, items_data, prices):
+        """Проверка товаров заказа и подстановка текущей цены"""
+        prepared = []
+        for item in items_data:
+            if item['product_id'] not in prices:
+                raise ValueError(f"Product {item['product_id']} is not available")
+            
+            prepared.append({
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'price': item.get('price', prices[item['product_id']])
+            })
+        return prepared
+    
+    @timing_decorator
     def update_order_status(self, order_id, new_status):
         """Обновление статуса заказа"""
         order = Order.get_by_id(order_id)
@@ -51,6 +210,166 @@ class OrderService:
         
         return order
     
+    @timing_decorator
+    def create_shipments(self, order_ids, shipping_adapter, concurrency=8, retry_claimed=False):
+        """
+        Отправка волны заказов одной службой доставки.
+        Сначала заказы захватываются условным UPDATE (статус 'shipping' только
+        для заказов без номера отслеживания в статусе из SHIPPABLE_STATUSES):
+        пересекающиеся волны не отправят один заказ дважды. Отправления
+        создаются пакетами службы только для захваченных заказов, номера
+        отслеживания и статус 'shipped' записываются одним пакетным UPDATE,
+        заказам с ошибкой возвращается прежний статус.
+        retry_claimed - повторить заказы, оставшиеся в 'shipping' после сбоя:
+        id заказа передается службе как ключ идемпотентности, поэтому повтор
+        возвращает уже созданное отправление.
+        """
+        order_ids = list(order_ids)
+        now = datetime.utcnow()
+        
+        # id заказа -> статус до захвата (None - захвачен ранее)
+        claimed = {}
+        for status in Order.SHIPPABLE_STATUSES:
+            rows = db.session.execute(
+                update(Order)
+                .where(Order.id.in_(order_ids), Order.status == status, Order.tracking_number.is_(None))
+                .values(status='shipping', updated_at=now)
+                .returning(Order.id)
+            )
+            claimed.update((order_id, status) for order_id in rows.scalars())
+        if retry_claimed:
+            stuck = db.session.execute(
+                select(Order.id).where(Order.id.in_(order_ids), Order.status == 'shipping',
+                                       Order.tracking_number.is_(None))
+            )
+            for order_id in stuck.scalars():
+                claimed.setdefault(order_id, None)
+        db.session.commit()
+        
+        if not claimed:
+            return {'shipped': [], 'failed': []}
+        
+        try:
+            orders = db.session.execute(
+                select(Order.id, Order.shipping_address).where(Order.id.in_(claimed)).order_by(Order.id)
+            ).all()
+            
+            items = {}
+            for item in OrderItem.query.filter(OrderItem.order_id.in_(claimed)):
+                items.setdefault(item.order_id, []).append(
+                    {'product_id': item.product_id, 'quantity': item.quantity}
+                )
+            
+            results = shipping_adapter.create_shipments(
+                [(order.id, order.shipping_address, items.get(order.id, [])) for order in orders],
+                concurrency=concurrency
+            )
+        except Exception:
+            db.session.rollback()
+            self._release_claims(claimed, claimed)
+            raise
+        
+        now = datetime.utcnow()
+        shipped = [result for result in results if result['success']]
+        failed = [{'order_id': result['order_id'], 'error': result['error']}
+                  for result in results if not result['success']]
+        # Захваченный заказ без ответа службы тоже возвращается в прежний статус
+        answered = {result['order_id'] for result in results}
+        failed.extend({'order_id': order_id, 'error': 'No result from shipping service'}
+                      for order_id in sorted(claimed) if order_id not in answered)
+        
+        if shipped:
+            db.session.bulk_update_mappings(Order, [
+                {'id': result['order_id'], 'tracking_number': result['tracking_number'],
+                 'status': 'shipped', 'updated_at': now}
+                for result in shipped
+            ])
+            db.session.commit()
+        shipped_ids = {result['order_id'] for result in shipped}
+        self._release_claims((order_id for order_id in claimed if order_id not in shipped_ids), claimed)
+        
+        for result in shipped:
+            self.notifier.order_shipped(result['order_id'])
+        
+        return {
+            'shipped': [{'order_id': r['order_id'], 'tracking_number': r['tracking_number']} for r in shipped],
+            'failed': failed
+        }
+    
+    def _release_claims(self, order_ids, claimed):
+        """Возврат прежнего статуса захваченным, но не отправленным заказам"""
+        now = datetime.utcnow()
+        mappings = [
+            {'id': order_id, 'status': claimed[order_id], 'updated_at': now}
+            for order_id in order_ids if claimed.get(order_id) is not None
+        ]
+        if mappings:
+            db.session.bulk_update_mappings(Order, mappings)
+            db.session.commit()
+    
+    @timing_decorator
+    def refresh_tracking(self, shipping_adapters, batch_size=500, concurrency=8):
+        """
+        Обновление статусов отправленных заказов.
+        shipping_adapters - адаптеры служб по префиксу номера отслеживания
+        ({'FX': ShippingAdapter(FedExService()), ...}). Заказы в конечном
+        статусе не читаются; незавершенные перебираются keyset-страницами
+        по id, номера каждой страницы опрашиваются пакетами по службам,
+        изменившиеся статусы записываются одним UPDATE на страницу.
+        """
+        query = Order.query.with_entities(Order.id, Order.tracking_number, Order.status).filter(
+            Order.tracking_number.isnot(None),
+            Order.status.notin_(Order.TERMINAL_STATUSES)
+        )
+        prefixes = sorted(shipping_adapters, key=len, reverse=True)
+        
+        checked = updated = 0
+        failed = []
+        unknown = []
+        cursor = None
+        while True:
+            page = Helpers.paginate(query, per_page=batch_size, count=False, cursor=cursor, keyset=(Order.id,))
+            
+            by_carrier = {}
+            for order in page['items']:
+                prefix = next((p for p in prefixes if order.tracking_number.startswith(p)), None)
+                if prefix is None:
+                    unknown.append(order.id)
+                else:
+                    by_carrier.setdefault(prefix, []).append(order)
+            
+            changes = []
+            now = datetime.utcnow()
+            for prefix, orders in by_carrier.items():
+                results = shipping_adapters[prefix].track_many(
+                    [order.tracking_number for order in orders], concurrency=concurrency
+                )
+                for order, result in zip(orders, results):
+                    checked += 1
+                    if not result['success']:
+                        failed.append({'order_id': order.id, 'error': result['error']})
+                        continue
+                    status = self.TRACKING_STATUSES.get(result['status'], order.status)
+                    if status != order.status:
+                        changes.append({'id': order.id, 'status': status, 'updated_at': now})
+            
+            if changes:
+                db.session.bulk_update_mappings(Order, changes)
+                db.session.commit()
+                updated += len(changes)
+            
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        
+        return {
+            'checked': checked,
+            'updated': updated,
+            'failed': failed,
+            'unknown_carrier': unknown
+        }
+    
+    @timing_decorator
     def cancel_order(self, order_id):
         """Отмена заказа"""
         order = Order.get_by_id(order_id)
@@ -6,6 +6,7 @@ from src.controllers.payment_strategy import (
 )
 import time
 from datetime import datetime
+from src.utils import timing_decorator
 
 class PaymentService:
     """Сервис для обработки платежей"""
@@ -13,6 +14,7 @@ class PaymentService:
     def __init__(self):
         self.payment_context = PaymentContext()
     
+    @timing_decorator
     def process_payment(self, order_id, amount, payment_method):
         """Обработка платежа"""
         # Выбор стратегии оплаты
@@ -50,6 +52,7 @@ class PaymentService:
                 'timestamp': datetime.now().isoformat()
             }
     
+    @timing_decorator
     def refund_payment(self, payment_id, amount):
         """Возврат платежа"""
         # В реальном приложении здесь была бы интеграция с платежной системой
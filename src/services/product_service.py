@@ -1,9 +1,30 @@
+from sqlalchemy import Column, Integer, MetaData, Table
+from src import db
 from src.models import Product
+from src.services.search_index import product_search_index
+from src.utils import Helpers, timing_decorator
 from src.views.notifications import Subject, Observer
 
+# Ранжированные ID результата поиска: временная таблица (своя у каждого
+# соединения с базой), с которой запрос соединяется вместо списка ID в IN
+ranked_ids_table = Table(
+    'search_ranked_ids', MetaData(),
+    Column('position', Integer, primary_key=True),
+    Column('product_id', Integer, nullable=False),
+    prefixes=['TEMPORARY']
+)
+
 class ProductService:
     """Сервис для работы с товарами"""
     
+    # Варианты сортировки: ключ -> (поле, по убыванию)
+    SORT_OPTIONS = {
+        'price_asc': ('price', False),
+        'price_desc': ('price', True),
+        'name': ('name', False),
+        'newest': ('created_at', True)
+    }
+    
     def __init__(self):
         self.notifier = Subject()
     
@@ -51,15 +72,41 @@ class ProductService:
         products = Product.get_all()
         return products[:limit] if len(products) > limit else products
     
-    def search_products(self, keyword, category=None, min_price=None, max_price=None):
-        """Расширенный поиск товаров"""
-        query = Product.query
+    def build_search_query(self, keyword=None, category=None, min_price=None, max_price=None):
+        """
+        Построение запроса с фильтрами без его выполнения.
+        Возвращает (query, ranked_ids); ranked_ids - ID по релевантности или None без keyword.
+        С keyword запрос соединен с ranked_ids_table: позиция товара в
+        ранжировании - столбец ranked_ids_table.c.position.
+        """
+        query = self._filter_query(category, min_price, max_price)
+        ranked_ids = None
         
         if keyword:
-            query = query.filter(
-                (Product.name.ilike(f'%{keyword}%')) | 
-                (Product.description.ilike(f'%{keyword}%'))
-            )
+            ranked_ids = [product_id for product_id, _ in product_search_index.search(keyword)]
+            self._store_ranked_ids(ranked_ids)
+            query = query.join(ranked_ids_table, ranked_ids_table.c.product_id == Product.id)
+        
+        return query, ranked_ids
+    
+    @staticmethod
+    def _store_ranked_ids(ranked_ids):
+        """
+        Запись ранжированных ID во временную таблицу соединения текущей
+        сессии: одна пакетная вставка вместо тысяч литералов в тексте запроса
+        """
+        connection = db.session.connection()
+        ranked_ids_table.create(connection, checkfirst=True)
+        connection.execute(ranked_ids_table.delete())
+        if ranked_ids:
+            connection.execute(ranked_ids_table.insert(), [
+                {'position': position, 'product_id': product_id}
+                for position, product_id in enumerate(ranked_ids)
+            ])
+    
+    def _filter_query(self, category=None, min_price=None, max_price=None):
+        """Запрос товаров с фильтрами по категории и цене"""
+        query = Product.query
         
         if category:
             query = query.filter_by(category=category)
@@ -70,4 +117,63 @@ class ProductService:
         if max_price is not None:
             query = query.filter(Product.price <= max_price)
         
-        return query.all()
\ No newline at end of file
+        return query
+    
+    @timing_decorator
+    def search_products(self, keyword, category=None, min_price=None, max_price=None):
+        """Расширенный поиск товаров (результаты упорядочены по релевантности)"""
+        query, ranked_ids = self.build_search_query(keyword, category, min_price, max_price)
+        
+        if ranked_ids is not None:
+            return query.order_by(ranked_ids_table.c.position).all()
+        
+        return query.all()
+    
+    @timing_decorator
+    def search_products_page(self, keyword=None, category=None, min_price=None, max_price=None,
+                             sort_by='name', page=1, per_page=20, cursor=None):
+        """
+        Одна страница результатов поиска.
+        Сортировка, LIMIT/OFFSET и COUNT выполняются в базе; при переданном cursor
+        используется keyset-пагинация (WHERE (поле, id) > (значение, id)) без OFFSET.
+        """
+        if keyword and sort_by not in self.SORT_OPTIONS:
+            return self._search_ranked_page(keyword, category, min_price, max_price, page, per_page, cursor)
+        
+        query, ranked_ids = self.build_search_query(keyword, category, min_price, max_price)
+        total_items = query.order_by(None).count()
+        
+        field, descending = self.SORT_OPTIONS.get(sort_by, ('id', False))
+        return Helpers.paginate(
+            query,
+            page,
+            per_page,
+            total_items=total_items,
+            cursor=cursor,
+            keyset=(getattr(Product, field), Product.id),
+            descending=descending
+        )
+    
+    def _search_ranked_page(self, keyword, category, min_price, max_price, page, per_page, cursor):
+        """
+        Страница результатов по релевантности.
+        Сортировка по позиции в ранжировании, фильтры, COUNT и LIMIT
+        выполняются в базе одним соединением с ranked_ids_table.
+        Курсор - позиция последнего товара страницы в ранжированном списке.
+        """
+        if cursor:
+            position = Helpers.decode_cursor(cursor)
+            if (not isinstance(position, list) or len(position) != 1
+                    or not isinstance(position[0], int) or position[0] < 0):
+                raise ValueError(f"Invalid cursor: {cursor}")
+        
+        query, _ = self.build_search_query(keyword, category, min_price, max_price)
+        paginated = Helpers.paginate(
+            query.add_columns(ranked_ids_table.c.position),
+            page,
+            per_page,
+            cursor=cursor,
+            keyset=(ranked_ids_table.c.position,)
+        )
+        paginated['items'] = [product for product, _ in paginated['items']]
+        return paginated
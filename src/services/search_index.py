@@ -0,0 +1,242 @@
+"""
+Инвертированный индекс для полнотекстового поиска товаров
+"""
+
+import math
+import re
+import threading
+from bisect import bisect_left
+from sqlalchemy import event, inspect
+from src import db
+from src.models import Product
+from src.utils.transaction_hooks import on_commit
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """Приведение текста к единому регистру (кириллица и латиница)"""
+    return text.casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    """Разбиение текста на нормализованные токены"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+class ProductSearchIndex:
+    """
+    Инвертированный индекс по названию, описанию, категории и артикулу.
+    Хранит posting lists вида токен -> {product_id: вес} и ранжирует
+    результаты по сумме весов полей с учетом редкости токена (IDF).
+    """
+
+    # Вес совпадения в зависимости от поля
+    FIELD_WEIGHTS = {
+        'sku': 5.0,
+        'name': 3.0,
+        'category': 2.0,
+        'description': 1.0
+    }
+    INDEXED_FIELDS = tuple(FIELD_WEIGHTS)
+
+    # Минимальная длина токена для поиска по префиксу
+    MIN_PREFIX_LENGTH = 2
+
+    def __init__(self, autoload=True):
+        # autoload=False - индекс заполняется только вручную через add()
+        self.autoload = autoload
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._documents = {}
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self._built = False
+
+    def _document_tokens(self, fields):
+        """Токены документа с весами полей"""
+        weights = {}
+        for field, weight in self.FIELD_WEIGHTS.items():
+            value = fields.get(field)
+            if not value:
+                continue
+
+            tokens = tokenize(value)
+            if field == 'sku' and len(tokens) > 1:
+                # Артикул ищется и целиком, и по частям (DEMO-001 -> demo001, demo, 001)
+                tokens.append(''.join(tokens))
+
+            for token in tokens:
+                weights[token] = weights.get(token, 0.0) + weight
+        return weights
+
+    def add(self, product_id, **fields):
+        """Добавление или переиндексация товара"""
+        weights = self._document_tokens(fields)
+
+        with self._lock:
+            self._remove_locked(product_id)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    self._vocabulary_dirty = True
+                postings[product_id] = weight
+            self._documents[product_id] = tuple(weights)
+
+    def add_product(self, product):
+        """Индексация объекта Product"""
+        self.add(product.id, **{field: getattr(product, field) for field in self.INDEXED_FIELDS})
+
+    def remove(self, product_id):
+        """Удаление товара из индекса"""
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def _remove_locked(self, product_id):
+        tokens = self._documents.pop(product_id, ())
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def clear(self):
+        """Очистка индекса"""
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._vocabulary = []
+            self._vocabulary_dirty = False
+            self._built = False
+
+    def rebuild(self):
+        """Полное построение индекса по данным из базы"""
+        columns = [getattr(Product, field) for field in self.INDEXED_FIELDS]
+        rows = db.session.query(Product.id, *columns).yield_per(1000)
+
+        with self._lock:
+            self.clear()
+            for row in rows:
+                self.add(row[0], **dict(zip(self.INDEXED_FIELDS, row[1:])))
+            self._built = True
+
+    def ensure_built(self):
+        """Ленивое построение индекса при первом поиске"""
+        if self.autoload and not self._built:
+            self.rebuild()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _expand(self, token):
+        """
+        Все токены словаря, начинающиеся с данного (аналог '%kw%' по началу
+        слова): ограничение числа подстановок молча теряло бы товары
+        """
+        if len(token) < self.MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+
+        matches = []
+        position = bisect_left(self._vocabulary, token)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(token):
+            matches.append(self._vocabulary[position])
+            position += 1
+        return matches
+
+    def search(self, query, limit=None):
+        """
+        Поиск товаров по запросу.
+        Возвращает список (product_id, score), отсортированный по релевантности.
+        Все слова запроса должны встретиться в товаре (точно или по префиксу).
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            self.ensure_built()
+            total_documents = len(self._documents) or 1
+            scores = None
+
+            # Сначала обрабатываются самые редкие токены - пересечение сужается быстрее
+            token_matches = []
+            for token in query_tokens:
+                expansions = self._expand(token)
+                if not expansions:
+                    return []
+                token_matches.append((token, expansions))
+            token_matches.sort(key=lambda tm: sum(len(self._postings[t]) for t in tm[1]))
+
+            for token, expansions in token_matches:
+                token_scores = {}
+                for expansion in expansions:
+                    postings = self._postings[expansion]
+                    idf = math.log(1 + total_documents / len(postings))
+                    # Точное совпадение слова ценится выше совпадения по префиксу
+                    boost = 1.0 if expansion == token else 0.5
+                    if scores is not None and len(scores) < len(postings):
+                        # Обход меньшего из множеств: уже найденные кандидаты
+                        candidates = ((pid, postings[pid]) for pid in scores if pid in postings)
+                    else:
+                        candidates = postings.items()
+
+                    for product_id, weight in candidates:
+                        if scores is not None and product_id not in scores:
+                            continue
+                        score = weight * idf * boost
+                        if score > token_scores.get(product_id, 0.0):
+                            token_scores[product_id] = score
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {pid: scores[pid] + score for pid, score in token_scores.items()}
+
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+# Единственный индекс процесса
+product_search_index = ProductSearchIndex()
+
+
+# ========== Синхронизация индекса с изменениями товаров ==========
+# Индекс меняется после commit: откат транзакции не должен убирать товар
+# из поиска или оставлять в нем несохраненные данные. Значения полей
+# запоминаются при flush - после commit атрибуты объекта истекают.
+
+def _index_after_commit(target):
+    product_id = target.id
+    fields = {field: getattr(target, field) for field in ProductSearchIndex.INDEXED_FIELDS}
+    on_commit(inspect(target).session, lambda: product_search_index.add(product_id, **fields))
+
+
+@event.listens_for(Product, 'after_insert')
+def _index_inserted_product(mapper, connection, target):
+    _index_after_commit(target)
+
+
+@event.listens_for(Product, 'after_update')
+def _index_updated_product(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in ProductSearchIndex.INDEXED_FIELDS):
+        _index_after_commit(target)
+
+
+@event.listens_for(Product, 'after_delete')
+def _index_deleted_product(mapper, connection, target):
+    product_id = target.id
+    on_commit(inspect(target).session, lambda: product_search_index.remove(product_id))
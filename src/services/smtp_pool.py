@@ -0,0 +1,272 @@
+"""
+Пул SMTP-соединений: повторное использование авторизованных сессий
+и отправка нескольких писем за одну сессию
+"""
+
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Ошибки соединения: сессия больше непригодна, письмо можно повторить на новой
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+# Отказ сервера по конкретному письму: сессия остается рабочей, повтор бесполезен
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class _PooledConnection:
+    __slots__ = ('smtp', 'created_at', 'last_used', 'messages_sent')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    Ограниченный пул SMTP-соединений.
+    Соединение открывается при первой необходимости (подключение, STARTTLS,
+    login) и после отправки возвращается в пул. Одновременно открыто не
+    более max_connections соединений, остальные отправители ждут свободное.
+    Соединение закрывается после max_messages_per_connection писем
+    (лимит сессии у большинства серверов) и проверяется NOOP, если
+    простаивало дольше idle_check. При обрыве письмо повторяется
+    на новом соединении.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, timeout=10.0,
+                 max_connections=4, max_messages_per_connection=100, idle_check=30.0, acquire_timeout=30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_check = idle_check
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = []
+        self._opened = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self.connections_created = 0
+        self.reconnects = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _is_alive(self, conn):
+        if time.monotonic() - conn.last_used < self.idle_check:
+            return True
+        try:
+            return conn.smtp.noop()[0] == 250
+        except OSError:
+            return False
+
+    def acquire(self):
+        """Свободное соединение из пула или новое, если лимит не исчерпан"""
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError('SMTP pool is closed')
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._opened < self.max_connections:
+                    self._opened += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('No free SMTP connection')
+                self._condition.wait(remaining)
+
+        if conn is not None:
+            if self._is_alive(conn):
+                return conn
+            self._close_smtp(conn.smtp)
+            with self._condition:
+                self.reconnects += 1
+
+        try:
+            conn = _PooledConnection(self._connect())
+        except Exception:
+            self._release_slot()
+            raise
+        with self._condition:
+            self.connections_created += 1
+        return conn
+
+    def release(self, conn, broken=False):
+        """Возврат соединения в пул; сломанное или исчерпавшее лимит закрывается"""
+        conn.last_used = time.monotonic()
+        if broken or self._closed or conn.messages_sent >= self.max_messages_per_connection:
+            if broken:
+                self._close_smtp(conn.smtp)
+            else:
+                self._quit_smtp(conn.smtp)
+            self._release_slot()
+            return
+
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def _release_slot(self):
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+
+    def _quit_smtp(self, smtp):
+        try:
+            smtp.quit()
+        except OSError:
+            smtp.close()
+
+    def _close_smtp(self, smtp):
+        try:
+            smtp.close()
+        except OSError:
+            pass
+
+    def _send_on(self, conn, message):
+        conn.smtp.send_message(message)
+        conn.messages_sent += 1
+
+    def _reset(self, conn):
+        """RSET после отказа по письму; соединение, не ответившее на RSET, закрывается"""
+        if conn is None:
+            return None
+        try:
+            conn.smtp.rset()
+        except OSError:
+            self.release(conn, broken=True)
+            return None
+        return conn
+
+    def send(self, message):
+        """Отправка одного письма (email.message.Message)"""
+        return self.send_many([message])[0]
+
+    def send_many(self, messages):
+        """
+        Отправка писем по одной сессии подряд, без повторного подключения.
+        Возвращает список: None для отправленного письма или исключение.
+        """
+        results = []
+        conn = None
+        try:
+            for message in messages:
+                error = None
+                for attempt in range(2):
+                    try:
+                        if conn is not None and conn.messages_sent >= self.max_messages_per_connection:
+                            self.release(conn)
+                            conn = None
+                        if conn is None:
+                            conn = self.acquire()
+                        self._send_on(conn, message)
+                        error = None
+                        break
+                    except MESSAGE_ERRORS as e:
+                        # Отказ по конкретному письму (адрес, размер) - сессия остается рабочей
+                        error = e
+                        conn = self._reset(conn)
+                        break
+                    except CONNECTION_ERRORS as e:
+                        # Сессия оборвалась: письмо повторяется один раз на новом соединении
+                        error = e
+                        if conn is not None:
+                            self.release(conn, broken=True)
+                            conn = None
+                            with self._condition:
+                                self.reconnects += 1
+                    except smtplib.SMTPException as e:
+                        # Прочие ответы сервера с ошибкой относятся к письму, а не к сессии
+                        error = e
+                        conn = self._reset(conn)
+                        break
+                    except OSError as e:
+                        # Сетевая ошибка вне сессии (например, DNS при подключении) - повтор бесполезен
+                        error = e
+                        if conn is not None:
+                            self.release(conn, broken=True)
+                            conn = None
+                        break
+                results.append(error)
+        finally:
+            if conn is not None:
+                self.release(conn)
+
+        sent = sum(1 for result in results if result is None)
+        with self._condition:
+            self.messages_sent += sent
+            self.messages_failed += len(results) - sent
+        return results
+
+    def send_bulk(self, messages, batch_size=None):
+        """
+        Массовая отправка: письма делятся на пачки, каждая пачка уходит
+        одной сессией, пачки отправляются параллельно не более чем
+        через max_connections соединений. Результаты - в порядке messages.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+
+        batch_size = batch_size or max(1, min(
+            self.max_messages_per_connection,
+            -(-len(messages) // self.max_connections)
+        ))
+        batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+        if len(batches) == 1:
+            return self.send_many(batches[0])
+
+        with ThreadPoolExecutor(max_workers=min(self.max_connections, len(batches)),
+                                thread_name_prefix='smtp-bulk') as executor:
+            results = []
+            for batch_results in executor.map(self.send_many, batches):
+                results.extend(batch_results)
+        return results
+
+    def close(self):
+        """Закрытие всех простаивающих соединений (QUIT)"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._condition.notify_all()
+        for conn in idle:
+            self._quit_smtp(conn.smtp)
+
+    def stats(self):
+        """Счетчики пула"""
+        with self._condition:
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': self._opened,
+                'idle_connections': len(self._idle),
+                'connections_created': self.connections_created,
+                'reconnects': self.reconnects,
+                'messages_sent': self.messages_sent,
+                'messages_failed': self.messages_failed
+            }
@@ -0,0 +1,102 @@
+"""
+Обработчики фоновых задач: по одному классу на тип задачи.
+Каждый проверяет payload до выполнения; некорректная задача
+сразу уходит в dead_letter_tasks, без повторов.
+"""
+
+from src.services.order_service import OrderService
+from src.services.product_service import ProductService
+from src.utils.producers_consumers import TaskError
+
+
+class TaskHandler:
+    """Базовый обработчик: обязательные поля payload и таймаут видимости"""
+
+    task_type = None
+    required_fields = ()
+    # Таймаут видимости задачи этого типа (None - по умолчанию очереди)
+    timeout = None
+
+    def handle(self, payload):
+        missing = [field for field in self.required_fields if field not in payload]
+        if missing:
+            raise TaskError(f"Task {self.task_type} is missing fields: {', '.join(missing)}")
+        return self.run(**payload)
+
+    def run(self, **payload):
+        raise NotImplementedError
+
+
+class ProcessOrderHandler(TaskHandler):
+    """Перевод заказа в следующий статус (по умолчанию - processing)"""
+
+    task_type = 'process_order'
+    required_fields = ('order_id',)
+
+    def run(self, order_id, status='processing', **_):
+        try:
+            return OrderService().update_order_status(order_id, status).id
+        except ValueError as e:
+            raise TaskError(str(e)) from e
+
+
+class SendEmailHandler(TaskHandler):
+    """
+    Отправка письма: готового (subject, body) или по шаблону
+    (template и поля шаблона в fields). Ошибка SMTP приводит к повтору.
+    """
+
+    task_type = 'send_email'
+    required_fields = ('to_email',)
+    timeout = 60.0
+
+    def __init__(self, notification_service):
+        self.notification_service = notification_service
+
+    def run(self, to_email, template=None, fields=None, subject=None, body=None, html_body=None, **_):
+        if template:
+            sent = self.notification_service.send_templated(template, to_email, **(fields or {}))
+        elif subject is not None and body is not None:
+            sent = self.notification_service.send_email(to_email, subject, body, html_body)
+        else:
+            raise TaskError('Task send_email requires template or subject and body')
+
+        if not sent:
+            raise RuntimeError(f"Failed to send email to {to_email}")
+        return sent
+
+
+class UpdateInventoryHandler(TaskHandler):
+    """Изменение остатка товара на delta"""
+
+    task_type = 'update_inventory'
+    required_fields = ('product_id', 'delta')
+
+    def run(self, product_id, delta, **_):
+        if not ProductService().update_stock(product_id, delta):
+            raise TaskError(f"Cannot update stock of product {product_id} by {delta}")
+        return True
+
+
+class GenerateReportHandler(TaskHandler):
+    """Отчет по заказам пользователя"""
+
+    task_type = 'generate_report'
+    required_fields = ('user_id',)
+    timeout = 120.0
+
+    def run(self, user_id, **_):
+        report = OrderService().calculate_order_stats(user_id)
+        print(f"Report for user {user_id}: {report}")
+        return report
+
+
+def default_task_handlers(notification_service):
+    """Обработчики стандартных типов задач"""
+    handlers = [
+        ProcessOrderHandler(),
+        SendEmailHandler(notification_service),
+        UpdateInventoryHandler(),
+        GenerateReportHandler()
+    ]
+    return {handler.task_type: handler for handler in handlers}
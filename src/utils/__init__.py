@@ -7,7 +7,17 @@ from src.utils.decorators import (
     validate_request_decorator,
     role_required_decorator
 )
-from src.utils.producers_consumers import Producer, Consumer
+from src.utils.producers_consumers import Producer, Consumer, SQLiteTaskQueue, TaskEngine, QueueFullError
+from src.utils.cache import LRUCache, EntityCache, MemoryBackend, RedisBackend
+from src.utils.request_logger import AsyncRequestLogger
+from src.utils.metrics import MetricsRegistry, metrics_registry
+from src.utils.event_dispatcher import EventDispatcher
+from src.utils.password_hasher import (
+    PasswordHasher,
+    PasswordHasherBusyError,
+    encode_password_hash,
+    check_password
+)
 
 __all__ = [
     'Validators',
@@ -18,5 +28,20 @@ __all__ = [
     'validate_request_decorator',
     'role_required_decorator',
     'Producer',
-    'Consumer'
+    'Consumer',
+    'SQLiteTaskQueue',
+    'TaskEngine',
+    'QueueFullError',
+    'LRUCache',
+    'EntityCache',
+    'MemoryBackend',
+    'RedisBackend',
+    'AsyncRequestLogger',
+    'MetricsRegistry',
+    'metrics_registry',
+    'EventDispatcher',
+    'PasswordHasher',
+    'PasswordHasherBusyError',
+    'encode_password_hash',
+    'check_password'
 ]
\ No newline at end of file
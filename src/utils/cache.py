@@ -0,0 +1,347 @@
+"""
+Кэширование: потокобезопасный LRU-кэш с TTL и кэш сущностей
+"""
+
+import datetime
+import decimal
+import hashlib
+import pickle
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from redis.exceptions import RedisError
+from src.utils.metrics import cache_backend_errors
+
+_MISSING = object()
+
+# Части ключа, repr которых одинаков во всех процессах
+_STABLE_KEY_TYPES = (str, bytes, int, float, bool, type(None), decimal.Decimal,
+                     datetime.date, datetime.time, datetime.timedelta)
+# repr по умолчанию (объекты, функции) содержит адрес в памяти процесса
+_ADDRESS_IN_REPR = re.compile(r' at 0x[0-9a-fA-F]+')
+
+
+def stable_key_repr(key):
+    """
+    Представление ключа кэша, не зависящее от процесса (для общих хранилищ).
+    Ключ - результат make_cache_key: кортежи из простых значений. Для
+    объектов, repr которых содержит адрес, - TypeError: такой ключ не
+    совпал бы между процессами, нужен key_func.
+    """
+    if isinstance(key, tuple):
+        return '(' + ', '.join(stable_key_repr(item) for item in key) + ')'
+    text = repr(key)
+    if not isinstance(key, _STABLE_KEY_TYPES) and _ADDRESS_IN_REPR.search(text):
+        raise TypeError(f"Cache key part {type(key).__name__} has no stable repr, pass key_func")
+    return text
+
+
+def estimate_size(value):
+    """Приблизительный размер значения в байтах (с учетом вложенных словарей и списков)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in value)
+    elif isinstance(value, EntitySnapshot):
+        size += estimate_size(value._data)
+    return size
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с TTL на запись и ограничением
+    по числу записей и по памяти. Ведет счетчики попаданий, промахов и вытеснений.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, max_memory=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self._clock = clock
+        self._lock = threading.RLock()
+        # key -> (value, expires_at, size)
+        self._data = OrderedDict()
+        self._memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Получение значения (обновляет позицию в LRU)"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._pop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        """Сохранение значения; ttl=None - без ограничения времени жизни"""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = self._clock() + ttl if ttl is not None else None
+        size = estimate_size(value) if self.max_memory else 0
+
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+            self._data[key] = (value, expires_at, size)
+            self._memory += size
+            self._evict()
+
+    def delete(self, key):
+        """Удаление записи; возвращает True, если запись была"""
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+                return True
+            return False
+
+    def clear(self):
+        """Очистка кэша"""
+        with self._lock:
+            self._data.clear()
+            self._memory = 0
+
+    def _pop(self, key):
+        _, _, size = self._data.pop(key)
+        self._memory -= size
+
+    def _evict(self):
+        """Вытеснение самых давно использованных записей сверх лимитов"""
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_memory and self._memory > self.max_memory)
+        ):
+            key = next(iter(self._data))
+            self._pop(key)
+            self.evictions += 1
+
+    def stats(self):
+        """Счетчики кэша"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._data),
+                'memory': self._memory
+            }
+
+    # Интерфейс словаря (для совместимости с прежним dict-кэшем)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EntitySnapshot:
+    """Отвязанный от сессии снимок сущности (только чтение)"""
+
+    def __init__(self, kind, data):
+        self._kind = kind
+        self._data = dict(data)
+
+    @classmethod
+    def from_entity(cls, kind, entity):
+        return cls(kind, entity.to_dict())
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_data'][name]
+        except KeyError:
+            raise AttributeError(f"{self._kind} snapshot has no attribute '{name}'") from None
+
+    def to_dict(self):
+        return dict(self._data)
+
+    def __repr__(self):
+        return f"<EntitySnapshot {self._kind} id={self._data.get('id')}>"
+
+
+class EntityCache(LRUCache):
+    """
+    Кэш сущностей (пользователи, товары) в виде снимков.
+    Все экземпляры регистрируются, чтобы модели могли инвалидировать
+    записи при изменении данных.
+    """
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, max_entries=1024, ttl=300, max_memory=1024 * 1024, clock=time.monotonic):
+        super().__init__(max_entries=max_entries, ttl=ttl, max_memory=max_memory, clock=clock)
+        EntityCache._instances.add(self)
+
+    @staticmethod
+    def key(kind, entity_id):
+        return f"{kind}_{entity_id}"
+
+    def get_entity(self, kind, entity_id, loader):
+        """Снимок сущности из кэша или загрузка через loader(entity_id)"""
+        cache_key = self.key(kind, entity_id)
+        snapshot = self.get(cache_key)
+        if snapshot is not None:
+            return snapshot
+
+        entity = loader(entity_id)
+        if not entity:
+            return None
+
+        snapshot = EntitySnapshot.from_entity(kind, entity)
+        self.set(cache_key, snapshot)
+        return snapshot
+
+    def invalidate(self, kind, entity_id):
+        """Удаление снимка сущности"""
+        return self.delete(self.key(kind, entity_id))
+
+    @classmethod
+    def invalidate_everywhere(cls, kind, entity_id):
+        """Инвалидация снимка во всех кэшах сущностей процесса"""
+        for cache in list(cls._instances):
+            cache.invalidate(kind, entity_id)
+
+
+# ========== Хранилища для мемоизации ==========
+
+class MemoryBackend:
+    """Хранилище в памяти процесса (LRU + TTL)"""
+
+    def __init__(self, max_entries=1024, ttl=300, max_memory=None):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl, max_memory=max_memory)
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+    def size(self):
+        return len(self.cache)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class RedisBackend:
+    """
+    Хранилище в Redis (общее для процессов).
+    По умолчанию использует клиент DatabaseSingleton; вытеснение
+    при нехватке памяти выполняет сам Redis (maxmemory-policy).
+    Ключ строится из stable_key_repr, поэтому записи совпадают между
+    процессами. Недоступность Redis не ломает кэшируемые вызовы: get (и
+    нечитаемая запись) считается промахом, set, delete и clear
+    пропускаются, size возвращает None; ошибка учитывается в errors и в
+    метрике cache_backend_errors_total.
+    """
+
+    def __init__(self, client=None, prefix='memo:'):
+        self._client = client
+        self.prefix = prefix
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from src.models.database import DatabaseSingleton
+            self._client = DatabaseSingleton().get_redis_client()
+        return self._client
+
+    def _redis_key(self, key):
+        digest = hashlib.sha1(stable_key_repr(key).encode('utf-8')).hexdigest()
+        return f"{self.prefix}{digest}"
+
+    def _record_error(self, operation):
+        with self._lock:
+            self.errors += 1
+        cache_backend_errors.inc(backend='redis', operation=operation)
+
+    def get(self, key, default=None):
+        redis_key = self._redis_key(key)
+        try:
+            raw = self.client.get(redis_key)
+        except RedisError:
+            self._record_error('get')
+            return default
+        if raw is None:
+            return default
+        try:
+            return pickle.loads(raw)
+        except Exception:
+            # Запись другой версии кода (класс переименован или удален)
+            self._record_error('decode')
+            return default
+
+    def set(self, key, value, ttl):
+        redis_key = self._redis_key(key)
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            if ttl is None:
+                self.client.set(redis_key, payload)
+            else:
+                self.client.set(redis_key, payload, px=max(1, int(ttl * 1000)))
+        except RedisError:
+            self._record_error('set')
+
+    def delete(self, key):
+        redis_key = self._redis_key(key)
+        try:
+            self.client.delete(redis_key)
+        except RedisError:
+            self._record_error('delete')
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+            if keys:
+                self.client.delete(*keys)
+        except RedisError:
+            self._record_error('clear')
+
+    def size(self):
+        try:
+            return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*"))
+        except RedisError:
+            self._record_error('size')
+            return None
+
+    def stats(self):
+        return {'size': self.size(), 'errors': self.errors}
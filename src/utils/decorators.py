@@ -1,63 +1,175 @@
 import time
 import functools
+import random
+import threading
+from concurrent.futures import Future
 from flask import request, jsonify
+from src.utils.cache import MemoryBackend
+from src.utils.metrics import function_duration, function_errors
 
 def timing_decorator(func):
-    """Декоратор для измерения времени выполнения функции"""
+    """
+    Декоратор для измерения времени выполнения функции.
+    Длительность пишется в гистограмму function_duration_seconds,
+    исключения - в счетчик function_errors_total.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        
-        print(f"Function {func.__name__} took {end_time - start_time:.4f} seconds")
-        return result
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            function_errors.inc(function=name)
+            raise
+        finally:
+            function_duration.observe(time.perf_counter() - start_time, function=name)
     return wrapper
 
-def retry_decorator(max_retries=3, delay=1, exceptions=(Exception,)):
-    """Декоратор для повторного выполнения функции при ошибках"""
+def exponential_backoff(attempt, base_delay, max_delay=None, jitter=True):
+    """
+    Задержка перед повтором номер attempt (с нуля): base_delay * 2^attempt,
+    ограниченная max_delay. С jitter задержка выбирается случайно
+    из [0, предел] ("full jitter"), чтобы клиенты не повторяли запросы синхронно.
+    """
+    delay = base_delay * (2 ** attempt)
+    if max_delay is not None:
+        delay = min(delay, max_delay)
+    return random.uniform(0, delay) if jitter else delay
+
+def retry_decorator(max_retries=3, delay=1, exceptions=(Exception,), max_delay=30, jitter=True, budget=None):
+    """
+    Декоратор для повторного выполнения функции при ошибках.
+    Повторяются только исключения из exceptions, задержка растет
+    экспоненциально (с jitter); budget (RetryBudget) ограничивает
+    общую долю повторов.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            if budget:
+                budget.record_request()
+            
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
                 except exceptions as e:
                     if attempt == max_retries - 1:
                         raise
+                    if budget and not budget.can_retry():
+                        raise
                     
                     print(f"Attempt {attempt + 1} failed for {func.__name__}: {e}")
-                    time.sleep(delay * (attempt + 1))  # Экспоненциальная задержка
+                    time.sleep(exponential_backoff(attempt, delay, max_delay, jitter))
             
-            return func(*args, **kwargs)  # Последняя попытка
+            return func(*args, **kwargs)  # Последняя попытка (max_retries=0 - единственная)
         return wrapper
     return decorator
 
-def cache_decorator(ttl=300):  # TTL в секундах
-    """Декоратор для кэширования результатов функции"""
-    cache = {}
+_KWARGS_MARK = ('__kwargs__',)
+_MISSING = object()
+
+def _freeze(value):
+    """Приведение аргумента к хешируемому виду (списки, словари, множества)"""
+    if isinstance(value, dict):
+        items = ((_freeze(k), _freeze(v)) for k, v in value.items())
+        return ('__dict__',) + tuple(sorted(items, key=repr))
+    if isinstance(value, (list, tuple)):
+        return (f'__{type(value).__name__}__',) + tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return ('__set__',) + tuple(sorted((_freeze(item) for item in value), key=repr))
     
+    try:
+        hash(value)
+    except TypeError:
+        raise TypeError(f"Cannot build cache key from {type(value).__name__} argument") from None
+    return value
+
+def make_cache_key(func, args, kwargs):
+    """Хешируемый ключ кэша: имя функции и аргументы (порядок kwargs не важен)"""
+    key = (func.__module__, func.__qualname__) + tuple(_freeze(arg) for arg in args)
+    if kwargs:
+        key += _KWARGS_MARK + tuple(sorted((name, _freeze(value)) for name, value in kwargs.items()))
+    return key
+
+def cache_decorator(ttl=300, max_entries=1024, backend=None, key_func=None):
+    """
+    Декоратор мемоизации: ограниченный LRU-кэш с TTL на запись.
+    Потокобезопасен; при промахе значение вычисляет только один поток,
+    остальные ждут его результата (защита от cache stampede).
+    ttl может быть числом или функцией от результата,
+    backend - MemoryBackend (по умолчанию) или RedisBackend.
+    """
     def decorator(func):
+        store = backend if backend is not None else MemoryBackend(max_entries=max_entries, ttl=None)
+        lock = threading.Lock()
+        in_flight = {}
+        counters = {'hits': 0, 'misses': 0, 'coalesced': 0}
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Создание ключа кэша на основе аргументов
-            cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
+            cache_key = key_func(*args, **kwargs) if key_func else make_cache_key(func, args, kwargs)
             
             # Проверка кэша
-            if cache_key in cache:
-                cached_data, timestamp = cache[cache_key]
-                if time.time() - timestamp < ttl:
-                    print(f"Cache hit for {func.__name__}")
-                    return cached_data
+            value = store.get(cache_key, _MISSING)
+            if value is not _MISSING:
+                with lock:
+                    counters['hits'] += 1
+                return value
             
-            # Выполнение функции
-            result = func(*args, **kwargs)
+            # Один вычисляющий поток на ключ
+            with lock:
+                future = in_flight.get(cache_key)
+                leader = future is None
+                if leader:
+                    future = in_flight[cache_key] = Future()
+                else:
+                    counters['coalesced'] += 1
             
-            # Сохранение в кэш
-            cache[cache_key] = (result, time.time())
-            print(f"Cache miss for {func.__name__}, caching result")
+            if not leader:
+                return future.result()
             
-            return result
+            try:
+                # Значение могло появиться, пока поток ждал блокировку
+                value = store.get(cache_key, _MISSING)
+                if value is _MISSING:
+                    value = func(*args, **kwargs)
+                    store.set(cache_key, value, ttl(value) if callable(ttl) else ttl)
+                    with lock:
+                        counters['misses'] += 1
+                else:
+                    with lock:
+                        counters['hits'] += 1
+                future.set_result(value)
+                return value
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with lock:
+                    in_flight.pop(cache_key, None)
+        
+        def cache_info():
+            """Статистика кэша"""
+            with lock:
+                info = dict(counters)
+            info.update({
+                'size': store.size(),
+                'max_entries': max_entries if backend is None else None,
+                'ttl': None if callable(ttl) else ttl
+            })
+            return info
+        
+        def cache_clear():
+            """Очистка кэша и статистики"""
+            store.clear()
+            with lock:
+                for name in counters:
+                    counters[name] = 0
+        
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
         return wrapper
     return decorator
 
@@ -0,0 +1,180 @@
+"""
+Асинхронная доставка событий наблюдателям: ограниченный пул рабочих
+потоков с очередью на каждый поток
+"""
+
+import atexit
+import itertools
+import queue
+import threading
+import time
+from flask import current_app, has_app_context
+
+
+_STOP = object()
+
+
+class EventDispatcher:
+    """
+    Пул рабочих потоков для вызова наблюдателей вне потока запроса.
+    У каждого потока своя ограниченная очередь. Задачи с одинаковым
+    ключом упорядочивания всегда попадают в один поток и выполняются
+    в порядке постановки; задачи без ключа распределяются по кругу.
+    Если очередь заполнена дольше put_timeout, задача без ключа выполняется
+    в вызывающем потоке (обратное давление вместо потери события); задача
+    с ключом ждет места в очереди своего потока - выполнение в вызывающем
+    потоке обогнало бы задачи с тем же ключом, еще стоящие в очереди.
+    Исключение в задаче не влияет на остальные задачи и учитывается в failed.
+    """
+
+    def __init__(self, workers=4, queue_size=1000, put_timeout=0.05, name='event-dispatcher'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.put_timeout = put_timeout
+        self.name = name
+
+        self._queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._threads = []
+        self._round_robin = itertools.count()
+        self._condition = threading.Condition()
+        self._pending = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.inline = 0
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        with self._condition:
+            if not self._threads:
+                for index, tasks in enumerate(self._queues):
+                    thread = threading.Thread(target=self._run, args=(tasks,),
+                                              name=f'{self.name}-{index}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        return self
+
+    def submit(self, func, *args, key=None):
+        """
+        Постановка вызова func(*args) в очередь.
+        key - ключ упорядочивания (например, пара субъект/наблюдатель).
+        Возвращает False, если задача выполнена синхронно из-за переполнения
+        (только для задач без ключа).
+        """
+        if not self._threads:
+            self.start()
+
+        if key is None:
+            index = next(self._round_robin) % self.workers
+        else:
+            index = hash(key) % self.workers
+
+        with self._condition:
+            self._pending += 1
+            self.submitted += 1
+
+        # Рабочий поток не может ждать места в собственной очереди
+        blocking = key is not None and threading.current_thread() is not self._worker_thread(index)
+        try:
+            self._queues[index].put((func, args), timeout=None if blocking else self.put_timeout)
+            return True
+        except queue.Full:
+            with self._condition:
+                self.inline += 1
+            self._execute(func, args)
+            return False
+
+    def _worker_thread(self, index):
+        threads = self._threads
+        return threads[index] if index < len(threads) else None
+
+    def _run(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is _STOP:
+                return
+            self._execute(*task)
+
+    def _execute(self, func, args):
+        try:
+            func(*args)
+            failed = False
+        except Exception as e:
+            failed = True
+            print(f"Observer {getattr(func, '__qualname__', func)} failed: {e}")
+
+        with self._condition:
+            self._pending -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            if not self._pending:
+                self._condition.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Ожидание выполнения всех поставленных задач"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Выполнение оставшихся задач и остановка потоков"""
+        with self._condition:
+            threads, self._threads = self._threads, []
+
+        deadline = time.monotonic() + timeout
+        for tasks in self._queues[:len(threads)]:
+            # Маркер остановки встает в конец очереди, после уже принятых задач
+            tasks.put(_STOP)
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        """Счетчики пула"""
+        with self._condition:
+            return {
+                'workers': self.workers,
+                'queued': sum(tasks.qsize() for tasks in self._queues),
+                'pending': self._pending,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'inline': self.inline
+            }
+
+
+_event_dispatcher = None
+_event_dispatcher_lock = threading.Lock()
+
+
+def get_event_dispatcher(config=None):
+    """
+    Пул доставки уведомлений процесса (по настройкам NOTIFY_*, по умолчанию -
+    из конфигурации текущего приложения). Возвращает None, если асинхронная
+    доставка не включена (NOTIFY_ASYNC).
+    """
+    global _event_dispatcher
+    if config is None:
+        config = current_app.config if has_app_context() else {}
+    if not config.get('NOTIFY_ASYNC'):
+        return None
+
+    if _event_dispatcher is None:
+        with _event_dispatcher_lock:
+            if _event_dispatcher is None:
+                _event_dispatcher = EventDispatcher(
+                    workers=config.get('NOTIFY_WORKERS', 4),
+                    queue_size=config.get('NOTIFY_QUEUE_SIZE', 1000),
+                    put_timeout=config.get('NOTIFY_PUT_TIMEOUT', 0.05),
+                    name='notifications'
+                ).start()
+                # При остановке процесса уведомления из очереди дописываются
+                atexit.register(_event_dispatcher.close)
+    return _event_dispatcher
@@ -1,12 +1,18 @@
+import base64
 import hashlib
+import hmac
 import string
 import random
 from datetime import datetime, timedelta
+from itertools import dropwhile, islice
 import json
+from sqlalchemy import and_, or_
 
 class Helpers:
     """Класс вспомогательных функций"""
     
+    PBKDF2_ITERATIONS = 100000
+    
     @staticmethod
     def generate_token(length=32):
         """Генерация случайного токена"""
@@ -27,7 +33,7 @@ class Helpers:
             'sha256',
             password_bytes,
             salt_bytes,
-            100000  # Количество итераций
+            Helpers.PBKDF2_ITERATIONS
         )
         
         return {
@@ -37,9 +43,9 @@ class Helpers:
     
     @staticmethod
     def verify_password(password, stored_hash, salt):
-        """Проверка пароля"""
+        """Проверка пароля (сравнение за постоянное время)"""
         hashed_password = Helpers.hash_password(password, salt)
-        return hashed_password['hash'] == stored_hash
+        return hmac.compare_digest(hashed_password['hash'], stored_hash)
     
     @staticmethod
     def format_price(amount, currency='USD'):
@@ -75,26 +81,146 @@ class Helpers:
         }
     
     @staticmethod
-    def paginate(items, page, per_page):
-        """Пагинация списка"""
-        total_items = len(items)
-        total_pages = (total_items + per_page - 1) // per_page
+    def paginate(items, page=1, per_page=20, total_items=None, count=True, cursor=None, keyset=None,
+                 descending=False):
+        """
+        Пагинация списка, запроса SQLAlchemy или любого итерируемого объекта.
+        Запрос выполняется в базе (LIMIT/OFFSET и COUNT), итератор читается
+        только до конца страницы (islice), список - срез, как раньше.
+        total_items - известное заранее или оценочное число записей (COUNT
+        не выполняется); при count=False число записей не считается, и
+        has_next определяется по лишней записи.
+        keyset включает keyset-пагинацию по cursor - токену next_cursor
+        предыдущей страницы: для запроса это столбцы сортировки (последним -
+        уникальный, обычно id), для итератора - функция ключа элемента
+        (поток должен быть отсортирован по этому ключу).
+        """
+        if cursor and keyset is None:
+            raise ValueError('Cursor pagination requires keyset')
+        
+        if hasattr(items, 'limit') and hasattr(items, 'offset'):
+            return Helpers._paginate_query(items, page, per_page, total_items, count, cursor, keyset, descending)
+        
+        if total_items is None and count and hasattr(items, '__len__'):
+            total_items = len(items)
         
+        if keyset is None and hasattr(items, '__getitem__') and hasattr(items, '__len__'):
+            start_index = (page - 1) * per_page
+            paginated_items = items[start_index:start_index + per_page]
+            return Helpers._page(paginated_items, page, per_page, total_items,
+                                 has_next=start_index + per_page < len(items))
+        
+        iterator = iter(items)
         start_index = (page - 1) * per_page
-        end_index = start_index + per_page
+        if cursor:
+            after = Helpers.decode_cursor(cursor)
+            if descending:
+                iterator = dropwhile(lambda item: Helpers._cursor_key(keyset(item)) >= after, iterator)
+            else:
+                iterator = dropwhile(lambda item: Helpers._cursor_key(keyset(item)) <= after, iterator)
+            start_index = 0
         
-        paginated_items = items[start_index:end_index]
+        # Лишний элемент показывает, есть ли следующая страница
+        paginated_items = list(islice(iterator, start_index, start_index + per_page + 1))
+        has_next = len(paginated_items) > per_page
+        paginated_items = paginated_items[:per_page]
         
+        next_cursor = None
+        if has_next and keyset is not None:
+            next_cursor = Helpers.encode_cursor(Helpers._cursor_key(keyset(paginated_items[-1])))
+        return Helpers._page(paginated_items, page, per_page, total_items, has_next, next_cursor, cursor)
+    
+    @staticmethod
+    def _paginate_query(query, page, per_page, total_items, count, cursor, keyset, descending):
+        """Страница запроса SQLAlchemy: COUNT без сортировки, LIMIT/OFFSET или keyset"""
+        if total_items is None and count:
+            total_items = query.order_by(None).count()
+        
+        if keyset:
+            columns = list(keyset)
+            query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+            if cursor:
+                position = Helpers.decode_cursor(cursor)
+                if not isinstance(position, list) or len(position) != len(columns):
+                    raise ValueError(f"Invalid cursor: {cursor}")
+                values = [Helpers._column_value(column, value) for column, value in zip(columns, position)]
+                query = query.filter(Helpers._keyset_filter(columns, values, descending))
+            else:
+                query = query.offset((page - 1) * per_page)
+        else:
+            query = query.offset((page - 1) * per_page)
+        
+        paginated_items = query.limit(per_page + 1).all()
+        has_next = len(paginated_items) > per_page
+        paginated_items = paginated_items[:per_page]
+        
+        next_cursor = None
+        if has_next and keyset:
+            last = paginated_items[-1]
+            next_cursor = Helpers.encode_cursor(Helpers._cursor_key(
+                tuple(getattr(last, column.key) for column in columns)
+            ))
+        return Helpers._page(paginated_items, page, per_page, total_items, has_next, next_cursor, cursor)
+    
+    @staticmethod
+    def _keyset_filter(columns, values, descending):
+        """(c1, c2, ...) > (v1, v2, ...) в виде, понятном любой СУБД"""
+        clauses = []
+        for index, column in enumerate(columns):
+            equal = [columns[i] == values[i] for i in range(index)]
+            compare = column < values[index] if descending else column > values[index]
+            clauses.append(and_(*equal, compare))
+        return or_(*clauses)
+    
+    @staticmethod
+    def _cursor_key(key):
+        """Ключ элемента в JSON-совместимом виде (список значений)"""
+        if not isinstance(key, (list, tuple)):
+            key = (key,)
+        return [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    
+    @staticmethod
+    def _column_value(column, value):
+        """Значение из курсора в типе столбца (даты хранятся в ISO-формате)"""
+        try:
+            python_type = column.type.python_type
+        except (AttributeError, NotImplementedError):
+            return value
+        if python_type is datetime and isinstance(value, str):
+            return datetime.fromisoformat(value)
+        return value
+    
+    @staticmethod
+    def _page(items, page, per_page, total_items, has_next=None, next_cursor=None, cursor=None):
+        """Ответ пагинации: страница и сведения для навигации"""
+        total_pages = None if total_items is None else (total_items + per_page - 1) // per_page
+        if has_next is None:
+            has_next = page < total_pages
         return {
-            'items': paginated_items,
+            'items': items,
             'page': page,
             'per_page': per_page,
             'total_items': total_items,
             'total_pages': total_pages,
-            'has_next': page < total_pages,
-            'has_prev': page > 1
+            'has_next': has_next,
+            'has_prev': page > 1 or bool(cursor),
+            'next_cursor': next_cursor
         }
     
+    @staticmethod
+    def encode_cursor(position):
+        """Кодирование позиции keyset-пагинации в непрозрачный токен"""
+        payload = json.dumps(position, separators=(',', ':'), ensure_ascii=False)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """Декодирование токена keyset-пагинации"""
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
     @staticmethod
     def serialize_object(obj):
         """Сериализация объекта в JSON-совместимый формат"""
@@ -0,0 +1,303 @@
+"""
+Метрики процесса: счетчики, измерители и гистограммы задержек с метками,
+экспорт в текстовом формате Prometheus
+"""
+
+import bisect
+import threading
+import time
+
+
+# Границы корзин по умолчанию (секунды): от 1 мс до 10 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value != value:
+        return 'NaN'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    """Значение счетчика для одного набора меток"""
+
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    """
+    Гистограмма для одного набора меток: счетчики по корзинам, сумма и число
+    наблюдений. Запись - поиск корзины (bisect) и три сложения под
+    собственной блокировкой, поэтому потоки разных маршрутов не конкурируют.
+    """
+
+    __slots__ = ('_lock', '_bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Metric:
+    """Метрика с фиксированным набором меток; значения хранятся по кортежу меток"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **labels):
+        """Значение метрики для набора меток (создается при первом обращении)"""
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}")
+
+        # Чтение словаря без блокировки; блокировка нужна только новой серии
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def _render_samples(self):
+        for key, child in self._items():
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}'
+
+
+class _GaugeChild:
+    """Значение измерителя: заданное число или функция, вызываемая при экспорте"""
+
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self):
+        if self.function is None:
+            return self.value
+        try:
+            return self.function()
+        except Exception:
+            return float('nan')
+
+
+class Gauge(_Metric):
+    """Текущее значение (глубина очереди, возраст задачи)"""
+
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value, **labels):
+        self.labels(**labels).set(value)
+
+    def _render_samples(self):
+        for key, child in self._items():
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}'
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if bound != float('inf')))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def time(self, **labels):
+        """Контекстный менеджер для замера длительности блока"""
+        return _Timer(self.labels(**labels))
+
+    def _render_samples(self):
+        for key, child in self._items():
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class _Timer:
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса.
+    Повторная регистрация метрики с тем же именем возвращает уже
+    существующую, поэтому модули могут объявлять метрики независимо.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Сброс значений всех метрик (регистрация сохраняется)"""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.clear()
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+metrics_registry = MetricsRegistry()
+
+# Метрики приложения
+http_request_duration = metrics_registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status'))
+function_duration = metrics_registry.histogram(
+    'function_duration_seconds', 'Service method execution time', ('function',))
+function_errors = metrics_registry.counter(
+    'function_errors_total', 'Service method calls that raised an exception', ('function',))
+upstream_request_duration = metrics_registry.histogram(
+    'upstream_request_duration_seconds', 'Gateway upstream call latency', ('upstream', 'method', 'outcome'))
+task_duration = metrics_registry.histogram(
+    'task_duration_seconds', 'Background task processing time', ('type', 'outcome'))
+task_queue_depth = metrics_registry.gauge(
+    'task_queue_depth', 'Tasks waiting in the background queue', ('queue',))
+task_queue_oldest_age = metrics_registry.gauge(
+    'task_queue_oldest_age_seconds', 'Age of the oldest ready task', ('queue',))
+task_throughput = metrics_registry.gauge(
+    'task_throughput_per_second', 'Tasks completed per second over the last minute', ('queue',))
+task_workers = metrics_registry.gauge(
+    'task_workers', 'Running background task consumers', ('queue',))
+task_shed = metrics_registry.counter(
+    'task_shed_total', 'Tasks rejected because the queue was full', ('queue',))
+cache_backend_errors = metrics_registry.counter(
+    'cache_backend_errors_total', 'Cache backend calls that failed and were skipped', ('backend', 'operation'))
@@ -0,0 +1,267 @@
+"""
+Хеширование паролей в отдельных процессах: PBKDF2 не занимает ядро,
+на котором обслуживаются запросы, а число одновременных вычислений
+ограничено размером пула и очереди.
+
+Хеш хранится в виде pbkdf2_sha256$<итерации>$<соль>$<хеш>: по префиксу
+видно алгоритм, а число итераций можно повышать, не ломая старые хеши.
+Записи старого формата <соль>$<хеш> проверяются с PBKDF2_ITERATIONS.
+"""
+
+import asyncio
+import atexit
+import hashlib
+import hmac
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, has_app_context
+from src.utils.helpers import Helpers
+
+
+PBKDF2_ALGORITHM = 'sha256'
+PBKDF2_ITERATIONS = Helpers.PBKDF2_ITERATIONS
+PASSWORD_HASH_SCHEME = f'pbkdf2_{PBKDF2_ALGORITHM}'
+
+
+class PasswordHasherBusyError(Exception):
+    """Очередь хеширования заполнена: запрос следует отклонить (503), а не ждать"""
+    pass
+
+
+def encode_password_hash(hashed, iterations=PBKDF2_ITERATIONS):
+    """Строка для User.password_hash из словаря {'hash', 'salt'}"""
+    return f"{PASSWORD_HASH_SCHEME}${iterations}${hashed['salt']}${hashed['hash']}"
+
+
+def parse_password_hash(stored):
+    """
+    Разбор сохраненного хеша: словарь {'iterations', 'salt', 'hash'}.
+    Понимает и старый формат <соль>$<хеш>; для неизвестного алгоритма
+    или поврежденной строки - ValueError.
+    """
+    parts = (stored or '').split('$')
+    if len(parts) == 2:
+        salt, digest = parts
+        iterations = PBKDF2_ITERATIONS
+    elif len(parts) == 4:
+        scheme, iterations, salt, digest = parts
+        if scheme != PASSWORD_HASH_SCHEME:
+            raise ValueError(f"Unsupported password hash scheme: {scheme}")
+        if not iterations.isdigit() or int(iterations) < 1:
+            raise ValueError('Invalid password hash iterations')
+        iterations = int(iterations)
+    else:
+        raise ValueError('Invalid password hash format')
+    if not salt or not digest:
+        raise ValueError('Invalid password hash format')
+    return {'iterations': iterations, 'salt': salt, 'hash': digest}
+
+
+def check_password(password, stored, hasher=None, timeout=None):
+    """
+    Проверка пароля по строке из User.password_hash. С hasher вычисление
+    идет в его пуле процессов (ошибки PasswordHasherBusyError и TimeoutError
+    пробрасываются), без него - в текущем потоке. Неразборчивый хеш -
+    просто неверный пароль.
+    """
+    try:
+        parsed = parse_password_hash(stored)
+    except ValueError:
+        return False
+    if hasher is not None:
+        return hasher.verify_password(password, parsed['hash'], parsed['salt'],
+                                      timeout=timeout, iterations=parsed['iterations'])
+    digest = hashlib.pbkdf2_hmac(PBKDF2_ALGORITHM, password.encode('utf-8'),
+                                 parsed['salt'].encode('utf-8'), parsed['iterations'])
+    return hmac.compare_digest(digest.hex(), parsed['hash'])
+
+
+def _process_context():
+    """
+    Контекст процессов без fork: после fork дочерний процесс наследует
+    потоки и удерживаемые ими блокировки (логирование, пулы соединений)
+    многопоточного родителя и может зависнуть.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+class PasswordHasher:
+    """
+    Ограниченный пул процессов для PBKDF2.
+    В процессы передается сам hashlib.pbkdf2_hmac, поэтому дочерним
+    процессам не нужно импортировать приложение. Одновременно принимается
+    не более workers + queue_size вычислений, остальные сразу получают
+    PasswordHasherBusyError. Сравнение хешей - в вызывающем процессе,
+    за постоянное время (hmac.compare_digest).
+    """
+
+    def __init__(self, workers=2, queue_size=32, timeout=5.0, iterations=PBKDF2_ITERATIONS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.iterations = iterations
+
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._closed = False
+
+        self.submitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def start(self):
+        """Создание пула процессов"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Password hasher is closed')
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+        return self
+
+    def _submit(self, password, salt, iterations=None):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusyError('Too many pending password hashes')
+
+        args = (PBKDF2_ALGORITHM, password.encode('utf-8'), salt.encode('utf-8'), iterations or self.iterations)
+        try:
+            if self._executor is None:
+                self.start()
+            try:
+                future = self._executor.submit(hashlib.pbkdf2_hmac, *args)
+            except BrokenProcessPool:
+                # Рабочий процесс погиб (OOM, kill): пул пересоздается один раз
+                with self._lock:
+                    self._executor = None
+                self.start()
+                future = self._executor.submit(hashlib.pbkdf2_hmac, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self.submitted += 1
+        return future
+
+    def _chain(self, source, transform):
+        """Future с результатом transform(результат source)"""
+        target = Future()
+
+        def done(future):
+            if future.cancelled():
+                target.cancel()
+                return
+            error = future.exception()
+            if error is not None:
+                target.set_exception(error)
+                return
+            try:
+                target.set_result(transform(future.result()))
+            except Exception as e:
+                target.set_exception(e)
+
+        target.source = source
+        source.add_done_callback(done)
+        return target
+
+    def submit_hash(self, password, salt=None):
+        """Future со словарем {'hash', 'salt'} - как у Helpers.hash_password"""
+        if salt is None:
+            salt = Helpers.generate_token(16)
+        return self._chain(self._submit(password, salt), lambda digest: {'hash': digest.hex(), 'salt': salt})
+
+    def submit_verify(self, password, stored_hash, salt, iterations=None):
+        """Future с результатом проверки пароля"""
+        return self._chain(
+            self._submit(password, salt, iterations),
+            lambda digest: hmac.compare_digest(digest.hex(), stored_hash)
+        )
+
+    def _result(self, future, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Еще не начатое вычисление снимается с очереди и освобождает место
+            future.source.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise TimeoutError(f"Password hashing did not finish in {timeout} s") from None
+
+    def hash_password(self, password, salt=None, timeout=None):
+        """Хеширование с ожиданием результата не дольше timeout"""
+        return self._result(self.submit_hash(password, salt), timeout)
+
+    def verify_password(self, password, stored_hash, salt, timeout=None, iterations=None):
+        """Проверка пароля с ожиданием результата не дольше timeout"""
+        return self._result(self.submit_verify(password, stored_hash, salt, iterations), timeout)
+
+    async def _await(self, future, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.source.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise TimeoutError(f"Password hashing did not finish in {timeout} s") from None
+
+    async def hash_password_async(self, password, salt=None, timeout=None):
+        """Хеширование для корутин: цикл событий не блокируется"""
+        return await self._await(self.submit_hash(password, salt), timeout)
+
+    async def verify_password_async(self, password, stored_hash, salt, timeout=None, iterations=None):
+        """Проверка пароля для корутин"""
+        return await self._await(self.submit_verify(password, stored_hash, salt, iterations), timeout)
+
+    def close(self, wait=True):
+        """Остановка пула; принятые вычисления дорабатываются при wait=True"""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+
+_password_hasher = None
+_password_hasher_lock = threading.Lock()
+
+
+def get_password_hasher(config=None):
+    """
+    Пул хеширования паролей процесса (по настройкам PASSWORD_HASH_*, по
+    умолчанию - из конфигурации текущего приложения). Возвращает None, если
+    вынос в процессы выключен (PASSWORD_HASH_OFFLOAD).
+    """
+    global _password_hasher
+    if config is None:
+        config = current_app.config if has_app_context() else {}
+    if not config.get('PASSWORD_HASH_OFFLOAD'):
+        return None
+
+    if _password_hasher is None:
+        with _password_hasher_lock:
+            if _password_hasher is None:
+                _password_hasher = PasswordHasher(
+                    workers=config.get('PASSWORD_HASH_WORKERS', 2),
+                    queue_size=config.get('PASSWORD_HASH_QUEUE_SIZE', 32),
+                    timeout=config.get('PASSWORD_HASH_TIMEOUT', 5.0)
+                ).start()
+                atexit.register(_password_hasher.close)
+    return _password_hasher
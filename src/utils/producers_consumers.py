@@ -1,68 +1,695 @@
+"""
+Фоновые задачи (Producer-Consumer): надежная очередь в SQLite с приоритетами,
+таймаутом видимости, повторами с задержкой и таблицей недоставленных задач,
+пул потребителей с обработчиками по типу задачи
+"""
+
+import json
+import os
+import sqlite3
 import threading
-import queue
 import time
-import random
+import uuid
+from collections import deque, namedtuple
+from src.utils.decorators import exponential_backoff
+from src.utils.metrics import (
+    task_duration,
+    task_queue_depth,
+    task_queue_oldest_age,
+    task_throughput,
+    task_workers,
+    task_shed
+)
+
+# Приоритетные полосы: меньшее значение выбирается раньше
+PRIORITIES = {'high': 0, 'normal': 5, 'low': 9}
+
+Task = namedtuple('Task', ['id', 'type', 'payload', 'priority', 'attempts', 'created_at'])
+
+
+class TaskError(Exception):
+    """Ошибка задачи, которую не имеет смысла повторять"""
+    pass
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена: задача отклонена (shed) или не дождалась места (block)"""
+    pass
+
+
+def _priority(value):
+    if isinstance(value, str):
+        try:
+            return PRIORITIES[value]
+        except KeyError:
+            raise ValueError(f"Unknown priority: {value}") from None
+    return int(value)
+
+
+class SQLiteTaskQueue:
+    """
+    Надежная очередь задач в файле SQLite (переживает перезапуск процесса).
+    Выданная потребителю задача скрыта на visibility_timeout секунд;
+    если потребитель не подтвердил ее (упал, завис), задача снова
+    становится доступной. Неудачная задача повторяется с экспоненциальной
+    задержкой, после max_attempts попыток переносится в dead_letter_tasks.
+    max_size ограничивает число задач в очереди; при заполнении
+    overflow='block' ждет освобождения места до put_timeout секунд,
+    overflow='shed' сразу отклоняет задачу (QueueFullError).
+    Глубина очереди хранится счетчиком в task_queue_meta и меняется в той же
+    транзакции, что и таблица tasks: put не пересчитывает COUNT(*).
+    """
+
+    OVERFLOW_POLICIES = ('block', 'shed')
+
+    def __init__(self, path, visibility_timeout=30.0, max_attempts=5, retry_base_delay=1.0,
+                 retry_max_delay=300.0, max_size=None, overflow='block', put_timeout=5.0,
+                 name='default', clock=time.time):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.path = path
+        self.name = name
+        self.max_size = max_size
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+        self.shed = 0
+        self._space = threading.Condition()
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._clock = clock
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.executescript(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' type TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' available_at REAL NOT NULL,'
+            ' lease_owner TEXT,'
+            ' last_error TEXT,'
+            ' created_at REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_tasks_ready ON tasks (priority, available_at, id);'
+            'CREATE TABLE IF NOT EXISTS dead_letter_tasks ('
+            ' id INTEGER PRIMARY KEY,'
+            ' type TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL,'
+            ' attempts INTEGER NOT NULL,'
+            ' error TEXT,'
+            ' created_at REAL NOT NULL,'
+            ' failed_at REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS task_queue_meta ('
+            ' key TEXT PRIMARY KEY,'
+            ' value INTEGER NOT NULL);'
+        )
+        # Счетчик глубины заводится один раз, в том числе для файла от прежней версии
+        self._transaction(lambda connection: connection.execute(
+            "INSERT OR IGNORE INTO task_queue_meta (key, value) SELECT 'depth', COUNT(*) FROM tasks"
+        ))
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, work):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(connection)
+            connection.execute('COMMIT')
+            return result
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _adjust_depth(connection, delta):
+        """Изменение счетчика глубины (в транзакции вызывающего)"""
+        if delta:
+            connection.execute(
+                "UPDATE task_queue_meta SET value = value + ? WHERE key = 'depth'", (delta,)
+            )
+
+    def put(self, task_type, payload=None, priority='normal', delay=0, overflow=None, timeout=None):
+        """
+        Добавление задачи; возвращает ее id.
+        Резервирование места в счетчике глубины и вставка - одна транзакция,
+        поэтому лимит соблюдается и при нескольких процессах-производителях.
+        """
+        overflow = overflow or self.overflow
+        record = (task_type, json.dumps(payload or {}), _priority(priority))
+
+        def work(connection):
+            if self.max_size is None:
+                self._adjust_depth(connection, 1)
+            elif not connection.execute(
+                "UPDATE task_queue_meta SET value = value + 1 WHERE key = 'depth' AND value < ?",
+                (self.max_size,)
+            ).rowcount:
+                return None
+            now = self._clock()
+            return connection.execute(
+                'INSERT INTO tasks (type, payload, priority, available_at, created_at) VALUES (?, ?, ?, ?, ?)',
+                record + (now + delay, now)
+            ).lastrowid
+
+        deadline = time.monotonic() + (self.put_timeout if timeout is None else timeout)
+        while True:
+            task_id = self._transaction(work)
+            if task_id is not None:
+                return task_id
+
+            remaining = deadline - time.monotonic()
+            if overflow == 'shed' or remaining <= 0:
+                with self._space:
+                    self.shed += 1
+                task_shed.inc(queue=self.name)
+                raise QueueFullError(f"Task queue {self.name} is full ({self.max_size} tasks)")
+
+            # Место освобождают потребители этого процесса (сигнал) или других (опрос)
+            with self._space:
+                self._space.wait(min(remaining, 0.1))
+
+    def _notify_space(self):
+        if self.max_size is not None:
+            with self._space:
+                self._space.notify_all()
+
+    def lease(self, owner, max_priority=None, visibility_timeout=None):
+        """
+        Выдача самой приоритетной готовой задачи потребителю owner.
+        В available_at выданной задачи записывается срок аренды: до его
+        истечения задачу не получит другой потребитель.
+        max_priority ограничивает полосы, из которых берутся задачи.
+        Задача, аренда которой истекла max_attempts раз без fail (обработчик
+        роняет или вешает потребителя), не выдается снова, а переносится
+        в dead_letter_tasks.
+        """
+        timeout = visibility_timeout or self.visibility_timeout
+
+        def work(connection):
+            now = self._clock()
+            query = 'SELECT id, type, payload, priority, attempts, created_at FROM tasks WHERE available_at <= ?'
+            params = [now]
+            if max_priority is not None:
+                query += ' AND priority <= ?'
+                params.append(_priority(max_priority))
+            query += ' ORDER BY priority, available_at, id LIMIT 1'
+
+            dead = 0
+            while True:
+                row = connection.execute(query, params).fetchone()
+                if row is None:
+                    return None, dead
+                if row[4] < self.max_attempts:
+                    break
+                self._bury(connection, row[0], f"Lease expired after {row[4]} attempts", now)
+                dead += 1
+
+            connection.execute(
+                'UPDATE tasks SET attempts = attempts + 1, available_at = ?, lease_owner = ? WHERE id = ?',
+                (now + timeout, owner, row[0])
+            )
+            return Task(row[0], row[1], json.loads(row[2]), row[3], row[4] + 1, row[5]), dead
+
+        task, dead = self._transaction(work)
+        if dead:
+            self._notify_space()
+        return task
+
+    @staticmethod
+    def _bury(connection, task_id, error, now):
+        """Перенос задачи в dead_letter_tasks (в транзакции вызывающего)"""
+        connection.execute(
+            'INSERT INTO dead_letter_tasks (id, type, payload, priority, attempts, error, created_at, failed_at) '
+            'SELECT id, type, payload, priority, attempts, ?, created_at, ? FROM tasks WHERE id = ?',
+            (error, now, task_id)
+        )
+        SQLiteTaskQueue._adjust_depth(
+            connection, -connection.execute('DELETE FROM tasks WHERE id = ?', (task_id,)).rowcount
+        )
+
+    def extend(self, task, owner, visibility_timeout):
+        """Продление аренды задачи (для долгих обработчиков)"""
+        cursor = self._connection().execute(
+            'UPDATE tasks SET available_at = ? WHERE id = ? AND lease_owner = ?',
+            (self._clock() + visibility_timeout, task.id, owner)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, task, owner):
+        """Подтверждение обработки (задача удаляется); False, если аренда уже истекла"""
+        def work(connection):
+            deleted = connection.execute(
+                'DELETE FROM tasks WHERE id = ? AND lease_owner = ?', (task.id, owner)
+            ).rowcount
+            self._adjust_depth(connection, -deleted)
+            return deleted == 1
+
+        completed = self._transaction(work)
+        self._notify_space()
+        return completed
+
+    def fail(self, task, owner, error, retry=True):
+        """
+        Обработка ошибки задачи: повтор с задержкой или перенос
+        в dead_letter_tasks. Возвращает 'retry', 'dead' или None
+        (аренда истекла, задачу уже забрал другой потребитель).
+        """
+        def work(connection):
+            now = self._clock()
+            row = connection.execute(
+                'SELECT attempts FROM tasks WHERE id = ? AND lease_owner = ?', (task.id, owner)
+            ).fetchone()
+            if row is None:
+                return None
+
+            if retry and row[0] < self.max_attempts:
+                delay = exponential_backoff(row[0] - 1, self.retry_base_delay, self.retry_max_delay)
+                connection.execute(
+                    'UPDATE tasks SET available_at = ?, lease_owner = NULL, last_error = ? WHERE id = ?',
+                    (now + delay, str(error), task.id)
+                )
+                return 'retry'
+
+            self._bury(connection, task.id, str(error), now)
+            return 'dead'
+
+        outcome = self._transaction(work)
+        if outcome == 'dead':
+            self._notify_space()
+        return outcome
+
+    def dead_letters(self, limit=100):
+        """Задачи, исчерпавшие попытки"""
+        rows = self._connection().execute(
+            'SELECT id, type, payload, priority, attempts, error, failed_at FROM dead_letter_tasks '
+            'ORDER BY failed_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [
+            {'id': row[0], 'type': row[1], 'payload': json.loads(row[2]), 'priority': row[3],
+             'attempts': row[4], 'error': row[5], 'failed_at': row[6]}
+            for row in rows
+        ]
+
+    def requeue_dead_letter(self, task_id):
+        """Возврат задачи из dead_letter_tasks в очередь с обнулением попыток"""
+        def work(connection):
+            now = self._clock()
+            cursor = connection.execute(
+                'INSERT INTO tasks (type, payload, priority, available_at, created_at) '
+                'SELECT type, payload, priority, ?, created_at FROM dead_letter_tasks WHERE id = ?',
+                (now, task_id)
+            )
+            connection.execute('DELETE FROM dead_letter_tasks WHERE id = ?', (task_id,))
+            self._adjust_depth(connection, cursor.rowcount)
+            return cursor.lastrowid if cursor.rowcount else None
+
+        return self._transaction(work)
+
+    def stats(self):
+        """Число задач по полосам приоритета и в dead_letter_tasks"""
+        connection = self._connection()
+        now = self._clock()
+        lanes = {
+            priority: {'ready': ready, 'leased': leased, 'delayed': total - ready - leased}
+            for priority, total, ready, leased in connection.execute(
+                'SELECT priority, COUNT(*), '
+                ' SUM(CASE WHEN available_at <= ? THEN 1 ELSE 0 END), '
+                ' SUM(CASE WHEN lease_owner IS NOT NULL AND available_at > ? THEN 1 ELSE 0 END) '
+                'FROM tasks GROUP BY priority', (now, now)
+            )
+        }
+        dead = connection.execute('SELECT COUNT(*) FROM dead_letter_tasks').fetchone()[0]
+        return {'lanes': lanes, 'dead_letters': dead}
+
+    def gauges(self):
+        """Глубина очереди (всего и готовых к выдаче) и возраст самой старой готовой задачи"""
+        now = self._clock()
+        depth, ready, oldest = self._connection().execute(
+            'SELECT COUNT(*), SUM(CASE WHEN available_at <= ? THEN 1 ELSE 0 END), '
+            ' MIN(CASE WHEN available_at <= ? THEN created_at END) FROM tasks',
+            (now, now)
+        ).fetchone()
+        return {
+            'depth': depth,
+            'ready': ready or 0,
+            'oldest_age': max(0.0, now - oldest) if oldest is not None else 0.0
+        }
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT value FROM task_queue_meta WHERE key = 'depth'"
+        ).fetchone()[0]
+
 
 class Producer:
-    """Производитель задач"""
-    
+    """
+    Производитель задач: постановка в очередь с приоритетом и задержкой.
+    При заполненной очереди действует ее политика overflow
+    (или переданная в submit).
+    """
+
     def __init__(self, task_queue):
         self.task_queue = task_queue
-        self.running = True
-    
-    def generate_task(self):
-        """Генерация задачи"""
-        task_types = ['process_order', 'send_email', 'update_inventory', 'generate_report']
-        task_type = random.choice(task_types)
-        task_data = {
-            'type': task_type,
-            'id': random.randint(1000, 9999),
-            'timestamp': time.time()
-        }
-        return task_data
-    
-    def run(self):
-        """Основной цикл производителя"""
-        while self.running:
-            task = self.generate_task()
-            self.task_queue.put(task)
-            print(f"Producer: создана задача {task['type']} #{task['id']}")
-            time.sleep(random.uniform(0.5, 2.0))
+
+    def submit(self, task_type, payload=None, priority='normal', delay=0, overflow=None, timeout=None):
+        return self.task_queue.put(task_type, payload, priority=priority, delay=delay,
+                                   overflow=overflow, timeout=timeout)
+
 
 class Consumer:
-    """Потребитель задач"""
-    
-    def __init__(self, task_queue, result_queue):
+    """
+    Потребитель задач: берет задачу из очереди, вызывает обработчик
+    ее типа и подтверждает выполнение или сообщает об ошибке.
+    handlers - словарь тип -> обработчик (handle(payload) и необязательный
+    атрибут timeout - таймаут видимости для задач этого типа).
+    on_done(task, duration, outcome) вызывается после каждой задачи.
+    """
+
+    def __init__(self, task_queue, handlers, name=None, poll_interval=0.5, max_priority=None, app=None,
+                 on_done=None):
         self.task_queue = task_queue
-        self.result_queue = result_queue
-        self.running = True
-    
-    def process_task(self, task):
-        """Обработка задачи"""
-        time.sleep(random.uniform(0.1, 1.0))  # Имитация обработки
-        
-        result = {
-            'task_id': task['id'],
-            'status': 'completed',
-            'processed_at': time.time(),
-            'message': f"Задача {task['type']} #{task['id']} обработана"
-        }
-        
-        return result
-    
+        self.handlers = handlers
+        self.name = name or f'consumer-{uuid.uuid4().hex[:8]}'
+        self.poll_interval = poll_interval
+        self.max_priority = max_priority
+        self.app = app
+        self.on_done = on_done
+        self.processed = 0
+        self.failed = 0
+        self.busy = False
+        self._stop = threading.Event()
+
+    def process_next(self):
+        """Обработка одной задачи; False, если готовых задач нет"""
+        task = self.task_queue.lease(self.name, max_priority=self.max_priority)
+        if task is None:
+            return False
+
+        self.busy = True
+        start_time = time.perf_counter()
+        try:
+            outcome = self._process(task)
+        finally:
+            self.busy = False
+
+        duration = time.perf_counter() - start_time
+        task_duration.observe(duration, type=task.type, outcome=outcome)
+        if self.on_done is not None:
+            self.on_done(task, duration, outcome)
+        return True
+
+    def _process(self, task):
+        handler = self.handlers.get(task.type)
+        if handler is None:
+            self.task_queue.fail(task, self.name, f"No handler for task type {task.type}", retry=False)
+            self.failed += 1
+            return 'dead'
+
+        timeout = getattr(handler, 'timeout', None)
+        if timeout:
+            self.task_queue.extend(task, self.name, timeout)
+
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    handler.handle(task.payload)
+            else:
+                handler.handle(task.payload)
+        except TaskError as e:
+            self.task_queue.fail(task, self.name, e, retry=False)
+            self.failed += 1
+            return 'dead'
+        except Exception as e:
+            outcome = self.task_queue.fail(task, self.name, e)
+            self.failed += 1
+            print(f"Consumer {self.name}: задача {task.type} #{task.id} завершилась ошибкой ({outcome}): {e}")
+            return outcome or 'lost'
+        else:
+            self.task_queue.complete(task, self.name)
+            self.processed += 1
+            return 'completed'
+
     def run(self):
         """Основной цикл потребителя"""
-        while self.running:
+        while not self._stop.is_set():
             try:
-                task = self.task_queue.get(timeout=1)
-                if task is None:
-                    break
-                
-                result = self.process_task(task)
-                self.result_queue.put(result)
-                print(f"Consumer: {result['message']}")
-                
-                self.task_queue.task_done()
-                
-            except queue.Empty:
-                continue
\ No newline at end of file
+                if not self.process_next():
+                    self._stop.wait(self.poll_interval)
+            except sqlite3.Error as e:
+                print(f"Consumer {self.name}: ошибка очереди: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+
+class TaskEngine:
+    """
+    Пул потребителей над одной очередью.
+    lanes задает выделенных потребителей для полос приоритета,
+    например {'high': 1}: один поток берет только задачи high,
+    чтобы срочные задачи не ждали за длинными низкоприоритетными.
+    Общий пул масштабируется между min_workers и max_workers: раз в
+    scale_interval оценивается время разбора очереди (готовые задачи *
+    средняя длительность / число потоков); если оно больше target_drain_time
+    или самая старая задача ждет дольше него, добавляется поток, если
+    очередь пуста и потоки простаивают - один поток останавливается.
+    """
+
+    THROUGHPUT_WINDOW = 60.0
+
+    def __init__(self, task_queue, handlers, workers=4, poll_interval=0.5, lanes=None, app=None,
+                 min_workers=None, max_workers=None, scale_interval=1.0, target_drain_time=5.0):
+        self.task_queue = task_queue
+        self.handlers = dict(handlers)
+        self.producer = Producer(task_queue)
+        self.poll_interval = poll_interval
+        self.app = app
+
+        self.min_workers = workers if min_workers is None else min_workers
+        self.max_workers = max(self.min_workers, workers if max_workers is None else max_workers)
+        self.scale_interval = scale_interval
+        self.target_drain_time = target_drain_time
+
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._completions = deque()
+        self._avg_duration = None
+        self._idle_checks = 0
+        self._supervisor = None
+        self._stop = threading.Event()
+        self._started_at = time.monotonic()
+        self.scale_events = {'up': 0, 'down': 0}
+
+        self.lanes = dict(lanes or {})
+        self.lane_consumers = self._new_lane_consumers()
+        self.consumers = list(self.lane_consumers)
+        # Остановленные при уменьшении пула: их потоки и счетчики
+        self._retired = []
+        self._retired_consumers = []
+
+        labels = {'queue': task_queue.name}
+        task_queue_depth.labels(**labels).set_function(lambda: self.task_queue.gauges()['ready'])
+        task_queue_oldest_age.labels(**labels).set_function(lambda: self.task_queue.gauges()['oldest_age'])
+        task_throughput.labels(**labels).set_function(self.throughput)
+        task_workers.labels(**labels).set_function(lambda: len(self._threads))
+
+    def _new_lane_consumers(self):
+        return [
+            self._new_consumer(max_priority=lane)
+            for lane, count in self.lanes.items()
+            for _ in range(count)
+        ]
+
+    def _new_consumer(self, max_priority=None):
+        return Consumer(self.task_queue, self.handlers, poll_interval=self.poll_interval,
+                        max_priority=max_priority, app=self.app, on_done=self._on_done)
+
+    def _on_done(self, task, duration, outcome):
+        now = time.monotonic()
+        with self._lock:
+            # Экспоненциальное среднее длительности для оценки времени разбора очереди
+            if self._avg_duration is None:
+                self._avg_duration = duration
+            else:
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            if outcome == 'completed':
+                self._completions.append(now)
+            self._trim_completions(now)
+
+    def _trim_completions(self, now):
+        while self._completions and now - self._completions[0] > self.THROUGHPUT_WINDOW:
+            self._completions.popleft()
+
+    def throughput(self):
+        """Задач в секунду за последнюю минуту (или с момента запуска)"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim_completions(now)
+            if not self._completions:
+                return 0.0
+            window = min(self.THROUGHPUT_WINDOW, max(now - self._started_at, 1e-6))
+            return len(self._completions) / window
+
+    def register(self, task_type, handler):
+        """Добавление обработчика типа задач"""
+        self.handlers[task_type] = handler
+
+    def submit(self, task_type, payload=None, priority='normal', delay=0, overflow=None, timeout=None):
+        if task_type not in self.handlers:
+            raise ValueError(f"Unknown task type: {task_type}")
+        return self.producer.submit(task_type, payload, priority=priority, delay=delay,
+                                    overflow=overflow, timeout=timeout)
+
+    def _start_consumer(self, consumer):
+        thread = threading.Thread(target=consumer.run, name=consumer.name, daemon=True)
+        self._threads[consumer.name] = thread
+        thread.start()
+
+    @property
+    def pool_consumers(self):
+        """Потребители общего пула (без выделенных полос)"""
+        return [consumer for consumer in self.consumers if consumer.max_priority is None]
+
+    def start(self):
+        """Запуск потоков потребителей и (если пул масштабируемый) супервизора"""
+        with self._lock:
+            if self._threads:
+                return self
+            self._started_at = time.monotonic()
+            self._stop.clear()
+            if any(consumer.stopped for consumer in self.lane_consumers):
+                # Потребители полос остановлены предыдущим stop() - создаются заново
+                self._retired_consumers.extend(self.lane_consumers)
+                self.lane_consumers = self._new_lane_consumers()
+                self.consumers = list(self.lane_consumers)
+            for _ in range(self.min_workers):
+                self.consumers.append(self._new_consumer())
+            for consumer in self.consumers:
+                self._start_consumer(consumer)
+
+        if self.max_workers > self.min_workers:
+            self._supervisor = threading.Thread(target=self._supervise, name='task-autoscaler', daemon=True)
+            self._supervisor.start()
+        return self
+
+    def _supervise(self):
+        while not self._stop.wait(self.scale_interval):
+            try:
+                self.autoscale()
+            except sqlite3.Error as e:
+                print(f"Task autoscaler: ошибка очереди: {e}")
+
+    def autoscale(self):
+        """Один шаг масштабирования; возвращает 'up', 'down' или None"""
+        gauges = self.task_queue.gauges()
+        with self._lock:
+            pool = self.pool_consumers
+            workers = len(pool)
+            avg_duration = self._avg_duration or 0.0
+            drain_time = gauges['ready'] * avg_duration / max(workers, 1)
+
+            if workers < self.max_workers and gauges['ready'] and (
+                    drain_time > self.target_drain_time or gauges['oldest_age'] > self.target_drain_time
+                    or workers == 0):
+                self._idle_checks = 0
+                consumer = self._new_consumer()
+                self.consumers.append(consumer)
+                self._start_consumer(consumer)
+                self.scale_events['up'] += 1
+                return 'up'
+
+            idle = not gauges['ready'] and not any(consumer.busy for consumer in pool)
+            self._idle_checks = self._idle_checks + 1 if idle else 0
+            # Уменьшение - только после нескольких проверок подряд, чтобы пул не "дрожал"
+            if workers > self.min_workers and self._idle_checks >= 3:
+                self._idle_checks = 0
+                consumer = pool[-1]
+                consumer.stop()
+                self.consumers.remove(consumer)
+                self._retired.append(self._threads.pop(consumer.name))
+                self._retired_consumers.append(consumer)
+                self.scale_events['down'] += 1
+                return 'down'
+        return None
+
+    def stop(self, timeout=10.0):
+        """Остановка: текущие задачи дорабатываются, невыданные остаются в очереди"""
+        self._stop.set()
+        with self._lock:
+            for consumer in self.consumers:
+                consumer.stop()
+            threads = list(self._threads.values()) + self._retired
+            self._threads = {}
+            self._retired = []
+            # Общий пул создается заново при следующем start()
+            self._retired_consumers.extend(self.pool_consumers)
+            self.consumers = list(self.lane_consumers)
+
+        deadline = time.monotonic() + timeout
+        if self._supervisor is not None:
+            self._supervisor.join(max(0.0, deadline - time.monotonic()))
+            self._supervisor = None
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        stats = self.task_queue.stats()
+        stats.update(self.task_queue.gauges())
+        with self._lock:
+            consumers = self.consumers + self._retired_consumers
+            stats['workers'] = len(self._threads)
+            stats['scale_events'] = dict(self.scale_events)
+            stats['avg_duration'] = self._avg_duration
+        stats['processed'] = sum(consumer.processed for consumer in consumers)
+        stats['failed'] = sum(consumer.failed for consumer in consumers)
+        stats['throughput'] = self.throughput()
+        stats['shed'] = self.task_queue.shed
+        return stats
+
+
+def create_task_engine(handlers, config=None, app=None):
+    """Очередь и пул потребителей по настройкам TASK_*"""
+    config = config or {}
+    path = config.get('TASK_QUEUE_PATH', 'tasks.db')
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    task_queue = SQLiteTaskQueue(
+        path,
+        visibility_timeout=config.get('TASK_VISIBILITY_TIMEOUT', 30.0),
+        max_attempts=config.get('TASK_MAX_ATTEMPTS', 5),
+        retry_base_delay=config.get('TASK_RETRY_BASE_DELAY', 1.0),
+        retry_max_delay=config.get('TASK_RETRY_MAX_DELAY', 300.0),
+        max_size=config.get('TASK_QUEUE_MAX_SIZE'),
+        overflow=config.get('TASK_OVERFLOW_POLICY', 'block'),
+        put_timeout=config.get('TASK_PUT_TIMEOUT', 5.0)
+    )
+    return TaskEngine(
+        task_queue,
+        handlers,
+        workers=config.get('TASK_WORKERS', 4),
+        poll_interval=config.get('TASK_POLL_INTERVAL', 0.5),
+        lanes=config.get('TASK_LANES'),
+        app=app,
+        min_workers=config.get('TASK_MIN_WORKERS'),
+        max_workers=config.get('TASK_MAX_WORKERS'),
+        scale_interval=config.get('TASK_SCALE_INTERVAL', 1.0),
+        target_drain_time=config.get('TASK_TARGET_DRAIN_TIME', 5.0)
+    )
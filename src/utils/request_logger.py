@@ -0,0 +1,185 @@
+"""
+Асинхронное журналирование запросов: записи копятся в ограниченном
+буфере и пишутся фоновым потоком пачками в формате JSON lines
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+
+class AsyncRequestLogger:
+    """
+    Неблокирующий журнал запросов.
+    Поток запроса только кладет запись в буфер (O(1), без ввода-вывода);
+    фоновый поток пишет накопленные записи пачками. При переполнении
+    буфера новые записи отбрасываются и учитываются в счетчике dropped.
+    sample_rates задает долю сохраняемых записей для нагруженных маршрутов:
+    ключ - шаблон маршрута (поле route, например '/products/<int:product_id>'),
+    для записей без route - путь из поля endpoint.
+    """
+
+    def __init__(self, sink=None, capacity=10000, batch_size=200, flush_interval=0.5, sample_rates=None):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rates = dict(sample_rates or {})
+
+        self._sink = sink
+        self._stream = None
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._closing = False
+        self._flush_requested = False
+        self._pending = 0
+        self._thread = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def start(self):
+        """Запуск фонового потока записи"""
+        with self._condition:
+            if self._thread is None:
+                self._closing = False
+                self._thread = threading.Thread(target=self._run, name='request-logger', daemon=True)
+                self._thread.start()
+        return self
+
+    def log(self, record):
+        """Постановка записи в очередь; возвращает False, если запись отброшена"""
+        rate = self.sample_rates.get(record.get('route', record.get('endpoint')))
+        sampled_out = rate is not None and random.random() >= rate
+
+        with self._condition:
+            if sampled_out:
+                self.sampled_out += 1
+                return False
+
+            if len(self._buffer) >= self.capacity:
+                self.dropped += 1
+                return False
+
+            self._buffer.append(record)
+            self._pending += 1
+            self.enqueued += 1
+            # Писатель будится только на полной пачке, остальное - по таймеру
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+        if self._thread is None:
+            self.start()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._buffer) < self.batch_size and not (self._closing or self._flush_requested):
+                    self._condition.wait(self.flush_interval)
+
+                if not self._buffer:
+                    self._flush_requested = False
+                    if self._closing:
+                        return
+                    continue
+
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+            self._write(batch)
+
+            with self._condition:
+                self._pending -= len(batch)
+                self._condition.notify_all()
+
+    def _write(self, batch):
+        """Запись пачки в приемник одной операцией"""
+        payload = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in batch)
+        try:
+            stream = self._get_stream()
+            stream.write(payload)
+            stream.flush()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.write_errors += 1
+            print(f"Request logger write failed: {e}")
+
+    def _get_stream(self):
+        if self._stream is None:
+            if self._sink is None:
+                self._stream = sys.stdout
+            elif isinstance(self._sink, str):
+                self._stream = open(self._sink, 'a', encoding='utf-8')
+            else:
+                self._stream = self._sink
+        return self._stream
+
+    def flush(self, timeout=5.0):
+        """Ожидание записи всех поставленных в очередь записей"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # Неполная пачка пишется сразу, без ожидания таймера
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Дозапись буфера и остановка фонового потока"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+        if isinstance(self._sink, str) and self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def stats(self):
+        """Счетчики журнала"""
+        with self._condition:
+            return {
+                'buffered': len(self._buffer),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'sampled_out': self.sampled_out,
+                'batches': self.batches,
+                'write_errors': self.write_errors
+            }
+
+
+_request_logger = None
+_request_logger_lock = threading.Lock()
+
+
+def get_request_logger(config=None):
+    """Журнал запросов процесса (создается при первом обращении по настройкам REQUEST_LOG_*)"""
+    global _request_logger
+    if _request_logger is None:
+        config = config or {}
+        with _request_logger_lock:
+            if _request_logger is None:
+                _request_logger = AsyncRequestLogger(
+                    sink=config.get('REQUEST_LOG_PATH'),
+                    capacity=config.get('REQUEST_LOG_BUFFER_SIZE', 10000),
+                    batch_size=config.get('REQUEST_LOG_BATCH_SIZE', 200),
+                    flush_interval=config.get('REQUEST_LOG_FLUSH_INTERVAL', 0.5),
+                    sample_rates=config.get('REQUEST_LOG_SAMPLE_RATES')
+                ).start()
+    return _request_logger
@@ -0,0 +1,54 @@
+"""
+Действия после фиксации транзакции: изменения, которые зависят от данных
+в базе (индексы и кэши в памяти), применяются только после commit
+"""
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+_PENDING_KEY = 'after_commit_callbacks'
+
+
+def on_commit(session, callback):
+    """
+    Вызов callback() после commit внешней транзакции session.
+    Если транзакция (или точка сохранения, в которой вызвана функция)
+    откатывается, callback отбрасывается. В callback нельзя обращаться
+    к базе и к истекшим атрибутам объектов - нужные значения следует
+    сохранить заранее.
+    """
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    if transaction is None:
+        callback()
+        return
+    session.info.setdefault(_PENDING_KEY, []).append((transaction, callback))
+
+
+def _descends_from(transaction, ancestor):
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_pending(session):
+    if session.get_nested_transaction() is not None:
+        # Фиксация точки сохранения: внешняя транзакция еще может откатиться
+        return
+    for _, callback in session.info.pop(_PENDING_KEY, ()):
+        callback()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    # Срабатывает при любом откате, в том числе точки сохранения:
+    # отбрасываются только действия из откаченной транзакции
+    pending = session.info.get(_PENDING_KEY)
+    if pending:
+        session.info[_PENDING_KEY] = [
+            (transaction, callback) for transaction, callback in pending
+            if not _descends_from(transaction, previous_transaction)
+        ]
@@ -8,10 +8,17 @@ class Observer(ABC):
         pass
 
 class Subject:
-    """Субъект для наблюдения"""
+    """
+    Субъект для наблюдения.
+    С dispatcher (EventDispatcher) наблюдатели вызываются в пуле потоков,
+    и notify не ждет доставки; ordered=True сохраняет порядок событий
+    для каждого наблюдателя этого субъекта.
+    """
     
-    def __init__(self):
+    def __init__(self, dispatcher=None, ordered=True):
         self._observers = []
+        self.dispatcher = dispatcher
+        self.ordered = ordered
     
     def attach(self, observer: Observer):
         """Добавить наблюдателя"""
@@ -23,8 +30,21 @@ class Subject:
     
     def notify(self, message):
         """Уведомить всех наблюдателей"""
-        for observer in self._observers:
-            observer.update(message)
+        if self.dispatcher is None:
+            for observer in self._observers:
+                observer.update(message)
+            return
+        
+        # Каждый наблюдатель - отдельная задача: медленный канал не задерживает остальные
+        for observer in list(self._observers):
+            key = (id(self), id(observer)) if self.ordered else None
+            self.dispatcher.submit(observer.update, message, key=key)
+    
+    def flush(self, timeout=5.0):
+        """Ожидание доставки отправленных уведомлений"""
+        if self.dispatcher is None:
+            return True
+        return self.dispatcher.flush(timeout)
 
 class EmailNotifier(Observer):
     """Наблюдатель для email уведомлений"""
@@ -5,7 +5,9 @@
 import pytest
 import sys
 import os
+from contextlib import contextmanager
 from datetime import datetime
+from sqlalchemy import event
 
 # Добавляем путь к проекту
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -382,6 +384,107 @@ class TestModelRelationships:
             
             print("✓ Relationships: Связь Order-Product работает корректно")
 
+class TestQueryEfficiency:
+    """Тесты количества SQL-запросов при работе с моделями"""
+    
+    def setup_method(self):
+        """Настройка тестовых данных"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        
+        with app.app_context():
+            db.create_all()
+            
+            self.user = User(
+                username='queryuser',
+                email='query@example.com',
+                password_hash='hash'
+            )
+            db.session.add(self.user)
+            db.session.commit()
+            self.user_id = self.user.id
+    
+    def teardown_method(self):
+        """Очистка тестовых данных"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    @contextmanager
+    def count_queries(self):
+        """Подсчет SQL-запросов, выполненных внутри блока"""
+        statements = []
+        
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    
+    def _fill_cart(self, items_count, user_id=None):
+        """Создание корзины с заданным количеством позиций"""
+        cart = Cart(user_id=user_id or self.user_id)
+        cart.save()
+        
+        for i in range(items_count):
+            product = Product(
+                name=f'Query Product {i}',
+                price=10.0 + i,
+                category='Test',
+                stock=100
+            )
+            db.session.add(product)
+            db.session.flush()
+            cart.add_item(product.id, 2)
+        
+        db.session.expunge_all()
+    
+    def test_cart_to_dict_eager_query_count(self):
+        """Тест фиксированного числа запросов при сериализации корзины"""
+        with app.app_context():
+            query_counts = []
+            
+            for items_count in (1, 40):
+                user = User(
+                    username=f'queryuser{items_count}',
+                    email=f'query{items_count}@example.com',
+                    password_hash='hash'
+                )
+                db.session.add(user)
+                db.session.commit()
+                user_id = user.id
+                self._fill_cart(items_count, user_id)
+                
+                with self.count_queries() as statements:
+                    cart = Cart.get_by_user(user_id, with_products=True)
+                    data = cart.to_dict()
+                
+                assert len(data['items']) == items_count
+                assert data['total'] == sum(item['subtotal'] for item in data['items'])
+                query_counts.append(len(statements))
+                db.session.expunge_all()
+            
+            # Число запросов не зависит от размера корзины
+            assert query_counts[0] == query_counts[1] == 1
+            
+            print("✓ Cart: Сериализация корзины выполняется одним запросом")
+    
+    def test_cart_to_dict_lazy_and_eager_match(self):
+        """Тест совпадения результата ленивой и жадной загрузки"""
+        with app.app_context():
+            self._fill_cart(5)
+            lazy_data = Cart.get_by_user(self.user_id).to_dict()
+            db.session.expunge_all()
+            eager_data = Cart.get_by_user(self.user_id, with_products=True).to_dict()
+            
+            assert lazy_data == eager_data
+            assert eager_data['total'] == sum(2 * (10.0 + i) for i in range(5))
+            
+            print("✓ Cart: Жадная загрузка возвращает те же данные")
+
 if __name__ == '__main__':
     # Запуск тестов с выводом результатов
     print("="*60)
@@ -393,7 +496,8 @@ if __name__ == '__main__':
         TestSingletonPattern(),
         TestModels(),
         TestFactoryPattern(),
-        TestModelRelationships()
+        TestModelRelationships(),
+        TestQueryEfficiency()
     ]
     
     # Запускаем тесты
@@ -3,10 +3,16 @@
 """
 
 import pytest
+import asyncio
+import re
 import sys
 import os
+import tempfile
 import time
+import threading
 from unittest.mock import Mock, patch, MagicMock
+from jinja2 import DictLoader, Environment
+from sqlalchemy import event
 
 # Добавляем путь к проекту
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -15,12 +21,35 @@ from src import app, db
 from src.services import ProductService, OrderService, PaymentService
 from src.services.facade.ecommerce_facade import ECommerceFacade
 from src.services.notification_service import NotificationService
+from src.services.email_templates import EmailTemplate, create_email_templates
+from src.services.search_index import ProductSearchIndex, product_search_index, tokenize
+from src.utils.cache import LRUCache, EntityCache, EntitySnapshot
+from src.utils.decorators import retry_decorator
+from src.utils.event_dispatcher import EventDispatcher
+from src.api.gateway import APIGateway
+from src.api.middleware import rate_limit, authenticate
+from src.api.rate_limiter import MemoryRateLimitStore, SQLiteRateLimitStore
+from src.api.resilience import (
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    Bulkhead,
+    BulkheadFullError,
+    RetryBudget,
+    RetryPolicy,
+    DeadlineExceededError
+)
 from src.api.adapters.payment_adapter import (
     LegacyPaymentSystem, 
     NewPaymentSystem, 
     PaymentAdapter,
-    PaymentProcessor
+    PaymentProcessor,
+    PayPalSystem
 )
+from src.api.adapters.payment_executor import PaymentExecutor
+from src.api.adapters.payment_adapter import PaymentBinding, payment_providers
+from src.api.adapters.shipping_adapter import shipping_providers
+from src.api.adapters.shipping_quotes import ShippingQuoteEngine
 from src.api.adapters.shipping_adapter import (
     ShippingAdapter,
     FedExService,
@@ -116,6 +145,95 @@ class TestObserverPattern:
         assert "Заказ #456 отправлен" in str(calls[1])
         
         print("✓ Observer: OrderNotifier отправляет правильные уведомления")
+    
+    def test_async_dispatch_order_and_isolation(self):
+        """Тест асинхронной доставки: порядок событий и изоляция сбоев"""
+        dispatcher = EventDispatcher(workers=4, queue_size=100)
+        notifier = OrderNotifier(dispatcher=dispatcher)
+        
+        received = []
+        slow_started = threading.Event()
+        
+        class SlowObserver(Observer):
+            def update(self, message):
+                slow_started.set()
+                time.sleep(0.05)
+                received.append(message)
+        
+        class FailingObserver(Observer):
+            def update(self, message):
+                raise RuntimeError('SMTP down')
+        
+        notifier.attach(SlowObserver())
+        notifier.attach(FailingObserver())
+        
+        start = time.perf_counter()
+        for order_id in range(5):
+            notifier.order_created(order_id)
+        elapsed = time.perf_counter() - start
+        
+        # notify не ждет медленного наблюдателя
+        assert elapsed < 0.05
+        assert notifier.flush(timeout=2)
+        
+        # События одного субъекта доходят до наблюдателя по порядку
+        assert received == [f"Создан новый заказ #{i}" for i in range(5)]
+        stats = dispatcher.stats()
+        assert stats['completed'] == 5
+        assert stats['failed'] == 5
+        
+        dispatcher.close()
+        print(f"✓ Observer: Асинхронная доставка, notify за {elapsed * 1000:.1f} мс")
+    
+    def test_async_dispatch_overflow_runs_inline(self):
+        """Тест обратного давления: при переполнении очереди событие доставляется синхронно"""
+        dispatcher = EventDispatcher(workers=1, queue_size=1, put_timeout=0.01)
+        subject = Subject(dispatcher=dispatcher, ordered=False)
+        
+        release = threading.Event()
+        observer = Mock(spec=Observer)
+        observer.update.side_effect = lambda message: release.wait(1)
+        subject.attach(observer)
+        
+        subject.notify('first')    # Занимает рабочий поток
+        time.sleep(0.02)
+        subject.notify('second')   # Встает в очередь
+        threading.Timer(0.1, release.set).start()
+        subject.notify('third')    # Очередь полна - выполняется в вызывающем потоке
+        
+        assert subject.flush(timeout=2)
+        assert observer.update.call_count == 3
+        assert dispatcher.stats()['inline'] == 1
+        
+        dispatcher.close()
+        print("✓ Observer: Переполнение очереди не теряет события")
+    
+    def test_async_dispatch_overflow_keeps_order(self):
+        """Тест: при переполнении упорядоченные события ждут очереди, а не обгоняют ее"""
+        dispatcher = EventDispatcher(workers=1, queue_size=1, put_timeout=0.01)
+        subject = Subject(dispatcher=dispatcher)
+        
+        received = []
+        release = threading.Event()
+        
+        class RecordingObserver(Observer):
+            def update(self, message):
+                release.wait(1)
+                received.append(message)
+        
+        subject.attach(RecordingObserver())
+        subject.notify('first')
+        time.sleep(0.02)
+        subject.notify('second')
+        threading.Timer(0.1, release.set).start()
+        subject.notify('third')    # Очередь полна - ожидание места
+        
+        assert subject.flush(timeout=2)
+        assert received == ['first', 'second', 'third']
+        assert dispatcher.stats()['inline'] == 0
+        
+        dispatcher.close()
+        print("✓ Observer: Переполнение не нарушает порядок событий")
 
 class TestAdapterPattern:
     """Тесты для Adapter паттерна"""
@@ -226,6 +344,298 @@ class TestAdapterPattern:
         assert 'estimated_days' in result
         
         print("✓ Adapter: ShippingAdapter работает с FedExService")
+    
+    def test_payment_adapter_async_with_provider_limit(self):
+        """Тест асинхронных платежей с лимитом одновременных вызовов провайдера"""
+        executor = PaymentExecutor(limits={'slow-bank': 3}).start()
+        adapter = PaymentAdapter(NewPaymentSystem(latency=0.05), executor=executor, provider='slow-bank')
+        
+        async def checkout():
+            return await asyncio.gather(*[
+                adapter.process_async(100 + i, {'currency': 'EUR'}) for i in range(9)
+            ])
+        
+        start_time = time.perf_counter()
+        results = executor.run(checkout())
+        elapsed = time.perf_counter() - start_time
+        
+        # 9 платежей по 3 одновременно - три "волны" ожидания провайдера
+        assert [result['amount'] for result in results] == [100 + i for i in range(9)]
+        assert 0.15 <= elapsed < 0.45
+        assert executor.stats()['peak_in_flight']['slow-bank'] == 3
+        
+        # Синхронный мост для Flask и возврат через тот же исполнитель
+        assert adapter.process(50, {'currency': 'USD'})['success']
+        assert adapter.refund('PAY-1', 50)['status'] == 'refunded'
+        
+        # Повторный вход в цикл исполнителя запрещен (взаимная блокировка)
+        async def nested():
+            return adapter.process(1, {})
+        
+        with pytest.raises(RuntimeError):
+            executor.run(nested())
+        executor.close()
+        
+        print("✓ Adapter: Асинхронные платежи ограничены лимитом провайдера")
+    
+    def test_payment_batches(self):
+        """Тест пакетных платежей и возвратов: группировка по провайдерам и прогресс"""
+        executor = PaymentExecutor(limits={'LegacyPaymentSystem': 4}).start()
+        processor = PaymentProcessor(executor=executor)
+        processor.register_adapter('legacy', LegacyPaymentSystem(latency=0.02))
+        processor.register_adapter('new', NewPaymentSystem(latency=0.02))
+        
+        payments = []
+        for i in range(40):
+            if i % 2:
+                payments.append(('legacy', 10 + i, {'customer_id': f'C{i}', 'invoice_number': f'INV{i}'}))
+            else:
+                payments.append(('new', 10 + i, {'currency': 'EUR'}))
+        payments.append(('missing', 1, {}))
+        
+        progress = []
+        results = processor.process_batch(payments, progress=lambda index, result, done, total: progress.append(done))
+        
+        assert [result.get('amount') for result in results[:-1]] == [10 + i for i in range(40)]
+        assert results[-1] == {'success': False, 'error': 'Adapter missing not found'}
+        assert progress == list(range(1, 42))
+        
+        stats = executor.stats()
+        # 20 платежей legacy - не больше 4 одновременно; 20 платежей new - один пакетный вызов
+        assert stats['peak_in_flight']['LegacyPaymentSystem'] == 4
+        assert stats['completed']['NewPaymentSystem'] == 1
+        
+        refunds = processor.refund_batch([('new', 'PAY-1', 5), ('legacy', 'TX1', 7), ('new', 'PAY-2', 6)])
+        assert [refund['refund_id'] for refund in refunds] == ['REF-PAY-1', 'REF-TX1', 'REF-PAY-2']
+        executor.close()
+        
+        print("✓ Adapter: Пакетные платежи и возвраты по провайдерам")
+    
+    def test_sync_provider_does_not_block_loop(self):
+        """Тест: синхронный вызов провайдера не останавливает другие платежи"""
+        class SlowPayPal(PayPalSystem):
+            def send_payment(self, receiver_email, amount, description):
+                time.sleep(0.5)
+                return super().send_payment(receiver_email, amount, description)
+        
+        executor = PaymentExecutor().start()
+        paypal = PaymentAdapter(SlowPayPal(), executor=executor)
+        new = PaymentAdapter(NewPaymentSystem(latency=0.05), executor=executor)
+        
+        slow = executor.submit(paypal.process_async(10, {}))
+        time.sleep(0.05)
+        start_time = time.perf_counter()
+        assert new.process(20, {})['success']
+        elapsed = time.perf_counter() - start_time
+        
+        assert slow.result(2)['success']
+        assert elapsed < 0.3
+        executor.close()
+        
+        print("✓ Adapter: Синхронные провайдеры выполняются вне цикла событий")
+    
+    def test_payment_batch_stream(self):
+        """Тест потока результатов пакета в порядке завершения"""
+        executor = PaymentExecutor().start()
+        adapter = PaymentAdapter(LegacyPaymentSystem(latency=0), executor=executor)
+        
+        async def collect():
+            return [index async for index, _ in adapter.iter_process_batch([(i, {}) for i in range(5)], concurrency=2)]
+        
+        assert sorted(executor.run(collect())) == list(range(5))
+        assert all(result['success'] for result in adapter.process_batch([(1, {}), (2, {})]))
+        executor.close()
+        
+        print("✓ Adapter: Поток результатов пакета")
+
+    def test_payment_batch_response_length(self):
+        """Тест: короткий или длинный ответ пакетного API не портит результаты"""
+        class ShortBatchSystem(NewPaymentSystem):
+            max_batch_size = 3
+
+            async def process_batch_async(self, payments):
+                return (await super().process_batch_async(payments))[:-1]
+
+        class LongBatchSystem(NewPaymentSystem):
+            max_batch_size = 3
+
+            async def process_batch_async(self, payments):
+                results = await super().process_batch_async(payments)
+                return results + results[:1]
+
+        executor = PaymentExecutor().start()
+        payments = [(10 + i, {'currency': 'EUR'}) for i in range(6)]
+
+        results = PaymentAdapter(ShortBatchSystem(latency=0), executor=executor).process_batch(payments)
+        assert [result['success'] for result in results] == [True, True, False, True, True, False]
+        assert results[2]['error'] == 'No result in batch response'
+        assert [results[i]['amount'] for i in (0, 1, 3, 4)] == [10, 11, 13, 14]
+
+        # Лишний ответ пачки не перезаписывает результаты следующей пачки
+        results = PaymentAdapter(LongBatchSystem(latency=0), executor=executor).process_batch(payments)
+        assert [result['success'] for result in results] == [False] * 6
+        assert all('4 results for 3 operations' in result['error'] for result in results)
+        executor.close()
+
+        print("✓ Adapter: Длина ответа пакетного API проверяется")
+    
+    def test_provider_registration(self):
+        """Тест подключения нового провайдера регистрацией привязки"""
+        class StripeLikeSystem:
+            def charge(self, cents):
+                return {'id': f'ch_{cents}', 'paid': True}
+        
+        with pytest.raises(ValueError):
+            PaymentAdapter(StripeLikeSystem())
+        
+        @payment_providers.register(StripeLikeSystem)
+        class StripeLikeBinding(PaymentBinding):
+            features = ('payments',)
+            
+            async def process(self, amount, details):
+                result = self.system.charge(int(amount * 100))
+                return {'success': result['paid'], 'payment_id': result['id'], 'amount': amount}
+        
+        # Подклассы зарегистрированного провайдера получают ту же привязку
+        class RegionalStripeLikeSystem(StripeLikeSystem):
+            pass
+        
+        adapter = PaymentAdapter(RegionalStripeLikeSystem())
+        assert adapter.process(12.5, {})['payment_id'] == 'ch_1250'
+        assert adapter.get_system_info()['features'] == ['payments']
+        assert payment_providers.resolve(RegionalStripeLikeSystem) is StripeLikeBinding
+        
+        print("✓ Adapter: Новый провайдер подключается регистрацией")
+    
+    def test_shipping_binding_resolution(self):
+        """Тест привязок служб доставки: регистрация и распознавание по методам"""
+        ups = ShippingAdapter(UPSService())
+        assert ups.calculate_shipping('Moscow', 1, '10x10x10')['price'] == 8.99
+        assert ups.create_shipment(7, 'Moscow', [])['tracking_code'] == 'UPS7'
+        assert ups.track_shipment('UPS7')['state'] == 'Delivered'
+        
+        class QuoteOnlyCarrier:
+            def get_shipping_cost(self, destination, package_weight, package_dimensions):
+                return {'carrier': 'Quote', 'cost': 1.0, 'estimated_days': 5}
+        
+        adapter = ShippingAdapter(QuoteOnlyCarrier())
+        assert adapter.calculate_shipping('Moscow', 1, '10x10x10')['carrier'] == 'Quote'
+        with pytest.raises(ValueError, match='Unsupported tracking method'):
+            adapter.track_shipment('X1')
+        
+        # Интерфейс незарегистрированной службы определяется один раз на тип
+        assert shipping_providers.resolve(QuoteOnlyCarrier) is shipping_providers.resolve(QuoteOnlyCarrier)
+        
+        print("✓ Adapter: Привязки служб доставки определяются при создании адаптера")
+    
+    def test_shipping_quote_engine(self):
+        """Тест параллельного опроса служб доставки, таймаута и кэша тарифов"""
+        calls = []
+        
+        class SlowCarrier:
+            def get_shipping_cost(self, destination, package_weight, package_dimensions):
+                calls.append((destination, package_weight, package_dimensions))
+                time.sleep(1.0)
+                return {'carrier': 'Slow', 'cost': 1.0, 'estimated_days': 9}
+        
+        class CountingFedEx(FedExService):
+            def get_shipping_cost(self, destination, package_weight, package_dimensions):
+                calls.append((destination, package_weight, package_dimensions))
+                return super().get_shipping_cost(destination, package_weight, package_dimensions)
+        
+        engine = ShippingQuoteEngine(timeout=1.0, weight_step=0.5, dimension_step=10)
+        engine.register('fedex', CountingFedEx())
+        engine.register('ups', UPSService())
+        engine.register('slow', SlowCarrier(), timeout=0.1)
+        
+        start_time = time.perf_counter()
+        result = engine.quote('Moscow, Tverskaya 1', 2.3, '30x20x15 cm')
+        elapsed = time.perf_counter() - start_time
+        
+        # Медленная служба не задерживает ответ дольше своего таймаута
+        assert elapsed < 0.5
+        assert result['errors'] == {'slow': 'timeout'}
+        assert result['cheapest']['carrier_id'] == 'ups'
+        assert result['fastest']['carrier_id'] == 'ups'
+        assert [quote['cost'] for quote in result['quotes']] == [8.99, 10.99]
+        # Службам передаются верхние границы корзин веса и размеров
+        assert calls[0][1:] == (2.5, '30x20x20 cm')
+        
+        # Та же зона и корзины - ответ из кэша, без запросов к FedEx и UPS
+        fedex_calls = len([call for call in calls if call[1] == 2.5])
+        engine.unregister('slow')
+        cached = engine.quote('  moscow tverskaya 1 ', 2.1, '28x20x12cm')
+        assert cached['cached']
+        assert cached['quotes'] == result['quotes']
+        assert len([call for call in calls if call[1] == 2.5]) == fedex_calls
+        engine.close()
+        
+        print("✓ Adapter: Расчет доставки у всех служб с кэшем тарифов")
+    
+    def test_hung_carrier_does_not_starve_others(self):
+        """Тест: зависшая служба не занимает потоки остальных служб"""
+        hang = threading.Event()
+        
+        class HungCarrier:
+            def get_shipping_cost(self, destination, package_weight, package_dimensions):
+                hang.wait(5)
+                return {'carrier': 'Hung', 'cost': 1.0, 'estimated_days': 1}
+        
+        engine = ShippingQuoteEngine(timeout=0.5, carrier_workers=2)
+        engine.register('fedex', FedExService())
+        engine.register('hung', HungCarrier(), timeout=0.05)
+        try:
+            for i in range(10):
+                engine.quote(f'Address {i}', 1.0, '10x10x10 cm')
+            
+            start_time = time.perf_counter()
+            result = engine.quote('Fresh address', 1.0, '10x10x10 cm')
+            
+            # Потоки зависшей службы заняты - отказ сразу, FedEx отвечает
+            assert [quote['carrier_id'] for quote in result['quotes']] == ['fedex']
+            assert result['errors'] == {'hung': 'busy'}
+            assert time.perf_counter() - start_time < 0.3
+        finally:
+            hang.set()
+            engine.close()
+        
+        print("✓ Adapter: Зависшая служба доставки не блокирует остальные")
+    
+    def test_shipping_batches(self):
+        """Тест пакетного создания отправлений и отслеживания"""
+        batches = []
+        
+        class CountingFedEx(FedExService):
+            max_batch_size = 2
+            
+            def create_shipments(self, shipments):
+                batches.append(len(shipments))
+                return super().create_shipments(shipments)
+            
+            def track_packages(self, tracking_numbers):
+                if 'FXbad' in tracking_numbers:
+                    raise ConnectionError('carrier unavailable')
+                return super().track_packages(tracking_numbers)
+        
+        fedex = ShippingAdapter(CountingFedEx())
+        results = fedex.create_shipments([(order_id, 'Moscow', []) for order_id in range(1, 6)], concurrency=2)
+        
+        # Пакеты по max_batch_size, результаты - в порядке заказов
+        assert sorted(batches) == [1, 2, 2]
+        assert [r['tracking_number'] for r in results] == [f"FX{i}" for i in range(1, 6)]
+        
+        tracked = fedex.track_many(['FX1', 'FX2', 'FXbad', 'FX4'])
+        assert [r['success'] for r in tracked] == [True, True, False, False]
+        assert tracked[0]['status'] == 'in_transit'
+        assert tracked[0]['details']['location'] == 'New York'
+        
+        # UPS без пакетного API - по одному отправлению на вызов
+        ups = ShippingAdapter(UPSService())
+        assert [r['tracking_number'] for r in ups.create_shipments([(7, 'Moscow', []), (8, 'Moscow', [])])] == ['UPS7', 'UPS8']
+        assert ups.track_many(['UPS7'])[0]['status'] == 'delivered'
+        assert ups.track_many([]) == []
+        
+        print("✓ Adapter: Пакетное создание отправлений и отслеживание")
 
 class TestFacadePattern:
     """Тесты для Facade паттерна"""
@@ -348,6 +758,7 @@ class TestFacadePattern:
         # Первый вызов - должен кэшировать
         with patch('src.models.User.get_by_id') as mock_get_user:
             mock_user = Mock(id=1, username='testuser')
+            mock_user.to_dict.return_value = {'id': 1, 'username': 'testuser'}
             mock_get_user.return_value = mock_user
             
             user1 = facade._get_user(1)
@@ -617,6 +1028,1082 @@ class TestServiceIntegration:
         service.update("Test message")
         
         print("✓ Service: NotificationService отправляет уведомления")
+    
+    @patch('smtplib.SMTP')
+    def test_notification_service_send_bulk(self, mock_smtp):
+        """Тест массовой отправки через одну авторизованную SMTP-сессию"""
+        mock_server = mock_smtp.return_value
+        
+        service = NotificationService({
+            'MAIL_SERVER': 'smtp.example.com',
+            'MAIL_PORT': 587,
+            'MAIL_USE_TLS': 'True',
+            'MAIL_USERNAME': 'shop@example.com',
+            'MAIL_PASSWORD': 'password',
+            'MAIL_POOL_SIZE': 1
+        })
+        
+        result = service.send_bulk([
+            {'to_email': f'user{i}@example.com', 'subject': 'Promo', 'body': f'Offer #{i}'}
+            for i in range(5)
+        ])
+        service.send_email('user5@example.com', 'Promo', 'Offer #5')
+        service.close()
+        
+        assert result == {'sent': 5, 'failed': 0, 'errors': {}}
+        # Подключение, STARTTLS и login - один раз на все письма
+        assert mock_smtp.call_count == 1
+        mock_server.starttls.assert_called_once()
+        mock_server.login.assert_called_once_with('shop@example.com', 'password')
+        assert mock_server.send_message.call_count == 6
+        mock_server.quit.assert_called_once()
+        
+        print("✓ Service: NotificationService переиспользует SMTP-сессию")
+
+class TestEmailTemplates:
+    """Тесты шаблонов писем"""
+    
+    def test_render_matches_fields(self):
+        """Тест подстановки полей получателя в текст и HTML"""
+        templates = create_email_templates({'PASSWORD_RESET_URL': 'https://shop.test/reset'})
+        
+        email = templates.render('password_reset', username='<anna>', reset_token='abc123')
+        
+        assert email.subject == 'Password Reset Request'
+        assert 'Hello <anna>,' in email.body
+        assert 'https://shop.test/reset?token=abc123' in email.body
+        assert 'This link will expire in 1 hour.' in email.body
+        # В HTML значения получателя экранируются
+        assert '<p>Hello &lt;anna&gt;,</p>' in email.html_body
+        assert 'href="https://shop.test/reset?token=abc123"' in email.html_body
+        
+        with pytest.raises(KeyError):
+            templates.render('password_reset', username='anna')
+        
+        print("✓ Templates: Поля получателя подставляются и экранируются")
+    
+    def test_batch_reuses_compiled_template(self):
+        """Тест пакетного рендеринга по одному скомпилированному шаблону"""
+        templates = create_email_templates()
+        
+        recipients = [{'username': f'user{i}', 'order_id': i} for i in range(100)]
+        emails = templates.render_batch('order_confirmation', recipients)
+        
+        assert templates.get('order_confirmation') is templates.get('order_confirmation')
+        assert [email.subject for email in emails[:2]] == ['Order Confirmation #0', 'Order Confirmation #1']
+        assert '<strong>#99</strong>' in emails[99].html_body
+        
+        print("✓ Templates: 100 писем по одному скомпилированному шаблону")
+    
+    def test_fields_must_be_plain_substitutions(self):
+        """Тест отказа от шаблона, который вычисляет что-то из полей получателя"""
+        env = Environment(loader=DictLoader({'bad.txt': 'Hello {{ username|upper }}'}))
+        
+        with pytest.raises(ValueError):
+            EmailTemplate('bad', 'Hi', 'bad.txt', fields=('username',), environment=env)
+        
+        print("✓ Templates: Фильтры над полями получателя обнаруживаются при компиляции")
+    
+    @patch('smtplib.SMTP')
+    def test_send_templated_bulk(self, mock_smtp):
+        """Тест массовой отправки писем по шаблону"""
+        service = NotificationService({
+            'MAIL_SERVER': 'smtp.example.com',
+            'MAIL_PORT': 587,
+            'MAIL_USERNAME': 'shop@example.com',
+            'MAIL_PASSWORD': 'password'
+        })
+        
+        result = service.send_templated_bulk('order_confirmation', [
+            {'to_email': f'user{i}@example.com', 'username': f'user{i}', 'order_id': i}
+            for i in range(10)
+        ])
+        service.close()
+        
+        assert result['sent'] == 10
+        sent = [call.args[0] for call in mock_smtp.return_value.send_message.call_args_list]
+        assert sorted(message['Subject'] for message in sent) == sorted(f'Order Confirmation #{i}' for i in range(10))
+        
+        print("✓ Templates: Письма по шаблону отправляются пачкой")
+
+class TestBulkOrders:
+    """Тесты пакетного создания заказов"""
+    
+    def setup_method(self):
+        """Настройка тестовых данных"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        
+        with app.app_context():
+            db.create_all()
+            
+            user = User(
+                username='bulkuser',
+                email='bulk@example.com',
+                password_hash='hash'
+            )
+            db.session.add(user)
+            
+            product1 = Product(name='Bulk Product 1', price=10.0, category='Test', stock=5)
+            product2 = Product(name='Bulk Product 2', price=20.0, category='Test', stock=100)
+            db.session.add_all([product1, product2])
+            db.session.commit()
+            
+            self.user_id = user.id
+            self.product1_id = product1.id
+            self.product2_id = product2.id
+    
+    def teardown_method(self):
+        """Очистка тестовых данных"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def test_create_order_single_transaction(self):
+        """Тест атомарного создания заказа с резервированием"""
+        with app.app_context():
+            service = OrderService()
+            
+            with pytest.raises(ValueError):
+                service.create_order(
+                    user_id=self.user_id,
+                    items_data=[
+                        {'product_id': self.product2_id, 'quantity': 1},
+                        {'product_id': self.product1_id, 'quantity': 6}
+                    ]
+                )
+            
+            # Ни заказа, ни списания
+            assert Order.query.count() == 0
+            assert Product.get_by_id(self.product2_id).stock == 100
+            
+            order = service.create_order(
+                user_id=self.user_id,
+                items_data=[{'product_id': self.product1_id, 'quantity': 2}]
+            )
+            
+            assert order.total_amount == 20.0
+            assert len(order.items) == 1
+            assert Product.get_by_id(self.product1_id).stock == 3
+            
+            print("✓ Service: create_order резервирует товар в одной транзакции")
+    
+    def test_create_orders_bulk(self):
+        """Тест пакетного создания заказов"""
+        with app.app_context():
+            service = OrderService()
+            
+            orders_data = [
+                {
+                    'user_id': self.user_id,
+                    'items': [
+                        {'product_id': self.product1_id, 'quantity': 2},
+                        {'product_id': self.product2_id, 'quantity': 1}
+                    ]
+                }
+                for _ in range(3)
+            ]
+            orders_data.append({
+                'user_id': self.user_id,
+                'items': [{'product_id': 999, 'quantity': 1}]
+            })
+            
+            result = service.create_orders_bulk(orders_data, batch_size=2)
+            
+            # Третьему заказу не хватает товара 1, четвертый ссылается на несуществующий товар
+            assert len(result['created']) == 2
+            assert [f['index'] for f in result['failed']] == [2, 3]
+            
+            assert Order.query.count() == 2
+            assert sum(len(order.items) for order in Order.query.all()) == 4
+            assert Product.get_by_id(self.product1_id).stock == 1
+            assert Product.get_by_id(self.product2_id).stock == 98
+            
+            print("✓ Service: create_orders_bulk создает заказы пакетами")
+    
+    def test_create_orders_bulk_reports_bad_rows(self):
+        """Тест: ошибочные строки и конкурентное списание не срывают импорт"""
+        with app.app_context():
+            service = OrderService()
+            service.notifier.order_created = Mock()
+            
+            orders_data = [
+                {'user_id': self.user_id, 'items': [{'product_id': self.product1_id, 'quantity': 3}]},
+                {'items': [{'product_id': self.product2_id, 'quantity': 1}]},
+                {'user_id': self.user_id, 'items': [{'product_id': self.product2_id, 'quantity': 0}]},
+                {'user_id': self.user_id, 'items': [{'product_id': self.product2_id, 'quantity': 2}]}
+            ]
+            
+            # Остаток товара 1 уменьшается после того, как импорт его прочитал
+            original_get_by_ids = Product.get_by_ids
+            
+            def get_by_ids_then_sell(ids):
+                products = original_get_by_ids(ids)
+                db.session.execute(
+                    Product.__table__.update().where(Product.id == self.product1_id).values(stock=1)
+                )
+                db.session.commit()
+                return products
+            
+            with patch.object(Product, 'get_by_ids', side_effect=get_by_ids_then_sell):
+                result = service.create_orders_bulk(orders_data)
+            
+            # Пакет не прошел целиком, но выполнимый заказ создан отдельно
+            assert [failure['index'] for failure in result['failed']] == [0, 1, 2]
+            assert 'user_id' in result['failed'][1]['error']
+            assert len(result['created']) == 1
+            assert Order.query.count() == 1
+            assert Product.get_by_id(self.product2_id).stock == 98
+            assert service.notifier.order_created.call_count == 1
+            
+            print("✓ Service: create_orders_bulk сообщает об ошибках по строкам")
+
+    def test_create_orders_bulk_fallback_restores_stock(self):
+        """Тест: после отката пакета следующие пакеты проверяются по реальному остатку"""
+        with app.app_context():
+            service = OrderService()
+            service.notifier.order_created = Mock()
+
+            orders_data = [
+                {'user_id': self.user_id, 'items': [{'product_id': self.product1_id, 'quantity': 1}]},
+                {'user_id': self.user_id, 'items': [{'product_id': self.product1_id, 'quantity': 3}]},
+                {'user_id': self.user_id, 'items': [{'product_id': self.product1_id, 'quantity': 2}]}
+            ]
+
+            # Перед резервированием первого пакета 2 шт. товара 1 продаются конкурентно
+            original_reserve_stock = Product.reserve_stock
+            sold = []
+
+            def sell_then_reserve(items, commit=True):
+                if not sold:
+                    sold.append(True)
+                    db.session.execute(
+                        Product.__table__.update().where(Product.id == self.product1_id)
+                        .values(stock=Product.stock - 2)
+                    )
+                    db.session.commit()
+                return original_reserve_stock(items, commit=commit)
+
+            with patch.object(Product, 'reserve_stock', side_effect=sell_then_reserve):
+                result = service.create_orders_bulk(orders_data, batch_size=2)
+
+            # Первый пакет (4 шт. при остатке 3) создан по одному: прошел заказ на 1 шт.;
+            # отклоненные 3 шт. не уменьшают остаток для второго пакета
+            assert [failure['index'] for failure in result['failed']] == [1]
+            assert len(result['created']) == 2
+            assert Product.get_by_id(self.product1_id).stock == 0
+
+            print("✓ Service: Откат пакета не занижает остаток для следующих пакетов")
+    
+    def test_create_shipments_and_refresh_tracking(self):
+        """Тест отправки волны заказов и обновления статусов отслеживания"""
+        with app.app_context():
+            service = OrderService()
+            service.notifier.order_shipped = Mock()
+            
+            orders = [
+                service.create_order(
+                    user_id=self.user_id,
+                    items_data=[{'product_id': self.product2_id, 'quantity': 1}],
+                    shipping_address='Moscow'
+                )
+                for _ in range(4)
+            ]
+            ids = [order.id for order in orders]
+            Order.get_by_id(ids[3]).update_status('cancelled')
+            
+            result = service.create_shipments(ids[:2], ShippingAdapter(FedExService()))
+            assert [r['tracking_number'] for r in result['shipped']] == [f"FX{i}" for i in ids[:2]]
+            result = service.create_shipments(ids, ShippingAdapter(UPSService()))
+            
+            # Отправленные и отмененные заказы повторно не отправляются
+            assert [r['order_id'] for r in result['shipped']] == [ids[2]]
+            assert service.notifier.order_shipped.call_count == 3
+            assert Order.get_by_id(ids[2]).status == 'shipped'
+            assert Order.get_by_id(ids[2]).tracking_number == f"UPS{ids[2]}"
+            
+            adapters = {'FX': ShippingAdapter(FedExService()), 'UPS': ShippingAdapter(UPSService())}
+            refresh = service.refresh_tracking(adapters, batch_size=2)
+            
+            # UPS сообщает о доставке, FedEx - в пути
+            assert refresh['checked'] == 3
+            assert refresh['updated'] == 1
+            assert Order.get_by_id(ids[2]).status == 'delivered'
+            assert Order.get_by_id(ids[0]).status == 'shipped'
+            
+            # Доставленный заказ больше не опрашивается
+            assert service.refresh_tracking(adapters)['checked'] == 2
+            
+            print("✓ Service: Пакетная отправка заказов и обновление отслеживания")
+    
+    def test_create_shipments_claims_orders(self):
+        """Тест: пересекающиеся волны не создают повторных отправлений"""
+        with app.app_context():
+            service = OrderService()
+            service.notifier.order_shipped = Mock()
+            ids = [
+                service.create_order(
+                    user_id=self.user_id,
+                    items_data=[{'product_id': self.product2_id, 'quantity': 1}],
+                    shipping_address='Moscow'
+                ).id
+                for _ in range(3)
+            ]
+            shipped_by_carrier = []
+            overlapping = []
+            
+            class OverlappingFedEx(FedExService):
+                def create_shipments(self, shipments):
+                    shipped_by_carrier.extend(shipment['order_reference'] for shipment in shipments)
+                    # Вторая волна запускается, пока первая ждет службу
+                    overlapping.append(service.create_shipments(ids[:2], ShippingAdapter(FedExService())))
+                    return super().create_shipments(shipments)
+            
+            class FailingUPS(UPSService):
+                def ship(self, order_id, address, products):
+                    if order_id == ids[2]:
+                        raise ConnectionError('carrier unavailable')
+                    return super().ship(order_id, address, products)
+            
+            result = service.create_shipments(ids[:2], ShippingAdapter(OverlappingFedEx()))
+            assert overlapping == [{'shipped': [], 'failed': []}]
+            assert shipped_by_carrier == ids[:2]
+            assert [r['order_id'] for r in result['shipped']] == ids[:2]
+            
+            result = service.create_shipments(ids, ShippingAdapter(FailingUPS()))
+            assert result['shipped'] == []
+            assert [f['order_id'] for f in result['failed']] == [ids[2]]
+            # Заказ с ошибкой возвращается в прежний статус и может быть отправлен снова
+            assert Order.get_by_id(ids[2]).status == 'pending'
+            assert Order.get_by_id(ids[2]).tracking_number is None
+            
+            # Заказ, оставшийся в 'shipping' после сбоя, повторяется только явно
+            Order.query.filter_by(id=ids[2]).update({'status': 'shipping'})
+            db.session.commit()
+            assert service.create_shipments(ids, ShippingAdapter(FedExService()))['shipped'] == []
+            retried = service.create_shipments(ids, ShippingAdapter(FedExService()), retry_claimed=True)
+            assert retried['shipped'] == [{'order_id': ids[2], 'tracking_number': f"FX{ids[2]}"}]
+            
+            print("✓ Service: Заказы захватываются до создания отправлений")
+
+    def test_create_shipments_short_batch_response(self):
+        """Тест: заказ, пропущенный в ответе пакетного API, не остается в 'shipping'"""
+        with app.app_context():
+            service = OrderService()
+            service.notifier.order_shipped = Mock()
+            ids = [
+                service.create_order(
+                    user_id=self.user_id,
+                    items_data=[{'product_id': self.product2_id, 'quantity': 1}],
+                    shipping_address='Moscow'
+                ).id
+                for _ in range(3)
+            ]
+
+            class ShortFedEx(FedExService):
+                def create_shipments(self, shipments):
+                    return super().create_shipments(shipments)[:-1]
+
+            class LongFedEx(FedExService):
+                def create_shipments(self, shipments):
+                    results = super().create_shipments(shipments)
+                    return results + results[:1]
+
+            result = service.create_shipments(ids, ShippingAdapter(ShortFedEx()))
+            assert [r['order_id'] for r in result['shipped']] == ids[:2]
+            assert [f['order_id'] for f in result['failed']] == [ids[2]]
+            assert Order.get_by_id(ids[2]).status == 'pending'
+
+            # Лишние ответы: соответствие позиций не определено - ошибка всей пачки
+            result = service.create_shipments(ids, ShippingAdapter(LongFedEx()))
+            assert result['shipped'] == []
+            assert [f['order_id'] for f in result['failed']] == [ids[2]]
+            assert Order.get_by_id(ids[2]).status == 'pending'
+
+            # Пропуск в ответе без ошибки от адаптера тоже освобождает захват
+            adapter = ShippingAdapter(FedExService())
+            adapter.create_shipments = lambda shipments, concurrency=8: []
+            result = service.create_shipments(ids, adapter)
+            assert result['failed'] == [{'order_id': ids[2], 'error': 'No result from shipping service'}]
+            assert Order.get_by_id(ids[2]).status == 'pending'
+
+            print("✓ Service: Неполный ответ пакетного API не теряет заказы")
+
+class TestProductSearchIndex:
+    """Тесты инвертированного индекса товаров"""
+    
+    def setup_method(self):
+        """Настройка тестовых данных"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        
+        with app.app_context():
+            db.create_all()
+            product_search_index.clear()
+            
+            products = [
+                Product(name='Смартфон Galaxy', price=500.0, category='Электроника',
+                        description='Ёмкий аккумулятор', sku='SM-G100'),
+                Product(name='Чехол для смартфона', price=10.0, category='Аксессуары',
+                        description='Подходит для Galaxy'),
+                Product(name='Ноутбук', price=900.0, category='Электроника',
+                        description='Легкий и быстрый')
+            ]
+            db.session.add_all(products)
+            db.session.commit()
+            self.ids = [p.id for p in products]
+    
+    def teardown_method(self):
+        """Очистка тестовых данных"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            product_search_index.clear()
+    
+    def test_tokenize_case_folding(self):
+        """Тест нормализации регистра кириллицы и латиницы"""
+        assert tokenize('СмартФОН Galaxy-S') == ['смартфон', 'galaxy', 's']
+        assert tokenize('ЁЖИК') == ['ежик']
+        
+        print("✓ Search: Токенизация нормализует регистр")
+    
+    def test_search_ranking(self):
+        """Тест ранжирования по релевантности"""
+        index = ProductSearchIndex(autoload=False)
+        index.add(1, name='Galaxy', description='')
+        index.add(2, name='Чехол', description='для Galaxy')
+        index.add(3, name='Ноутбук', description='')
+        
+        ranked = index.search('galaxy')
+        assert [product_id for product_id, _ in ranked] == [1, 2]
+        
+        # Поиск по префиксу и по всем словам запроса
+        assert [pid for pid, _ in index.search('чех gal')] == [2]
+        assert index.search('galaxy ноутбук') == []
+        
+        print("✓ Search: Результаты ранжируются по релевантности")
+    
+    def test_search_products_through_index(self):
+        """Тест поиска через ProductService и Product.search"""
+        with app.app_context():
+            service = ProductService()
+            
+            results = service.search_products('GALAXY')
+            assert [p.id for p in results] == [self.ids[0], self.ids[1]]
+            
+            results = service.search_products('galaxy', category='Аксессуары')
+            assert [p.id for p in results] == [self.ids[1]]
+            
+            # Поиск по артикулу целиком и с учетом ё/е
+            assert [p.id for p in Product.search('sm-g100')] == [self.ids[0]]
+            assert [p.id for p in Product.search('емкий')] == [self.ids[0]]
+            
+            print("✓ Search: ProductService ищет через инвертированный индекс")
+    
+    def test_index_sync_on_changes(self):
+        """Тест синхронизации индекса при создании, изменении и удалении"""
+        with app.app_context():
+            product_search_index.ensure_built()
+            
+            product = Product(name='Планшет', price=300.0, category='Электроника')
+            product.save()
+            assert [p.id for p in Product.search('планшет')] == [product.id]
+            
+            product.update(name='Электронная книга')
+            db.session.commit()
+            assert Product.search('планшет') == []
+            assert [p.id for p in Product.search('книга')] == [product.id]
+            
+            product.delete()
+            assert Product.search('книга') == []
+            
+            print("✓ Search: Индекс синхронизируется с изменениями товаров")
+    
+    def test_index_ignores_rolled_back_changes(self):
+        """Тест: индекс меняется только после commit"""
+        with app.app_context():
+            product_search_index.ensure_built()
+            
+            product = Product.get_by_id(self.ids[2])
+            db.session.delete(product)
+            db.session.flush()
+            db.session.rollback()
+            assert [p.id for p in Product.search('ноутбук')] == [self.ids[2]]
+            
+            db.session.add(Product(name='Планшет', price=300.0, category='Электроника'))
+            db.session.flush()
+            assert Product.search('планшет') == []
+            db.session.rollback()
+            assert Product.search('планшет') == []
+            
+            # Откат точки сохранения не отменяет изменения внешней транзакции
+            db.session.add(Product(name='Монитор', price=200.0, category='Электроника'))
+            savepoint = db.session.begin_nested()
+            db.session.add(Product(name='Принтер', price=150.0, category='Электроника'))
+            db.session.flush()
+            savepoint.rollback()
+            db.session.commit()
+            assert len(Product.search('монитор')) == 1
+            assert Product.search('принтер') == []
+            
+            print("✓ Search: Откаченные изменения не попадают в индекс")
+    
+    def test_prefix_search_is_not_truncated(self):
+        """Тест: короткий префикс находит все подходящие товары"""
+        index = ProductSearchIndex(autoload=False)
+        for i in range(200):
+            index.add(i, name=f'model{i:03d}')
+        
+        assert len(index.search('mo')) == 200
+        
+        print("✓ Search: Поиск по префиксу не теряет товары")
+
+class TestFacadeSearch:
+    """Тесты поиска с сортировкой и пагинацией в базе"""
+    
+    def setup_method(self):
+        """Настройка тестовых данных"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        
+        with app.app_context():
+            db.create_all()
+            product_search_index.clear()
+            
+            # Цены повторяются, чтобы проверить порядок при равных значениях
+            db.session.add_all([
+                Product(name=f'Phone {i:02d}', price=float(100 + (i % 5) * 10),
+                        category='Electronics' if i % 2 else 'Other', stock=5)
+                for i in range(25)
+            ])
+            db.session.commit()
+    
+    def teardown_method(self):
+        """Очистка тестовых данных"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            product_search_index.clear()
+    
+    def test_sql_sorting_and_pagination(self):
+        """Тест сортировки и пагинации средствами SQL"""
+        with app.app_context():
+            facade = ECommerceFacade()
+            
+            result = facade.search_products_advanced({
+                'keyword': 'phone',
+                'category': 'Electronics',
+                'min_price': 110,
+                'sort_by': 'price_desc',
+                'page': 2,
+                'per_page': 3
+            })
+            
+            expected = sorted(
+                (p for p in Product.query.all() if p.category == 'Electronics' and p.price >= 110),
+                key=lambda p: (-p.price, -p.id)
+            )
+            
+            assert result['success'] == True
+            assert result['data']['pagination']['total'] == len(expected)
+            assert [p['id'] for p in result['data']['products']] == [p.id for p in expected[3:6]]
+            
+            print("✓ Facade: Сортировка и пагинация выполняются в базе")
+    
+    def test_keyset_pagination(self):
+        """Тест keyset-пагинации по курсору"""
+        with app.app_context():
+            service = ProductService()
+            
+            offset_ids = []
+            for page in range(1, 4):
+                result = service.search_products_page(sort_by='price_asc', page=page, per_page=10)
+                offset_ids.extend(p.id for p in result['items'])
+            
+            keyset_ids = []
+            cursor = None
+            while True:
+                result = service.search_products_page(sort_by='price_asc', per_page=10, cursor=cursor)
+                keyset_ids.extend(p.id for p in result['items'])
+                cursor = result['next_cursor']
+                if not cursor:
+                    break
+            
+            assert len(keyset_ids) == 25
+            assert keyset_ids == offset_ids
+            
+            with pytest.raises(ValueError):
+                service.search_products_page(cursor='not-a-cursor')
+            
+            print("✓ Facade: Keyset-пагинация совпадает с OFFSET-пагинацией")
+    
+    def test_relevance_pages_read_only_the_page(self):
+        """Тест: страницы по релевантности не подставляют в SQL все найденные ID"""
+        with app.app_context():
+            service = ProductService()
+            facade = ECommerceFacade()
+            
+            expected = [
+                p.id for p in service.search_products('phone', category='Electronics')
+            ]
+            statements = []
+            
+            def record(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                pages = []
+                cursor = None
+                while True:
+                    result = service.search_products_page('phone', category='Electronics',
+                                                          sort_by='relevance', per_page=5, cursor=cursor)
+                    assert result['total_items'] == len(expected)
+                    pages.append([p.id for p in result['items']])
+                    cursor = result['next_cursor']
+                    if not cursor:
+                        break
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            
+            assert [pid for page in pages for pid in page] == expected
+            assert [len(page) for page in pages] == [5, 5, 2]
+            # Найденные ID не подставляются в SQL литералами, COUNT - один на страницу
+            assert not any(re.search(r'IN \(\d+(, \d+){5,}', statement) for statement in statements)
+            assert sum('count(' in statement.lower() for statement in statements) == len(pages)
+            
+            statements.clear()
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                by_price = service.search_products_page('phone', category='Electronics',
+                                                        sort_by='price_asc', per_page=20)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            assert sorted(p.id for p in by_price['items']) == sorted(expected)
+            assert [p.price for p in by_price['items']] == sorted(p.price for p in by_price['items'])
+            assert not any(re.search(r'IN \(\d+(, \d+){5,}', statement) for statement in statements)
+            assert sum('count(' in statement.lower() for statement in statements) == 1
+            
+            page_two = service.search_products_page('phone', category='Electronics', sort_by='relevance',
+                                                    page=2, per_page=5)
+            assert [p.id for p in page_two['items']] == pages[1]
+            
+            result = facade.search_products_advanced({'keyword': 'phone', 'sort_by': 'relevance',
+                                                      'cursor': 'not-a-cursor'})
+            assert result['success'] == False
+            
+            print("✓ Facade: Релевантные страницы читаются с позиции курсора")
+
+    def test_api_products_contract(self):
+        """Тест: без параметров пагинации /api/products отдает весь список"""
+        from flask import Flask
+        from src.api.routes import init_routes
+        
+        api_app = Flask(__name__)
+        api_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(api_app)
+        init_routes(api_app)
+        with api_app.app_context():
+            db.create_all()
+            db.session.add_all([Product(name=f'Item {i}', price=10.0, category='Other', stock=1) for i in range(25)])
+            db.session.commit()
+        client = api_app.test_client()
+
+        response = client.get('/api/products')
+        assert response.status_code == 200
+        assert len(response.get_json()) == 25
+        assert response.headers['X-Has-Next'] == 'false'
+        assert 'X-Next-Cursor' not in response.headers
+
+        response = client.get('/api/products?per_page=10')
+        assert len(response.get_json()) == 10
+        assert response.headers['X-Has-Next'] == 'true'
+
+        ids = [p['id'] for p in response.get_json()]
+        cursor = response.headers['X-Next-Cursor']
+        while cursor:
+            response = client.get(f'/api/products?per_page=10&cursor={cursor}')
+            ids.extend(p['id'] for p in response.get_json())
+            cursor = response.headers.get('X-Next-Cursor')
+        assert response.headers['X-Has-Next'] == 'false'
+        assert len(ids) == len(set(ids)) == 25
+
+        print("✓ API: Список товаров без параметров пагинации не изменился")
+
+class TestEntityCache:
+    """Тесты кэша сущностей фасада"""
+    
+    def setup_method(self):
+        """Настройка тестовых данных"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        
+        with app.app_context():
+            db.create_all()
+            product = Product(name='Cached Product', price=100.0, category='Test', stock=10)
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+    
+    def teardown_method(self):
+        """Очистка тестовых данных"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def test_lru_eviction_and_ttl(self):
+        """Тест вытеснения по LRU, TTL и лимиту памяти"""
+        now = [0.0]
+        cache = LRUCache(max_entries=2, ttl=10, clock=lambda: now[0])
+        
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1
+        cache['c'] = 3
+        
+        # Вытеснен 'b' - к нему обращались давнее всего
+        assert 'b' not in cache
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        
+        now[0] = 11
+        assert cache.get('a') is None
+        
+        limited = LRUCache(max_entries=100, ttl=None, max_memory=2000)
+        for i in range(50):
+            limited[i] = 'x' * 100
+        assert len(limited) < 50
+        assert limited.stats()['memory'] <= 2000
+        
+        stats = cache.stats()
+        assert stats['evictions'] == 1
+        assert stats['expirations'] == 1
+        assert stats['hits'] == 3
+        
+        print("✓ Cache: LRU, TTL и лимит памяти работают корректно")
+    
+    def test_snapshot_is_detached(self):
+        """Тест хранения отвязанных от сессии снимков"""
+        with app.app_context():
+            facade = ECommerceFacade()
+            product = facade._get_product(self.product_id)
+            
+            assert isinstance(product, EntitySnapshot)
+            db.session.remove()
+            
+            # Снимок доступен и после закрытия сессии
+            assert product.name == 'Cached Product'
+            assert facade._get_product(self.product_id) is product
+            assert facade.get_cache_stats()['hits'] == 1
+            
+            print("✓ Cache: Снимки не зависят от сессии")
+    
+    def test_invalidation_on_changes(self):
+        """Тест инвалидации при сохранении и изменении остатков"""
+        with app.app_context():
+            facade = ECommerceFacade()
+            assert facade._get_product(self.product_id).stock == 10
+            
+            Product.reserve_stock({self.product_id: 3})
+            assert facade._get_product(self.product_id).stock == 7
+            
+            product = Product.get_by_id(self.product_id)
+            product.price = 150.0
+            product.save()
+            assert facade._get_product(self.product_id).price == 150.0
+            
+            product.delete()
+            assert facade._get_product(self.product_id) is None
+            
+            print("✓ Cache: Снимки сбрасываются при изменении товара")
+
+    def test_invalidation_after_commit(self):
+        """Тест: снимок сбрасывается после commit, откат его не затрагивает"""
+        with app.app_context():
+            facade = ECommerceFacade()
+            assert facade._get_product(self.product_id).price == 100.0
+
+            # Незафиксированные данные не попадают в кэш
+            product = Product.get_by_id(self.product_id)
+            product.price = 150.0
+            db.session.flush()
+            assert facade._get_product(self.product_id).price == 100.0
+            db.session.rollback()
+            assert facade._get_product(self.product_id).price == 100.0
+
+            Product.reserve_stock({self.product_id: 3}, commit=False)
+            db.session.rollback()
+            assert facade._get_product(self.product_id).stock == 10
+
+            product = Product.get_by_id(self.product_id)
+            product.price = 150.0
+            db.session.commit()
+            assert facade._get_product(self.product_id).price == 150.0
+
+            print("✓ Cache: Снимки сбрасываются только после commit")
+
+class TestResilience:
+    """Тесты Circuit Breaker, повторов и Bulkhead"""
+    
+    def teardown_method(self):
+        """Сброс реестра Circuit Breaker'ов"""
+        CircuitBreakerRegistry.reset()
+    
+    def test_circuit_breaker_states(self):
+        """Тест переходов closed -> open -> half_open -> closed"""
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_rate=0.5, window_size=4, min_calls=4,
+                                 recovery_timeout=10, clock=lambda: now[0])
+        
+        def fail():
+            raise ConnectionError('down')
+        
+        # О смене состояния сообщается после освобождения блокировки
+        announced = []
+        with patch('builtins.print', side_effect=lambda message: announced.append((message, breaker._lock.locked()))):
+            for result in (True, False, True, False):
+                breaker.record_success() if result else breaker.record_failure()
+        assert announced == [("Circuit 'test' -> open", False)]
+        assert breaker.state == CircuitBreaker.OPEN
+        
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: 'ok')
+        
+        # После recovery_timeout пропускается один пробный вызов
+        now[0] = 10
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+        assert breaker.state == CircuitBreaker.OPEN
+        
+        now[0] = 20
+        assert breaker.call(lambda: 'ok') == 'ok'
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.stats()['rejected'] == 1
+        
+        print("✓ Resilience: Circuit Breaker переключает состояния корректно")
+    
+    def test_retry_policy_backoff_and_budget(self):
+        """Тест экспоненциальной задержки и бюджета повторов"""
+        delays = []
+        attempts = []
+        
+        def flaky():
+            attempts.append(1)
+            raise TimeoutError('slow')
+        
+        policy = RetryPolicy(max_attempts=4, base_delay=0.1, max_delay=0.3, jitter=False,
+                             retry_on=(TimeoutError,), sleep=delays.append)
+        with pytest.raises(TimeoutError):
+            policy.call(flaky)
+        assert delays == [0.1, 0.2, 0.3]
+        
+        # Бюджет на один повтор: второй вызов не повторяется
+        attempts.clear()
+        budget = RetryBudget(ratio=0, min_retries=1)
+        policy = RetryPolicy(max_attempts=3, base_delay=0, retry_on=(TimeoutError,),
+                             budget=budget, sleep=lambda delay: None)
+        with pytest.raises(TimeoutError):
+            policy.call(flaky)
+        with pytest.raises(TimeoutError):
+            policy.call(flaky)
+        assert len(attempts) == 3
+        assert budget.stats()['exhausted'] == 2
+        
+        # Не указанные исключения не повторяются
+        attempts.clear()
+        with pytest.raises(ValueError):
+            RetryPolicy(retry_on=(TimeoutError,)).call(lambda: attempts.append(1) or int('x'))
+        assert len(attempts) == 1
+        
+        # Повтор, задержка которого выходит за дедлайн, не начинается
+        attempts.clear()
+        delays.clear()
+        policy = RetryPolicy(max_attempts=4, base_delay=0.1, jitter=False,
+                             retry_on=(TimeoutError,), sleep=delays.append)
+        with pytest.raises(TimeoutError):
+            policy.call(flaky, deadline=time.monotonic() + 0.05)
+        assert len(attempts) == 1
+        assert delays == []
+        with pytest.raises(DeadlineExceededError):
+            policy.call(flaky, deadline=time.monotonic())
+        assert len(attempts) == 1
+        
+        print("✓ Resilience: Повторы с экспоненциальной задержкой и бюджетом")
+    
+    def test_retry_decorator_exponential(self):
+        """Тест экспоненциальной задержки в retry_decorator"""
+        calls = []
+        
+        @retry_decorator(max_retries=3, delay=0.1, exceptions=(KeyError,), jitter=False)
+        def lookup():
+            calls.append(1)
+            raise KeyError('missing')
+        
+        with patch('src.utils.decorators.time.sleep') as mock_sleep:
+            with pytest.raises(KeyError):
+                lookup()
+            assert [c.args[0] for c in mock_sleep.call_args_list] == [0.1, 0.2]
+        assert len(calls) == 3
+        
+        # Без повторов функция все равно вызывается один раз
+        @retry_decorator(max_retries=0)
+        def once():
+            calls.append(1)
+            return 'ok'
+        
+        assert once() == 'ok'
+        assert len(calls) == 4
+        
+        print("✓ Resilience: retry_decorator использует экспоненциальную задержку")
+    
+    def test_bulkhead_limits_concurrency(self):
+        """Тест ограничения одновременных вызовов"""
+        bulkhead = Bulkhead('test', max_concurrent=1)
+        
+        with bulkhead:
+            with pytest.raises(BulkheadFullError):
+                with bulkhead:
+                    pass
+        
+        with bulkhead:
+            pass
+        assert bulkhead.stats() == {'active': 0, 'max_concurrent': 1, 'rejected': 1}
+        
+        print("✓ Resilience: Bulkhead ограничивает параллельные вызовы")
+    
+    def test_gateway_opens_circuit_and_reports_health(self):
+        """Тест размыкания цепи недоступного сервиса и отчета в /health"""
+        from flask import Flask
+        from src.api.routes import init_routes
+        
+        # Порт 9 (discard) закрыт - соединение сразу отклоняется
+        gateway = APIGateway({
+            'PRODUCT_SERVICE_URL': 'http://127.0.0.1:9',
+            'ORDER_SERVICE_URL': 'http://127.0.0.1:9',
+            'PAYMENT_SERVICE_URL': 'http://127.0.0.1:9',
+            'GATEWAY_BREAKER_MIN_CALLS': 3,
+            'GATEWAY_RETRY_ATTEMPTS': 1
+        })
+        
+        for _ in range(3):
+            body, status = gateway.route_request('products', '/items')
+            assert status == 503
+        
+        body, status = gateway.route_request('products', '/items')
+        assert status == 503
+        assert 'is open' in body['error']
+        assert gateway.get_resilience_stats()['upstreams']['products']['circuit']['rejected'] == 1
+        gateway.close()
+        
+        health_app = Flask(__name__)
+        init_routes(health_app)
+        health = health_app.test_client().get('/health').get_json()
+        assert health['status'] == 'degraded'
+        assert health['circuit_breakers']['products']['state'] == 'open'
+        
+        print("✓ Resilience: Недоступный сервис отключается, состояние видно в /health")
+
+def consume_shared_bucket(path, attempts, results):
+    """Процесс-воркер: попытки списания из общей корзины в файле SQLite"""
+    store = SQLiteRateLimitStore(path)
+    results.put(sum(store.consume('shared', 30, 0.001).allowed for _ in range(attempts)))
+
+class TestRateLimiter:
+    """Тесты ограничения скорости запросов (token bucket)"""
+    
+    def test_token_bucket_refill_and_retry_after(self):
+        """Тест пополнения корзины и расчета Retry-After"""
+        now = [0.0]
+        store = MemoryRateLimitStore(clock=lambda: now[0])
+        
+        results = [store.consume('key', 3, 0.5) for _ in range(4)]
+        assert [r.allowed for r in results] == [True, True, True, False]
+        # Один токен копится 2 секунды
+        assert results[-1].retry_after == 2
+        
+        now[0] = 1.0
+        assert store.consume('key', 3, 0.5).allowed == False
+        now[0] = 2.0
+        assert store.consume('key', 3, 0.5).allowed == True
+        
+        print("✓ RateLimit: Корзина пополняется, Retry-After точный")
+    
+    def test_bounded_table_and_idle_eviction(self):
+        """Тест ограничения таблицы ключей и удаления простаивающих"""
+        now = [0.0]
+        store = MemoryRateLimitStore(max_keys=100, idle_timeout=60, clock=lambda: now[0])
+        
+        for i in range(500):
+            store.consume(f'ip:{i}', 10, 1)
+        assert len(store) == 100
+        
+        now[0] = 61.0
+        store.consume('ip:new', 10, 1)
+        assert len(store) == 1
+        
+        print("✓ RateLimit: Таблица ключей ограничена, простаивающие ключи удаляются")
+    
+    def test_decorator_keys_per_route_and_user(self):
+        """Тест ключей по маршруту и пользователю, ответа 429"""
+        from flask import Flask
+        
+        limited_app = Flask(__name__)
+        store = MemoryRateLimitStore()
+        
+        @limited_app.route('/a')
+        @rate_limit(2, 60, store=store)
+        def route_a():
+            return {'status': 'ok'}
+        
+        @limited_app.route('/b')
+        @rate_limit(2, 60, store=store)
+        def route_b():
+            return {'status': 'ok'}
+        
+        @limited_app.route('/me')
+        @authenticate
+        @rate_limit(1, 60, key_by='user', store=store)
+        def route_me():
+            return {'status': 'ok'}
+        
+        client = limited_app.test_client()
+        assert [client.get('/a').status_code for _ in range(3)] == [200, 200, 429]
+        # Другой маршрут - отдельный лимит
+        assert client.get('/b').status_code == 200
+        
+        response = client.get('/a')
+        assert response.headers['Retry-After'] == '30'
+        assert response.get_json()['retry_after'] == 30
+        
+        headers = {'Authorization': 'Bearer token'}
+        assert client.get('/me', headers=headers).status_code == 200
+        assert client.get('/me', headers=headers).status_code == 429
+        assert 'route_me:user:1' in store._buckets
+        
+        print("✓ RateLimit: Лимиты раздельные по маршрутам и пользователям")
+    
+    def test_shared_store_across_processes(self):
+        """Тест общего лимита для нескольких процессов"""
+        import multiprocessing
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rate_limit.db')
+            SQLiteRateLimitStore(path)
+            
+            results = multiprocessing.Queue()
+            workers = [multiprocessing.Process(target=consume_shared_bucket, args=(path, 20, results))
+                       for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            
+            allowed = sum(results.get() for _ in workers)
+        
+        # 80 попыток из 4 процессов, в корзине 30 токенов
+        assert allowed == 30
+        
+        print("✓ RateLimit: Лимит общий для нескольких процессов")
 
 class TestPatternDemonstration:
     """Демонстрация работы всех паттернов"""
@@ -693,6 +2180,13 @@ if __name__ == '__main__':
         TestFacadePattern(),
         TestFactoryPattern(),
         TestServiceIntegration(),
+        TestEmailTemplates(),
+        TestBulkOrders(),
+        TestProductSearchIndex(),
+        TestFacadeSearch(),
+        TestEntityCache(),
+        TestResilience(),
+        TestRateLimiter(),
         TestPatternDemonstration()
     ]
     
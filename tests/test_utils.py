@@ -0,0 +1,853 @@
+"""
+Тесты для утилит: мемоизация и хранилища кэша
+"""
+
+import pytest
+import sys
+import os
+import io
+import json
+import time
+import fnmatch
+import hashlib
+import shutil
+import tempfile
+import threading
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils import cache_decorator, timing_decorator, RedisBackend, AsyncRequestLogger, MetricsRegistry, metrics_registry
+from src.utils import Helpers, PasswordHasher, PasswordHasherBusyError, encode_password_hash, check_password
+from src.utils.producers_consumers import SQLiteTaskQueue, TaskEngine, TaskError, QueueFullError
+
+
+class FakeRedis:
+    """Минимальная замена клиента Redis (get/set с px/delete/scan_iter)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, px=None):
+        expires_at = time.monotonic() + px / 1000 if px else None
+        self.data[key] = (value, expires_at)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match='*'):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+class TestCacheDecorator:
+    """Тесты декоратора мемоизации"""
+
+    def test_hashable_keys_and_info(self):
+        """Тест построения ключей и статистики"""
+        calls = []
+
+        @cache_decorator(ttl=60)
+        def total(items, options=None):
+            calls.append(1)
+            return sum(items)
+
+        assert total([1, 2, 3], options={'a': 1, 'b': 2}) == 6
+        assert total([1, 2, 3], options={'b': 2, 'a': 1}) == 6
+        assert total([1, 2]) == 3
+
+        info = total.cache_info()
+        assert len(calls) == 2
+        assert info['hits'] == 1
+        assert info['misses'] == 2
+        assert info['size'] == 2
+
+        total.cache_clear()
+        assert total.cache_info()['size'] == 0
+
+        print("✓ Cache: Ключи строятся из нехешируемых аргументов")
+
+    def test_lru_and_ttl(self):
+        """Тест вытеснения и истечения записей"""
+
+        @cache_decorator(ttl=lambda result: 0.05 if result == 'short' else None, max_entries=2)
+        def lookup(key):
+            return key
+
+        lookup('short')
+        lookup('a')
+        lookup('b')
+        assert lookup.cache_info()['size'] == 2
+
+        lookup('a')
+        lookup('short')
+        time.sleep(0.06)
+        lookup('a')
+        lookup('short')
+
+        # 'a' хранится без ограничения, 'short' истек через 50 мс
+        info = lookup.cache_info()
+        assert info['hits'] == 2
+        assert info['misses'] == 5
+
+        print("✓ Cache: Размер ограничен, TTL задается для каждой записи")
+
+    def test_single_flight(self):
+        """Тест защиты от одновременного пересчета одного ключа"""
+        calls = []
+        barrier = threading.Barrier(10)
+
+        @cache_decorator(ttl=60)
+        def slow(key):
+            calls.append(key)
+            time.sleep(0.1)
+            return key * 2
+
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(slow(21))
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [21]
+        assert results == [42] * 10
+        assert slow.cache_info()['coalesced'] + slow.cache_info()['hits'] == 9
+
+        print("✓ Cache: Значение вычисляется одним потоком")
+
+    def test_errors_are_not_cached(self):
+        """Тест что исключения не попадают в кэш"""
+        attempts = []
+
+        @cache_decorator(ttl=60)
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ValueError('temporary')
+            return 'ok'
+
+        with pytest.raises(ValueError):
+            flaky()
+        assert flaky() == 'ok'
+        assert flaky() == 'ok'
+        assert len(attempts) == 2
+
+        print("✓ Cache: Ошибки не кэшируются")
+
+    def test_redis_backend(self):
+        """Тест хранилища Redis"""
+        client = FakeRedis()
+        calls = []
+
+        @cache_decorator(ttl=60, backend=RedisBackend(client=client, prefix='test:'))
+        def price(product_id):
+            calls.append(product_id)
+            return {'id': product_id, 'price': 10.0}
+
+        assert price(1) == {'id': 1, 'price': 10.0}
+        assert price(1) == {'id': 1, 'price': 10.0}
+        assert len(calls) == 1
+        assert price.cache_info()['size'] == 1
+
+        price.cache_clear()
+        assert client.data == {}
+
+        print("✓ Cache: Хранилище Redis работает корректно")
+
+    def test_redis_backend_outage(self):
+        """Тест: недоступный Redis - промах кэша, а не ошибка вызова"""
+        class DownRedis(FakeRedis):
+            def get(self, key):
+                raise RedisConnectionError('Connection refused')
+
+            def set(self, key, value, px=None):
+                raise RedisConnectionError('Connection refused')
+
+            def delete(self, *keys):
+                raise RedisConnectionError('Connection refused')
+
+            def scan_iter(self, match='*'):
+                raise RedisConnectionError('Connection refused')
+
+        backend = RedisBackend(client=DownRedis(), prefix='test:')
+        calls = []
+
+        @cache_decorator(ttl=60, backend=backend)
+        def price(product_id):
+            calls.append(product_id)
+            return {'id': product_id, 'price': 10.0}
+
+        errors_before = metrics_registry.get('cache_backend_errors_total').labels(
+            backend='redis', operation='get').value
+        assert price(1) == {'id': 1, 'price': 10.0}
+        assert price(1) == {'id': 1, 'price': 10.0}
+        assert len(calls) == 2
+        assert backend.errors == 6
+        assert metrics_registry.get('cache_backend_errors_total').labels(
+            backend='redis', operation='get').value == errors_before + 4
+
+        # Очистка и статистика тоже не выбрасывают ошибку
+        price.cache_clear()
+        assert price.cache_info()['size'] is None
+        backend.delete(('key',))
+        assert backend.errors == 9
+
+        # Нечитаемая запись (например, класс удален) - промах
+        client = FakeRedis()
+        backend = RedisBackend(client=client, prefix='test:')
+        client.set(backend._redis_key(('stale',)), b'not a pickle')
+        assert backend.get(('stale',), 'miss') == 'miss'
+        assert backend.errors == 1
+
+        print("✓ Cache: Ошибки Redis считаются промахом")
+
+    def test_redis_backend_stable_keys(self):
+        """Тест: ключ Redis не зависит от адресов объектов в памяти процесса"""
+        class Sku:
+            def __init__(self, code):
+                self.code = code
+
+            def __repr__(self):
+                return f"Sku({self.code!r})"
+
+        backend = RedisBackend(client=FakeRedis(), prefix='test:')
+        assert backend._redis_key(('price', Sku('A1'), 2)) == backend._redis_key(('price', Sku('A1'), 2))
+
+        class Service:
+            @cache_decorator(ttl=60, backend=backend)
+            def price(self, product_id):
+                return product_id
+
+        with pytest.raises(TypeError):
+            Service().price(1)
+
+        calls = []
+
+        class KeyedService:
+            @cache_decorator(ttl=60, backend=backend, key_func=lambda service, product_id: ('price', product_id))
+            def price(self, product_id):
+                calls.append(product_id)
+                return product_id
+
+        assert KeyedService().price(1) == 1
+        assert KeyedService().price(1) == 1
+        assert calls == [1]
+
+        print("✓ Cache: Ключи Redis совпадают между процессами")
+
+
+class TestAsyncRequestLogger:
+    """Тесты асинхронного журнала запросов"""
+
+    def test_batched_json_lines(self):
+        """Тест записи пачками в формате JSON lines"""
+        sink = io.StringIO()
+        logger = AsyncRequestLogger(sink=sink, batch_size=10, flush_interval=5)
+
+        for i in range(25):
+            assert logger.log({'endpoint': '/products', 'status_code': 200, 'n': i})
+        assert logger.flush(timeout=2)
+
+        lines = sink.getvalue().splitlines()
+        assert [json.loads(line)['n'] for line in lines] == list(range(25))
+        # Две полные пачки и остаток, записанный по flush()
+        assert logger.stats()['batches'] == 3
+
+        logger.close()
+        print("✓ Logger: Записи пишутся пачками в JSON lines")
+
+    def test_overflow_and_sampling(self):
+        """Тест отбрасывания при переполнении и выборочной записи"""
+        sink = io.StringIO()
+        logger = AsyncRequestLogger(sink=sink, capacity=5, batch_size=100, flush_interval=5,
+                                    sample_rates={'/health': 0.0, '/products/<int:product_id>': 0.0})
+
+        accepted = [logger.log({'endpoint': '/orders', 'n': i}) for i in range(8)]
+        assert accepted == [True] * 5 + [False] * 3
+        assert not logger.log({'endpoint': '/health'})
+        # Выборка по шаблону маршрута: все пути /products/<id> - один ключ
+        assert not logger.log({'route': '/products/<int:product_id>', 'endpoint': '/products/7'})
+        assert not logger.log({'route': '/products/<int:product_id>', 'endpoint': '/products/8'})
+
+        assert logger.flush(timeout=2)
+        stats = logger.stats()
+        assert stats['written'] == 5
+        assert stats['dropped'] == 3
+        assert stats['sampled_out'] == 3
+
+        logger.close()
+        print("✓ Logger: Переполнение и выборка учитываются в счетчиках")
+
+
+class TestMetrics:
+    """Тесты реестра метрик"""
+
+    def test_histogram_prometheus_format(self):
+        """Тест кумулятивных корзин и текстового формата Prometheus"""
+        registry = MetricsRegistry()
+        latency = registry.histogram('route_latency_seconds', 'Route latency', ('route',), buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.5, 0.5, 3.0):
+            latency.observe(value, route='/products/<int:product_id>')
+        # Повторная регистрация возвращает ту же метрику
+        assert registry.histogram('route_latency_seconds', 'Route latency', ('route',)) is latency
+
+        lines = registry.render().splitlines()
+        assert '# TYPE route_latency_seconds histogram' in lines
+        assert 'route_latency_seconds_bucket{route="/products/<int:product_id>",le="0.1"} 1' in lines
+        assert 'route_latency_seconds_bucket{route="/products/<int:product_id>",le="1"} 3' in lines
+        assert 'route_latency_seconds_bucket{route="/products/<int:product_id>",le="+Inf"} 4' in lines
+        assert 'route_latency_seconds_sum{route="/products/<int:product_id>"} 4.05' in lines
+        assert 'route_latency_seconds_count{route="/products/<int:product_id>"} 4' in lines
+
+        with pytest.raises(ValueError):
+            registry.counter('route_latency_seconds', 'Route latency', ('route',))
+
+        print("✓ Metrics: Гистограмма выводится в формате Prometheus")
+
+    def test_concurrent_observations(self):
+        """Тест отсутствия потерянных наблюдений при записи из нескольких потоков"""
+        registry = MetricsRegistry()
+        requests_total = registry.counter('requests_total', 'Requests', ('route',))
+        latency = registry.histogram('latency_seconds', 'Latency', ('route',))
+
+        def worker():
+            for i in range(1000):
+                requests_total.inc(route=f'/r{i % 4}')
+                latency.observe(0.001, route=f'/r{i % 4}')
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(requests_total.labels(f'/r{i}').value for i in range(4)) == 8000
+        assert sum(latency.labels(f'/r{i}').snapshot()[2] for i in range(4)) == 8000
+
+        print("✓ Metrics: Наблюдения из разных потоков не теряются")
+
+    def test_timing_decorator_feeds_registry(self):
+        """Тест записи длительности и ошибок через timing_decorator"""
+        @timing_decorator
+        def work(fail=False):
+            if fail:
+                raise RuntimeError('boom')
+            return 42
+
+        name = f"{work.__module__}.{work.__qualname__}"
+        assert work() == 42
+        with pytest.raises(RuntimeError):
+            work(fail=True)
+
+        assert metrics_registry.get('function_duration_seconds').labels(name).snapshot()[2] == 2
+        assert metrics_registry.get('function_errors_total').labels(name).value == 1
+
+        print("✓ Metrics: timing_decorator пишет длительность в реестр")
+
+
+class TestTaskQueue:
+    """Тесты надежной очереди фоновых задач"""
+
+    def setup_method(self):
+        """Очередь в отдельном файле SQLite"""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tasks.db')
+        self.clock = [1000.0]
+        self.queue = SQLiteTaskQueue(self.path, visibility_timeout=30, max_attempts=3,
+                                     retry_base_delay=1, retry_max_delay=10, clock=lambda: self.clock[0])
+
+    def teardown_method(self):
+        """Удаление файла очереди"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_priority_lanes_and_durability(self):
+        """Тест порядка выдачи по приоритету и сохранности задач после перезапуска"""
+        self.queue.put('generate_report', {'user_id': 1}, priority='low')
+        self.queue.put('send_email', {'to_email': 'a@example.com'})
+        self.queue.put('process_order', {'order_id': 7}, priority='high')
+
+        # Новый экземпляр над тем же файлом - как после перезапуска процесса
+        reopened = SQLiteTaskQueue(self.path, clock=lambda: self.clock[0])
+        assert len(reopened) == 3
+
+        types = [reopened.lease('worker').type for _ in range(3)]
+        assert types == ['process_order', 'send_email', 'generate_report']
+        assert reopened.lease('worker') is None
+
+        print("✓ TaskQueue: Задачи выдаются по приоритету и переживают перезапуск")
+
+    def test_visibility_timeout(self):
+        """Тест повторной выдачи задачи, не подтвержденной потребителем"""
+        self.queue.put('process_order', {'order_id': 1})
+
+        task = self.queue.lease('worker-1')
+        assert self.queue.lease('worker-2') is None
+
+        # Потребитель "завис": по истечении таймаута задачу получает другой
+        self.clock[0] += 31
+        retaken = self.queue.lease('worker-2')
+        assert retaken.id == task.id
+        assert retaken.attempts == 2
+
+        # Опоздавшее подтверждение первого потребителя не удаляет чужую задачу
+        assert not self.queue.complete(task, 'worker-1')
+        assert self.queue.complete(retaken, 'worker-2')
+        assert len(self.queue) == 0
+
+        print("✓ TaskQueue: Неподтвержденная задача выдается повторно")
+
+    def test_retry_backoff_and_dead_letter(self):
+        """Тест повторов с задержкой и переноса в dead_letter_tasks"""
+        self.queue.put('send_email', {'to_email': 'a@example.com'})
+
+        for attempt in range(3):
+            task = self.queue.lease('worker')
+            assert task.attempts == attempt + 1
+            outcome = self.queue.fail(task, 'worker', 'SMTP down')
+            # До истечения задержки задача не выдается
+            self.clock[0] += 11
+
+        assert outcome == 'dead'
+        assert len(self.queue) == 0
+        dead = self.queue.dead_letters()
+        assert dead[0]['type'] == 'send_email'
+        assert dead[0]['attempts'] == 3
+        assert dead[0]['error'] == 'SMTP down'
+
+        assert self.queue.requeue_dead_letter(dead[0]['id'])
+        assert self.queue.lease('worker').attempts == 1
+
+        print("✓ TaskQueue: Повторы с задержкой, затем dead letter")
+
+    def test_expired_leases_reach_dead_letter(self):
+        """Тест: задача, каждый раз роняющая потребителя, не выдается бесконечно"""
+        self.queue.put('poison', {})
+        self.queue.put('send_email', {'to_email': 'a@example.com'}, priority='low')
+
+        # Потребитель падает, не вызвав fail: аренда просто истекает
+        for attempt in range(3):
+            task = self.queue.lease('worker', max_priority='normal')
+            assert task.type == 'poison' and task.attempts == attempt + 1
+            self.clock[0] += 31
+
+        # Попытки исчерпаны: вместо повторной выдачи - dead letter, выдается следующая
+        assert self.queue.lease('worker').type == 'send_email'
+        dead = self.queue.dead_letters()
+        assert [(d['type'], d['attempts']) for d in dead] == [('poison', 3)]
+        assert dead[0]['error'] == 'Lease expired after 3 attempts'
+
+        print("✓ TaskQueue: Задача с истекающей арендой попадает в dead letter")
+
+    def test_engine_dispatches_by_type(self):
+        """Тест пула потребителей с обработчиками по типу задачи"""
+        handled = []
+        lock = threading.Lock()
+
+        class RecordingHandler:
+            def handle(self, payload):
+                with lock:
+                    handled.append(payload['n'])
+
+        class BrokenHandler:
+            def handle(self, payload):
+                raise TaskError('bad payload')
+
+        task_queue = SQLiteTaskQueue(self.path)
+        engine = TaskEngine(task_queue, {'record': RecordingHandler(), 'broken': BrokenHandler()},
+                            workers=3, poll_interval=0.01)
+        for n in range(20):
+            engine.submit('record', {'n': n}, priority='high' if n % 2 else 'normal')
+        engine.submit('broken', {})
+        with pytest.raises(ValueError):
+            engine.submit('unknown', {})
+
+        engine.start()
+        deadline = time.time() + 5
+        while len(task_queue) and time.time() < deadline:
+            time.sleep(0.01)
+        engine.stop()
+
+        assert sorted(handled) == list(range(20))
+        stats = engine.stats()
+        assert stats['processed'] == 20
+        assert stats['dead_letters'] == 1
+
+        print("✓ TaskQueue: Пул потребителей обрабатывает задачи по типам")
+
+    def test_bounded_queue_shed_and_block(self):
+        """Тест ограничения очереди: отклонение (shed) и ожидание места (block)"""
+        bounded = SQLiteTaskQueue(self.path, max_size=2, overflow='shed', put_timeout=1.0, name='bounded')
+        bounded.put('send_email', {'to_email': 'a@example.com'})
+        bounded.put('send_email', {'to_email': 'b@example.com'})
+
+        with pytest.raises(QueueFullError):
+            bounded.put('send_email', {'to_email': 'c@example.com'})
+        assert bounded.shed == 1
+
+        # block: продюсер дожидается, пока потребитель подтвердит задачу
+        task = bounded.lease('worker')
+        threading.Timer(0.1, bounded.complete, (task, 'worker')).start()
+        start_time = time.time()
+        bounded.put('send_email', {'to_email': 'c@example.com'}, overflow='block')
+        assert 0.05 < time.time() - start_time < 1.0
+        assert len(bounded) == 2
+
+        # Место так и не освободилось - ожидание ограничено таймаутом
+        with pytest.raises(QueueFullError):
+            bounded.put('send_email', {'to_email': 'd@example.com'}, overflow='block', timeout=0.05)
+        assert bounded.shed == 2
+
+        print("✓ TaskQueue: Переполнение очереди - отказ или ожидание места")
+
+    def test_depth_counter(self):
+        """Тест счетчика глубины: совпадает с числом задач и не пересчитывается в put"""
+        def count():
+            return self.queue._connection().execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+        for n in range(4):
+            self.queue.put('process_order', {'order_id': n})
+        done = self.queue.lease('worker')
+        assert self.queue.complete(done, 'worker')
+        assert not self.queue.complete(done, 'worker')
+        dead = self.queue.lease('worker')
+        self.queue.fail(dead, 'worker', 'bad payload', retry=False)
+        assert len(self.queue) == count() == 2
+
+        self.queue.requeue_dead_letter(dead.id)
+        assert len(self.queue) == count() == 3
+
+        # Файл от прежней версии без счетчика: глубина берется из tasks
+        self.queue._connection().execute('DROP TABLE task_queue_meta')
+        reopened = SQLiteTaskQueue(self.path, max_size=4, overflow='shed')
+        assert len(reopened) == 3
+
+        statements = []
+        reopened._connection().set_trace_callback(statements.append)
+        reopened.put('process_order', {'order_id': 5})
+        with pytest.raises(QueueFullError):
+            reopened.put('process_order', {'order_id': 6})
+        reopened._connection().set_trace_callback(None)
+        assert not any('COUNT(' in statement for statement in statements)
+        assert len(reopened) == count() == 4
+
+        print("✓ TaskQueue: Глубина очереди ведется счетчиком в той же транзакции")
+
+    def test_gauges(self):
+        """Тест глубины очереди и возраста самой старой готовой задачи"""
+        self.queue.put('process_order', {'order_id': 1})
+        self.clock[0] += 5
+        self.queue.put('process_order', {'order_id': 2})
+        self.queue.put('process_order', {'order_id': 3}, delay=60)
+        self.clock[0] += 2
+
+        gauges = self.queue.gauges()
+        assert gauges['depth'] == 3
+        assert gauges['ready'] == 2
+        assert gauges['oldest_age'] == 7
+
+        # Выданная задача не считается ожидающей
+        self.queue.lease('worker')
+        gauges = self.queue.gauges()
+        assert gauges['ready'] == 1
+        assert gauges['oldest_age'] == 2
+
+        print("✓ TaskQueue: Глубина очереди и возраст старейшей задачи")
+
+    def test_autoscaling(self):
+        """Тест расширения пула под нагрузкой и сокращения при простое"""
+        release = threading.Event()
+
+        class SlowHandler:
+            def handle(self, payload):
+                release.wait(5)
+
+        task_queue = SQLiteTaskQueue(self.path, name='autoscale')
+        engine = TaskEngine(task_queue, {'slow': SlowHandler()}, min_workers=1, max_workers=3,
+                            poll_interval=0.01, scale_interval=60, target_drain_time=0.5)
+        engine.start()
+        try:
+            for n in range(10):
+                engine.submit('slow', {'n': n})
+            time.sleep(0.1)
+
+            # Задачи копятся дольше целевого времени - пул растет до max_workers
+            age = task_queue.gauges()['oldest_age']
+            time.sleep(max(0.0, 0.6 - age))
+            assert engine.autoscale() == 'up'
+            assert engine.autoscale() == 'up'
+            assert engine.autoscale() is None
+            assert engine.stats()['workers'] == 3
+
+            release.set()
+            deadline = time.time() + 5
+            while len(task_queue) and time.time() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+
+            # Уменьшение - только после нескольких проверок простоя подряд
+            results = [engine.autoscale() for _ in range(3)]
+            assert results == [None, None, 'down']
+            assert engine.stats()['workers'] == 2
+
+            stats = engine.stats()
+            assert stats['processed'] == 10
+            assert stats['throughput'] > 0
+            assert stats['scale_events'] == {'up': 2, 'down': 1}
+            assert 'task_workers{queue="autoscale"} 2' in metrics_registry.render()
+        finally:
+            release.set()
+            engine.stop()
+
+        print("✓ TaskQueue: Пул потребителей масштабируется по нагрузке")
+
+    def test_engine_restart(self):
+        """Тест повторного запуска: полосы приоритета снова обрабатывают задачи"""
+        handled = []
+
+        class RecordingHandler:
+            def handle(self, payload):
+                handled.append(payload['n'])
+
+        task_queue = SQLiteTaskQueue(self.path, name='restart')
+        engine = TaskEngine(task_queue, {'record': RecordingHandler()}, workers=0, poll_interval=0.01,
+                            lanes={'high': 1})
+        for cycle in range(2):
+            engine.start()
+            engine.submit('record', {'n': cycle}, priority='high')
+            deadline = time.time() + 5
+            while len(task_queue) and time.time() < deadline:
+                time.sleep(0.01)
+            engine.stop()
+
+        assert handled == [0, 1]
+        assert engine.stats()['processed'] == 2
+
+        print("✓ TaskQueue: Пул потребителей перезапускается с полосами приоритета")
+
+
+
+class TestPagination:
+    """Тесты пагинации списков, итераторов и запросов"""
+
+    def test_list_keeps_shape(self):
+        """Тест прежнего формата ответа для списка"""
+        result = Helpers.paginate(list(range(45)), 2, 20)
+
+        assert result['items'] == list(range(20, 40))
+        assert result['total_items'] == 45
+        assert result['total_pages'] == 3
+        assert result['has_next'] and result['has_prev']
+        assert not Helpers.paginate(list(range(45)), 3, 20)['has_next']
+
+        print("✓ Pagination: Список - срез и прежние поля ответа")
+
+    def test_generator_is_read_lazily(self):
+        """Тест: из генератора читается только текущая страница и один элемент сверх нее"""
+        consumed = []
+
+        def stream():
+            for n in range(1000):
+                consumed.append(n)
+                yield n
+
+        result = Helpers.paginate(stream(), 3, 10)
+        assert result['items'] == list(range(20, 30))
+        assert result['has_next']
+        assert result['total_items'] is None
+        assert len(consumed) == 31
+
+        print("✓ Pagination: Генератор читается до конца страницы")
+
+    def test_iterable_keyset_cursor(self):
+        """Тест обхода отсортированного потока по курсорам"""
+        records = [{'id': n, 'price': n // 3} for n in range(25)]
+        seen = []
+        cursor = None
+        while True:
+            result = Helpers.paginate(iter(records), per_page=10, cursor=cursor,
+                                      keyset=lambda item: (item['price'], item['id']))
+            seen.extend(item['id'] for item in result['items'])
+            cursor = result['next_cursor']
+            if not cursor:
+                break
+
+        assert seen == list(range(25))
+        with pytest.raises(ValueError):
+            Helpers.paginate(records, cursor=cursor or 'abc')
+
+        print("✓ Pagination: Keyset-курсоры для итератора")
+
+    def test_query_limit_offset_and_keyset(self):
+        """Тест запроса SQLAlchemy: в базе выполняются COUNT, LIMIT/OFFSET и keyset"""
+        from sqlalchemy import Column, Float, Integer, create_engine, event
+        from sqlalchemy.orm import Session, declarative_base
+
+        Base = declarative_base()
+
+        class Item(Base):
+            __tablename__ = 'items'
+            id = Column(Integer, primary_key=True)
+            price = Column(Float)
+
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        with Session(engine) as session:
+            session.add_all([Item(id=n, price=float(n % 7)) for n in range(1, 101)])
+            session.commit()
+            query = session.query(Item)
+
+            statements.clear()
+            result = Helpers.paginate(query.order_by(Item.id), 2, 10)
+            assert [item.id for item in result['items']] == list(range(11, 21))
+            assert result['total_items'] == 100
+            assert any('count(' in statement.lower() for statement in statements)
+            assert all('LIMIT' in statement for statement in statements if 'count(' not in statement.lower())
+
+            # Оценка числа записей передается явно - COUNT не выполняется
+            statements.clear()
+            result = Helpers.paginate(query.order_by(Item.id), 1, 10, total_items=1000)
+            assert result['total_pages'] == 100
+            assert not any('count(' in statement.lower() for statement in statements)
+
+            seen = []
+            cursor = None
+            while True:
+                result = Helpers.paginate(query, per_page=15, count=False, cursor=cursor,
+                                          keyset=(Item.price, Item.id), descending=True)
+                seen.extend((item.price, item.id) for item in result['items'])
+                cursor = result['next_cursor']
+                if not cursor:
+                    break
+            assert seen == sorted(((float(n % 7), n) for n in range(1, 101)), reverse=True)
+
+            with pytest.raises(ValueError):
+                Helpers.paginate(query, cursor=Helpers.encode_cursor({'value': 1}), keyset=(Item.price, Item.id))
+
+        print("✓ Pagination: Запрос - COUNT, LIMIT/OFFSET и keyset в базе")
+
+class TestPasswordHasher:
+    """Тесты хеширования паролей в пуле процессов"""
+
+    def setup_method(self):
+        self.hasher = PasswordHasher(workers=1, queue_size=1, timeout=5.0).start()
+
+    def teardown_method(self):
+        self.hasher.close()
+
+    def test_matches_helpers(self):
+        """Тест совместимости с Helpers.hash_password и проверки пароля"""
+        hashed = self.hasher.hash_password('Secret123')
+        assert hashed == Helpers.hash_password('Secret123', hashed['salt'])
+
+        assert self.hasher.verify_password('Secret123', hashed['hash'], hashed['salt'])
+        assert not self.hasher.verify_password('secret123', hashed['hash'], hashed['salt'])
+        assert Helpers.verify_password('Secret123', hashed['hash'], hashed['salt'])
+
+        print("✓ PasswordHasher: Хеш совпадает с Helpers.hash_password")
+
+    def test_queue_limit_and_timeout(self):
+        """Тест отказа при заполненной очереди и таймаута ожидания"""
+        futures = [self.hasher.submit_hash('Secret123') for _ in range(2)]
+        with pytest.raises(PasswordHasherBusyError):
+            self.hasher.submit_hash('Secret123')
+
+        for future in futures:
+            assert len(future.result(5)['hash']) == 64
+        # Место в очереди освобождается после выполнения
+        self.hasher.submit_hash('Secret123').result(5)
+
+        with pytest.raises(TimeoutError):
+            self.hasher.hash_password('Secret123', timeout=0)
+
+        stats = self.hasher.stats()
+        assert stats['rejected'] == 1
+        assert stats['timed_out'] == 1
+
+        print("✓ PasswordHasher: Очередь ограничена, ожидание - по таймауту")
+
+    def test_async_api(self):
+        """Тест корутин: несколько проверок без блокировки цикла событий"""
+        import asyncio
+
+        hashed = Helpers.hash_password('Secret123')
+
+        async def verify_all():
+            return await asyncio.gather(
+                self.hasher.verify_password_async('Secret123', hashed['hash'], hashed['salt']),
+                self.hasher.verify_password_async('wrong', hashed['hash'], hashed['salt'])
+            )
+
+        assert asyncio.run(verify_all()) == [True, False]
+
+        print("✓ PasswordHasher: Асинхронная проверка паролей")
+
+    def test_stored_hash_format(self):
+        """Тест формата хранения: префикс схемы, итерации и старые записи соль$хеш"""
+        hashed = self.hasher.hash_password('Secret123')
+        stored = encode_password_hash(hashed, self.hasher.iterations)
+        assert stored.startswith(f"pbkdf2_sha256${self.hasher.iterations}$")
+
+        assert check_password('Secret123', stored)
+        assert check_password('Secret123', stored, hasher=self.hasher)
+        assert not check_password('wrong', stored, hasher=self.hasher)
+
+        # Записи, созданные UserController до появления префикса
+        legacy = f"{hashed['salt']}${hashed['hash']}"
+        assert check_password('Secret123', legacy)
+        assert not check_password('wrong', legacy)
+
+        # Хеш с другим числом итераций проверяется с ним же
+        fast = encode_password_hash({'salt': 'salt', 'hash': hashlib.pbkdf2_hmac(
+            'sha256', b'Secret123', b'salt', 1000).hex()}, 1000)
+        assert check_password('Secret123', fast, hasher=self.hasher)
+
+        for broken in ('', 'nohash', 'md5$1$salt$hash', 'pbkdf2_sha256$x$salt$hash'):
+            assert not check_password('Secret123', broken)
+
+        print("✓ PasswordHasher: Хеш хранится с версией формата")
+
+if __name__ == '__main__':
+    # Запуск тестов с выводом результатов
+    test_classes = [
+        TestCacheDecorator(),
+        TestAsyncRequestLogger(),
+        TestMetrics(),
+        TestTaskQueue(),
+        TestPagination(),
+        TestPasswordHasher()
+    ]
+
+    for test_class in test_classes:
+        print(f"\nТестирование: {test_class.__class__.__name__}")
+        print("-"*40)
+
+        for method_name in [m for m in dir(test_class) if m.startswith('test_')]:
+            if hasattr(test_class, 'setup_method'):
+                test_class.setup_method()
+            try:
+                getattr(test_class, method_name)()
+                print(f"  ✓ {method_name}")
+            except Exception as e:
+                print(f"  ✗ {method_name}: {str(e)}")
+            finally:
+                if hasattr(test_class, 'teardown_method'):
+                    test_class.teardown_method()